@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+from datetime import timezone
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+import numpy as np
+
+# Benchmarks of the main stages of the craft (maze_craft) and the setup (maze_setup) pipeline on synthetic inputs, so
+# they run offline without the AprilTag pngs. Every case is prepared first, then timed (best of --repeat runs) and run
+# once more under tracemalloc for the peak memory (tracemalloc slows down the run, so it is not timed). The results are
+# saved as json together with the commit, so runs of different commits can be compared with --compare.
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_PATH, "maze_craft"))
+sys.path.insert(0, os.path.join(REPO_PATH, "maze_setup"))
+
+import matplotlib
+matplotlib.use("Agg")  # no window, the plots are rendered offscreen
+from tag_to_svg import SVG_MODES
+from tag_to_svg import gen_apriltag_svg
+from create_plate_for_laser import FRONT_BLUEPRINTS_FOR_TAGS
+from create_plate_for_laser import compile_template
+from create_plate_for_laser import complete_tag_numbers
+from create_plate_for_laser import create_plate_svg
+from create_plate_for_laser import read_svg_file
+from create_plate_for_laser import strip_svg_tag
+from maze import Maze
+from wall import Wall
+from wall import Placement
+from maze_builder import MazeBuilder
+from wall_allocator import allocate_layout
+from wall_inventory import WallInventory
+from wall_inventory import VIRTUAL_WALL_INVENTORY_PATH
+from wall_inventory import set_wall_inventory
+
+TAG_BITMAP_SIZES = [10, 100, 1000]  # grid squares per edge of the synthetic tags
+PLATE_COUNTS = [1, 10, 100]
+MAZE_SIZES = [10, 100, 1000]  # rows and columns of the synthetic mazes
+PLOT_MAZE_SIZES = [10, 30, 100]  # the 3D plot of the large mazes takes minutes
+TEMPLATE_PATHS = {True: os.path.join(REPO_PATH, "maze_craft", "do_not_touch", "sample_vorne_empty.svg"),
+                  False: os.path.join(REPO_PATH, "maze_craft", "do_not_touch", "sample_hinten_empty.svg")}
+# number of tags on a plate (12 walls with a big and a small tag)
+NUM_TAGS_PER_PLATE = len(FRONT_BLUEPRINTS_FOR_TAGS)
+
+# A case is prepared by a function that returns the function to time and the number of items it processes
+Case = Tuple[Callable[[], None], int]
+
+parser = argparse.ArgumentParser(
+    description='Benchmarks the main stages of the craft and the setup pipeline on synthetic inputs and saves the '
+                'times and peak memory as json.',
+    epilog='Example: "python benchmarks/run_benchmarks.py --max_size=100 --compare=output/benchmark_1a2b3c4d.json"'
+)
+parser.add_argument(
+    '--only', type=str, nargs='+', required=False, default=None, dest="only",
+    help='Run only the given benchmarks (default: all)'
+)
+parser.add_argument(
+    '--max_size', type=int, required=False, default=None, dest="max_size",
+    help='Leave out the cases with a larger size (edge length of the tags, plates or rows of the mazes)'
+)
+parser.add_argument(
+    '--repeat', type=int, required=False, default=3, dest="repeat",
+    help='Number of timed runs per case, the fastest one is reported (default: 3)'
+)
+parser.add_argument(
+    '--output_folder', type=str, required=False, default="output", dest="output_folder",
+    help='The folder the results are saved to as benchmark_<commit>.json (default: output)'
+)
+parser.add_argument(
+    '--compare', type=str, required=False, default=None, dest="compare",
+    help='The path to the results of an earlier run, the speedup of every case is printed'
+)
+
+
+def get_tag_bitmap(size: int, seed: int = 0) -> np.ndarray:
+    """Returns a random black and white tag bitmap (rgba) of size x size grid squares with a black border"""
+    rng = np.random.default_rng([seed, size])
+    black = rng.random((size, size)) < 0.5
+    black[[0, -1], :] = True
+    black[:, [0, -1]] = True
+    pixels = np.full((size, size, 4), 255, dtype=np.uint8)
+    pixels[black, :3] = 0
+    return pixels
+
+
+def get_grid_layout(size: int) -> Tuple[List[List[int]], List[List[int]]]:
+    """Returns the wall rows of a size x size maze with a wall at every position (the worst case for a maze of this
+    size) and the walls of the inventory assigned to them"""
+    return allocate_layout(np.zeros((size + 1, size), dtype=np.int64).tolist(),
+                           np.zeros((size, size + 1), dtype=np.int64).tolist())
+
+
+def get_maze(size: int, create_walls: bool = True) -> Maze:
+    rows_with_horizontal_walls, rows_with_vertical_walls = get_grid_layout(size)
+    maze = Maze()
+    maze.set_number_of_rows(size)
+    maze.set_number_of_columns(size)
+    maze.rows_with_horizontal_walls = rows_with_horizontal_walls
+    maze.rows_with_vertical_walls = rows_with_vertical_walls
+    if create_walls:
+        maze.create_walls()
+    return maze
+
+
+def prepare_gen_apriltag_svg(size: int, mode: str) -> Case:
+    pixels = get_tag_bitmap(size)
+    return lambda: gen_apriltag_svg(pixels, "140mm", mode=mode), size * size
+
+
+def prepare_create_plate_svg(num_plates: int) -> Case:
+    """Composes front and back plates alternately from the templates and synthetic 10 x 10 tags (the size of the
+    48h12 family)"""
+    compiled_templates = {front: compile_template(read_svg_file(path)) for front, path in TEMPLATE_PATHS.items()}
+    plates = [(idx % 2 == 0, [NUM_TAGS_PER_PLATE * 2 * idx + 4 * wall for wall in range(NUM_TAGS_PER_PLATE // 2)])
+              for idx in range(num_plates)]
+    svg_tags = {tag_number: strip_svg_tag(gen_apriltag_svg(get_tag_bitmap(10, tag_number), "140mm"))
+                for _, tag_numbers in plates for tag_number in complete_tag_numbers(tag_numbers)}
+
+    def run():
+        for front, tag_numbers in plates:
+            create_plate_svg(compiled_templates[front], front, tag_numbers, svg_tags)
+    return run, num_plates
+
+
+def prepare_wall_construction(size: int) -> Case:
+    walls = get_maze(size).tag_store.walls
+    arguments = list(zip([Placement(value) for value in walls["placement"].tolist()], walls["x"].tolist(),
+                         walls["y"].tolist(), walls["z"].tolist(), walls["smallest_tag_id"].tolist()))
+
+    def run():
+        for placement, pos_x, pos_y, pos_z, smallest_tag_id in arguments:
+            Wall(placement, pos_x, pos_y, pos_z, smallest_tag_id)
+    return run, len(arguments)
+
+
+def prepare_create_walls(size: int) -> Case:
+    maze = get_maze(size, create_walls=False)
+    return maze.create_walls, 2 * size * (size + 1)
+
+
+def prepare_save_maze_as_yaml(size: int, folder: str) -> Case:
+    maze_builder = MazeBuilder()
+    maze_builder.maze = get_maze(size)
+    save_path = os.path.join(folder, f"maze_{size}.yaml")
+
+    def run():
+        # the yaml of the earlier run is removed first, save_maze_as_yaml does not replace files
+        if os.path.isfile(save_path):
+            os.remove(save_path)
+        maze_builder.save_maze_as_yaml(save_path)
+    return run, len(maze_builder.maze.tag_store.tags)
+
+
+def prepare_advanced_plot(size: int, folder: str) -> Case:
+    maze = get_maze(size)
+    return lambda: maze.advanced_plot(os.path.join(folder, f"maze_{size}.png")), 2 * size * (size + 1)
+
+
+def get_cases(folder: str) -> List[Tuple[str, Dict, Callable[[], Case]]]:
+    """Returns the name, parameters and preparation of every benchmark case. Temporary files are saved to folder."""
+    cases = []
+    for mode in SVG_MODES:
+        for size in TAG_BITMAP_SIZES:
+            cases.append(("gen_apriltag_svg", {"mode": mode, "size": size},
+                          lambda size=size, mode=mode: prepare_gen_apriltag_svg(size, mode)))
+    for num_plates in PLATE_COUNTS:
+        cases.append(("create_plate_svg", {"size": num_plates},
+                      lambda num_plates=num_plates: prepare_create_plate_svg(num_plates)))
+    for size in MAZE_SIZES:
+        cases.append(("wall_construction", {"size": size}, lambda size=size: prepare_wall_construction(size)))
+    for size in MAZE_SIZES:
+        cases.append(("create_walls", {"size": size}, lambda size=size: prepare_create_walls(size)))
+    for size in MAZE_SIZES:
+        cases.append(("save_maze_as_yaml", {"size": size}, lambda size=size: prepare_save_maze_as_yaml(size, folder)))
+    for size in PLOT_MAZE_SIZES:
+        cases.append(("advanced_plot", {"size": size}, lambda size=size: prepare_advanced_plot(size, folder)))
+    return cases
+
+
+def measure(run: Callable[[], None], repeat: int) -> Tuple[float, int]:
+    """Returns the fastest time of repeat runs in seconds and the peak memory allocated by one more run in bytes. What
+    the runs print (e.g. the path of a saved file) is dropped."""
+    seconds = []
+    with redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            seconds.append(time.perf_counter() - start)
+        tracemalloc.start()
+        run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return min(seconds), peak_memory
+
+
+def get_commit() -> Tuple[Optional[str], bool]:
+    """Returns the commit of the repository (None outside of a git repository) and if there are uncommitted changes"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_PATH, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_PATH,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, status.strip() != ""
+
+
+def get_case_key(result: dict) -> str:
+    return result["name"] + "".join(f" {key}={val}" for key, val in sorted(result["params"].items()))
+
+
+def print_comparison(results: List[dict], path: str):
+    """Prints the time of every case of an earlier run (e.g. of another commit) next to the time of this run"""
+    with open(path) as f:
+        earlier_run = json.load(f)
+    earlier_results = {get_case_key(result): result for result in earlier_run["results"]}
+    print(f"Compared to {path} (commit {earlier_run['commit']}):")
+    for result in results:
+        earlier_result = earlier_results.get(get_case_key(result))
+        if earlier_result is None:
+            continue
+        print(f"{get_case_key(result):45s} {earlier_result['seconds']:10.4f}s -> {result['seconds']:10.4f}s "
+              f"({earlier_result['seconds'] / result['seconds']:.2f}x)")
+
+
+def main():
+    args = parser.parse_args()
+    # the synthetic mazes are larger than the physical wall inventory
+    set_wall_inventory(WallInventory.from_file(VIRTUAL_WALL_INVENTORY_PATH))
+    commit, dirty = get_commit()
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        cases = get_cases(folder)
+        names = sorted({name for name, _, _ in cases})
+        if args.only is not None:
+            for name in args.only:
+                assert name in names, f"Unknown benchmark {name}. Choose from {names}"
+        for name, params, prepare in cases:
+            if args.only is not None and name not in args.only:
+                continue
+            if args.max_size is not None and params["size"] > args.max_size:
+                continue
+            run, num_items = prepare()
+            seconds, peak_memory = measure(run, args.repeat)
+            results.append({"name": name, "params": params, "items": num_items, "seconds": seconds,
+                            "items_per_second": num_items / seconds, "peak_memory_bytes": peak_memory})
+            print(f"{get_case_key(results[-1]):45s} {seconds:10.4f}s {peak_memory / 2 ** 20:10.1f}MiB "
+                  f"{num_items / seconds:14.0f} items/s")
+
+    output_folder_path = os.path.join(os.getcwd(), args.output_folder)
+    os.makedirs(output_folder_path, exist_ok=True)
+    output_path = os.path.join(output_folder_path, f"benchmark_{(commit or 'unknown')[:8]}{'_dirty' if dirty else ''}"
+                                                   f".json")
+    with open(output_path, 'w') as f:
+        json.dump({"commit": commit,
+                   "dirty": dirty,
+                   "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                   "python": platform.python_version(),
+                   "numpy": np.__version__,
+                   "matplotlib": matplotlib.__version__,
+                   "machine": platform.platform(),
+                   "repeat": args.repeat,
+                   "results": results}, f, indent=1)
+    print(f"Results were saved to {output_path}.")
+    if args.compare is not None:
+        print_comparison(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import atexit
+import functools
+import multiprocessing
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+# Opt-in timing of the stages of a run (nested spans) and counters (bytes read and written, tags, walls, rects, ...).
+# Tracing is enabled by the environment variable MAZE_TRACE or the --trace option of the scripts:
+# - MAZE_TRACE=summary (or 1): prints a table of the spans (calls, total and self time) and the counters at the end
+# - MAZE_TRACE=trace.json: writes the spans as Chrome trace to trace.json at the end (chrome://tracing or
+#   https://ui.perfetto.dev), the counters of a span are its args
+# When tracing is disabled span() returns one shared object that does nothing and count() returns at once.
+# Spans of worker processes are recorded in the worker and sent back with the result of the job (see run_in_worker).
+# Shared by the scripts of maze_craft and maze_setup, which add the folder of this file to sys.path.
+
+TRACE_ENVIRONMENT_VARIABLE = "MAZE_TRACE"
+SUMMARY_TARGETS = ["1", "summary"]
+DISABLED_TARGETS = ["", "0"]
+
+_enabled = False
+_target: Optional[str] = None
+_reporting = False
+_open_spans: List["Span"] = []
+# complete events ("ph": "X") of the Chrome trace format
+_events: List[dict] = []
+# path of a span (names of the open spans separated by /) -> [calls, total time in ns, self time in ns]
+_span_stats: Dict[str, List[int]] = {}
+_counters: Dict[str, int] = {}
+
+
+class Span(object):
+    """Measures the time of a with block. Counters counted within the block are added to the innermost span."""
+    __slots__ = ["name", "path", "counts", "start", "child_time"]
+
+    def __init__(self, name: str):
+        self.name = name
+        self.path = name
+        self.counts: Dict[str, int] = {}
+        self.start = 0
+        self.child_time = 0
+
+    def __enter__(self):
+        if _open_spans:
+            self.path = _open_spans[-1].path + "/" + self.name
+        _open_spans.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter_ns() - self.start
+        _open_spans.pop()
+        if _open_spans:
+            _open_spans[-1].child_time += duration
+        stats = _span_stats.setdefault(self.path, [0, 0, 0])
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] += duration - self.child_time
+        _events.append({"name": self.name, "ph": "X", "ts": self.start / 1000, "dur": duration / 1000,
+                        "pid": os.getpid(), "tid": 0, "args": self.counts})
+        return False
+
+
+class DisabledSpan(object):
+    """Stands in for all spans while tracing is disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+DISABLED_SPAN = DisabledSpan()
+
+
+def span(name: str):
+    """Returns a context manager that measures the time of its with block as span with the given name"""
+    if not _enabled:
+        return DISABLED_SPAN
+    return Span(name)
+
+
+def traced(name: str):
+    """Decorator that measures every call of a function as span with the given name"""
+    def decorator(function: Callable):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, value: int = 1):
+    """Adds value to the counter with the given name"""
+    if not _enabled:
+        return
+    _counters[name] = _counters.get(name, 0) + value
+    if _open_spans:
+        counts = _open_spans[-1].counts
+        counts[name] = counts.get(name, 0) + value
+
+
+def count_file_size(name: str, path: str):
+    """Adds the size of the file at path in bytes to the counter with the given name (e.g. bytes_read)"""
+    if not _enabled:
+        return
+    count(name, os.path.getsize(path))
+
+
+def is_enabled() -> bool:
+    """Counts that are expensive to compute should only be computed when tracing is enabled"""
+    return _enabled
+
+
+def enable(target: str):
+    """Enables tracing, target is "summary" (or "1") to print a summary table or the path of a Chrome trace json file.
+    The summary or trace is written when the program ends."""
+    global _enabled, _target, _reporting
+    if target in DISABLED_TARGETS:
+        return
+    _enabled = True
+    _target = target
+    if not _reporting:
+        atexit.register(report)
+        _reporting = True
+
+
+def clear_records():
+    _open_spans.clear()
+    _events.clear()
+    _span_stats.clear()
+    _counters.clear()
+
+
+def export_records() -> dict:
+    """Returns the records of the finished spans and the counters and clears them"""
+    records = {"events": list(_events), "span_stats": dict(_span_stats), "counters": dict(_counters)}
+    _events.clear()
+    _span_stats.clear()
+    _counters.clear()
+    return records
+
+
+def merge_records(records: dict):
+    """Adds the records of another process (see export_records) to the records of this process. The spans are nested
+    in the innermost open span."""
+    if not _enabled:
+        return
+    _events.extend(records["events"])
+    prefix = _open_spans[-1].path + "/" if _open_spans else ""
+    for path, (calls, total_time, self_time) in records["span_stats"].items():
+        stats = _span_stats.setdefault(prefix + path, [0, 0, 0])
+        stats[0] += calls
+        stats[1] += total_time
+        stats[2] += self_time
+    for name, value in records["counters"].items():
+        count(name, value)
+
+
+def run_in_worker(enabled: bool, function: Callable, *args):
+    """Runs function(*args) in a worker process, e.g. executor.submit(run_in_worker, is_enabled(), function, *args).
+    Returns the result of the function and the records of the worker (see merge_records)."""
+    global _enabled
+    _enabled = enabled
+    # a forked worker starts with a copy of the records of its parent
+    clear_records()
+    result = function(*args)
+    return result, export_records()
+
+
+def print_summary():
+    """Prints the calls, total and self time (total time without the time of nested spans) of every span and the
+    counters. Spans of worker processes overlap in time, so their total can be more than the time of their parent."""
+    if not _span_stats and not _counters:
+        return
+    width = max([len(path) for path in _span_stats] + [len(name) for name in _counters] + [len("span")])
+    print(f"{'span'.ljust(width)} {'calls':>8} {'total [s]':>11} {'self [s]':>11}")
+    for path, (calls, total_time, self_time) in sorted(_span_stats.items()):
+        print(f"{path.ljust(width)} {calls:8d} {total_time / 1e9:11.4f} {self_time / 1e9:11.4f}")
+    if _counters:
+        print(f"{'counter'.ljust(width)} {'value':>12}")
+        for name, value in sorted(_counters.items()):
+            print(f"{name.ljust(width)} {value:12d}")
+
+
+def write_chrome_trace(path: str):
+    with open(path, 'w') as f:
+        json.dump({"traceEvents": _events, "displayTimeUnit": "ms", "otherData": {"counters": _counters}}, f)
+    print(f"Trace was saved to {path}.")
+
+
+def report():
+    """Prints the summary or writes the trace, only in the main process (workers send their records back)"""
+    if not _enabled or multiprocessing.parent_process() is not None:
+        return
+    if _target in SUMMARY_TARGETS:
+        print_summary()
+    else:
+        write_chrome_trace(_target)
+
+
+enable(os.environ.get(TRACE_ENVIRONMENT_VARIABLE, ""))
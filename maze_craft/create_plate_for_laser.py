@@ -1,7 +1,133 @@
 #!/usr/bin/env python3
 import os.path
-import copy as cp
+import sys
+import re
+import argparse
+import json
+import hashlib
+from typing import Optional
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from optimize_toolpath import optimize_svg
+from optimize_toolpath import report_travel_distance
+# instrumentation.py is shared with the other folder and lies in the folder above
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import span
+from instrumentation import count
+from instrumentation import count_file_size
+from instrumentation import enable
+from instrumentation import is_enabled
+from instrumentation import merge_records
+from instrumentation import run_in_worker
+
+# placeholders in the sample_*_empty.svg templates for the tags and the texts that name the tags on a wall
+PLACEHOLDER_PATTERN = re.compile(r"hier_tag_\d{3}|id\d{3} &amp; id\d{3}")
+SVG_TAG_START = 'xmlns="http://www.w3.org/2000/svg">'
+SVG_TAG_END = "</svg>"
+
+# placeholders of the front template, left to right, top to bottom
+FRONT_BLUEPRINTS_FOR_TAGS = ["hier_tag_000",
+                             "hier_tag_001",
+                             "hier_tag_004",
+                             "hier_tag_005",
+                             "hier_tag_008",
+                             "hier_tag_009",
+                             "hier_tag_012",
+                             "hier_tag_013",
+                             "hier_tag_016",
+                             "hier_tag_017",
+                             "hier_tag_020",
+                             "hier_tag_021",
+                             "hier_tag_024",
+                             "hier_tag_025",
+                             "hier_tag_028",
+                             "hier_tag_029",
+                             "hier_tag_032",
+                             "hier_tag_033",
+                             "hier_tag_036",
+                             "hier_tag_037",
+                             "hier_tag_040",
+                             "hier_tag_041",
+                             "hier_tag_044",
+                             "hier_tag_045"]
+FRONT_BLUEPRINTS_FOR_TEXTS = ["id000 &amp; id001",
+                              "id004 &amp; id005",
+                              "id008 &amp; id009",
+                              "id012 &amp; id013",
+                              "id016 &amp; id017",
+                              "id020 &amp; id021",
+                              "id024 &amp; id025",
+                              "id028 &amp; id029",
+                              "id032 &amp; id033",
+                              "id036 &amp; id037",
+                              "id040 &amp; id041",
+                              "id044 &amp; id045"]
+
+# placeholders of the back template, left to right, top to bottom (looking at the back)
+BACK_BLUEPRINTS_FOR_TAGS = ["hier_tag_022",
+                            "hier_tag_023",
+                            "hier_tag_018",
+                            "hier_tag_019",
+                            "hier_tag_014",
+                            "hier_tag_015",
+                            "hier_tag_010",
+                            "hier_tag_011",
+                            "hier_tag_006",
+                            "hier_tag_007",
+                            "hier_tag_002",
+                            "hier_tag_003",
+                            "hier_tag_046",
+                            "hier_tag_047",
+                            "hier_tag_042",
+                            "hier_tag_043",
+                            "hier_tag_038",
+                            "hier_tag_039",
+                            "hier_tag_034",
+                            "hier_tag_035",
+                            "hier_tag_030",
+                            "hier_tag_031",
+                            "hier_tag_026",
+                            "hier_tag_027"]
+BACK_BLUEPRINTS_FOR_TEXTS = ["id022 &amp; id023",
+                             "id018 &amp; id019",
+                             "id014 &amp; id015",
+                             "id010 &amp; id011",
+                             "id006 &amp; id007",
+                             "id002 &amp; id003",
+                             "id046 &amp; id047",
+                             "id042 &amp; id043",
+                             "id038 &amp; id039",
+                             "id034 &amp; id035",
+                             "id030 &amp; id031",
+                             "id026 &amp; id027"]
+
+parser = argparse.ArgumentParser(
+    description='Creates the svg files to laser MDF plates with AprilTag walls.',
+    epilog='Example: "python create_plate_for_laser.py --batch=plates.json --output_folder=new_plates"'
+)
+parser.add_argument(
+    '--batch', type=str, required=False, default=None, dest="plate_manifest",
+    help='Path to a plate manifest (json list of {"name", "front", "tag_numbers"}). All plates in it are created in '
+         'one run. Without this option the plate given in the USER INPUT section of main() is created.'
+)
+parser.add_argument(
+    '--output_folder', type=str, required=False, default="final_plates_to_laser", dest="output_folder",
+    help='The folder the svg files are saved to (default: final_plates_to_laser)'
+)
+parser.add_argument(
+    '--workers', type=int, required=False, default=os.cpu_count(), dest="workers",
+    help='The number of worker processes that render plates in batch mode (default: number of CPUs)'
+)
+parser.add_argument(
+    '--optimize_toolpath', action='store_true', required=False, dest="optimize_toolpath",
+    help='Reorder the primitives of the plates to minimize the travel distance of the laser head '
+         '(see optimize_toolpath.py)'
+)
+parser.add_argument(
+    '--trace', type=str, required=False, default=None, dest="trace",
+    help='Print the time spent per stage and counters ("summary") or save them as Chrome trace to the given json path '
+         '(see instrumentation.py, like the environment variable MAZE_TRACE)'
+)
 
 def read_svg_tag(tag_number:int):
     """Read tag svg and strip to relevant data"""
@@ -12,13 +138,15 @@ def read_svg_tag(tag_number:int):
 
     path_to_tag = os.path.join(os.getcwd(), "tags_scaled", tag_file_name)
 
-    tag_string = read_svg_file(path_to_tag)
+    return strip_svg_tag(read_svg_file(path_to_tag))
 
-    tag_string = tag_string.split('xmlns="http://www.w3.org/2000/svg">')[1]
-    tag_string = tag_string.split("</svg>")[0]
 
-    return tag_string
+def strip_svg_tag(tag_string:str) -> str:
+    """Returns the content of a tag svg between the svg start and end tag"""
+    start = tag_string.index(SVG_TAG_START) + len(SVG_TAG_START)
+    end = tag_string.rindex(SVG_TAG_END)
 
+    return tag_string[start:end]
 
 
 def read_svg_file(path:str) -> str:
@@ -26,6 +154,7 @@ def read_svg_file(path:str) -> str:
     assert os.path.isfile(path), f"Given path {path} does not exist"
     with open(path) as f:
         s = f.read()
+    count_file_size("bytes_read", path)
     return s
 
 def save_svg_file(string_to_save:str, path:str):
@@ -33,12 +162,200 @@ def save_svg_file(string_to_save:str, path:str):
     assert not os.path.isfile(path), "Filename that you want to use to save already exits. Choose another one."
     with open(path, 'w') as f:
         f.write(string_to_save)
+    count_file_size("bytes_written", path)
+
+def compile_template(template_string:str) -> dict:
+    """Compiles a template into its literal segments and the placeholder slots in between (there is always one more
+    literal than slots). Every placeholder is expected to be there only once."""
+    literals = []
+    slots = []
+    last_end = 0
+    for match in PLACEHOLDER_PATTERN.finditer(template_string):
+        assert match.group() not in slots, f"Placeholder {match.group()} is there more than once in the template"
+        literals.append(template_string[last_end:match.start()])
+        slots.append(match.group())
+        last_end = match.end()
+    literals.append(template_string[last_end:])
+    return {"literals": literals, "slots": slots}
+
+
+def load_compiled_template(path:str) -> dict:
+    """Returns the compiled template of a sample_*_empty.svg. The compiled form is cached on disk next to the template
+    and compiled again whenever the template changes."""
+    template_string = read_svg_file(path)
+    template_hash = hashlib.sha256(template_string.encode()).hexdigest()
+    path_to_cache = os.path.splitext(path)[0] + ".compiled.json"
+    if os.path.isfile(path_to_cache):
+        with open(path_to_cache) as f:
+            compiled_template = json.load(f)
+        if compiled_template["sha256"] == template_hash:
+            return compiled_template
+    compiled_template = compile_template(template_string)
+    compiled_template["sha256"] = template_hash
+    with open(path_to_cache, 'w') as f:
+        json.dump(compiled_template, f)
+    return compiled_template
+
+
+def render_template(compiled_template:dict, replacements:dict) -> str:
+    """Builds the text of a compiled template in a single join, replacing every placeholder slot by the given text"""
+    slots = compiled_template["slots"]
+    for old_string in replacements:
+        assert old_string in slots, f"Expected string {old_string} not found in template"
+    for old_string in slots:
+        assert old_string in replacements, f"No replacement given for {old_string} in template"
+    literals = compiled_template["literals"]
+    segments = [literals[0]]
+    for slot, literal in zip(slots, literals[1:]):
+        segments.append(replacements[slot])
+        segments.append(literal)
+    return "".join(segments)
+
+
+
+def check_tag_numbers(tag_numbers:list, front:bool):
+    """Checks that the tag numbers of a plate follow the convention for the front or the back of a plate"""
+    assert len(tag_numbers) == 12, "There must be given 12 tag numbers"
+    for idx, tag_number in enumerate(tag_numbers):
+        assert tag_number%2 == 0, "Tag numbers must be even"
+        if idx == 0:
+            continue
+        if front:
+            assert tag_number == tag_numbers[idx-1]+4, "Front plate tag numbers should always be spaced 4"
+        else:
+            assert int(np.abs(tag_number - tag_numbers[idx-1])) in [4, 44], "Back plate numbers no not follow specified convention. See given expamples"
+
+
+def complete_tag_numbers(tag_numbers:list) -> list:
+    """Completes the (even) tag_numbers with the respective uneven ones"""
+    new_tag_numbers = []
+    for tag_number in tag_numbers:
+        new_tag_numbers.append(tag_number)
+        new_tag_numbers.append(tag_number+1)
+    return new_tag_numbers
+
+
+def get_path_to_template(front:bool) -> str:
+    if front:
+        return os.path.join(os.getcwd(), "do_not_touch", "sample_vorne_empty.svg")
+    return os.path.join(os.getcwd(), "do_not_touch", "sample_hinten_empty.svg")
+
+
+def create_plate_svg(compiled_template:dict, front:bool, tag_numbers:list, svg_tags:dict) -> str:
+    """Returns the svg text of a plate. tag_numbers are the 12 even tag ids on the plate, svg_tags maps every tag id
+    on the plate (even and uneven) to the stripped svg data of the tag (see read_svg_tag)."""
+    if front:
+        blueprints_for_tags = FRONT_BLUEPRINTS_FOR_TAGS
+        blueprints_for_texts = FRONT_BLUEPRINTS_FOR_TEXTS
+    else:
+        blueprints_for_tags = BACK_BLUEPRINTS_FOR_TAGS
+        blueprints_for_texts = BACK_BLUEPRINTS_FOR_TEXTS
+
+    replacements = {}
+    for idx, tag_number in enumerate(complete_tag_numbers(tag_numbers)):
+        # replace tags
+        replacements[blueprints_for_tags[idx]] = svg_tags[tag_number]
+
+        # replace text (only once per wall so only when even)
+        if idx % 2 == 0:
+            new_text = f"id{str(tag_number).zfill(3)} &amp; id{str(tag_number+1).zfill(3)}"
+            replacements[blueprints_for_texts[int(idx/2)]] = new_text
+
+    count("plates")
+    count("tags", 2 * len(tag_numbers))
+    return render_template(compiled_template, replacements)
 
-def replace_string_in_string(complete_string:str, old_string:str, new_string:str) -> str:
-    """Replaces a text within a string"""
-    assert old_string in complete_string, f"Expected string {old_string} not found in complete string"
-    return complete_string.replace(old_string, new_string)
 
+def save_plate_svg(svg_file:str, path_to_new_svg_file:str, optimize_toolpath:bool=False):
+    """Saves the svg text of a plate, optionally after optimizing the toolpath. Returns the travel distances of the
+    laser head before and after the optimization (None if not optimized)."""
+    travel_distances = None
+    if optimize_toolpath:
+        with span("optimize_toolpath"):
+            svg_file, distance_before, distance_after = optimize_svg(svg_file)
+        travel_distances = (distance_before, distance_after)
+    with span("save_plate"):
+        save_svg_file(svg_file, path_to_new_svg_file)
+    return travel_distances
+
+
+def create_plate(name_for_new_svg_file:str, front:bool, tag_numbers:list, output_folder:str="final_plates_to_laser",
+                 optimize_toolpath:bool=False):
+    """Creates the svg file of a single plate"""
+    path_to_new_svg_file = os.path.join(os.getcwd(), output_folder, name_for_new_svg_file)
+
+    check_tag_numbers(tag_numbers, front)
+    assert not os.path.isfile(path_to_new_svg_file), "New svg file that is supposed to be created does alreaddy exist, choose other name"
+
+    with span("load_template"):
+        compiled_template = load_compiled_template(get_path_to_template(front))
+    with span("read_tags"):
+        svg_tags = {tag_number: read_svg_tag(tag_number) for tag_number in complete_tag_numbers(tag_numbers)}
+
+    with span("render_plate"):
+        svg_file = create_plate_svg(compiled_template, front, tag_numbers, svg_tags)
+    travel_distances = save_plate_svg(svg_file, path_to_new_svg_file, optimize_toolpath)
+    if travel_distances is not None:
+        report_travel_distance(name_for_new_svg_file, *travel_distances)
+
+
+def read_plate_manifest(path:str) -> list:
+    """Reads a plate manifest, a json list of plates that each have a "name" (of the svg file), "front" (bool) and
+    "tag_numbers" (the 12 even tag ids on the plate)"""
+    with open(path) as f:
+        plates = json.load(f)
+    for plate in plates:
+        for key in ["name", "front", "tag_numbers"]:
+            assert key in plate, f"Plate {plate} in plate manifest has no entry {key}"
+    return plates
+
+
+# templates and tag data shared with the worker processes of create_plates (set by _init_worker)
+_shared_compiled_templates = None
+_shared_svg_tags = None
+
+
+def _init_worker(compiled_templates:dict, svg_tags:dict):
+    global _shared_compiled_templates, _shared_svg_tags
+    _shared_compiled_templates = compiled_templates
+    _shared_svg_tags = svg_tags
+
+
+def _render_and_save_plate(plate:dict, path_to_new_svg_file:str, optimize_toolpath:bool):
+    compiled_template = _shared_compiled_templates[plate["front"]]
+    with span("render_plate"):
+        svg_file = create_plate_svg(compiled_template, plate["front"], plate["tag_numbers"], _shared_svg_tags)
+    return save_plate_svg(svg_file, path_to_new_svg_file, optimize_toolpath)
+
+
+def create_plates(plates:list, output_folder:str="final_plates_to_laser", workers:Optional[int]=None,
+                  optimize_toolpath:bool=False):
+    """Creates the svg files of all given plates (see read_plate_manifest) in one run. All plates are checked before
+    any work starts. Templates and tags are loaded only once and the plates are rendered concurrently."""
+    paths_to_new_svg_files = [os.path.join(os.getcwd(), output_folder, plate["name"]) for plate in plates]
+    assert len(set(paths_to_new_svg_files)) == len(paths_to_new_svg_files), "Plate names in the plate manifest must be unique"
+    for plate, path_to_new_svg_file in zip(plates, paths_to_new_svg_files):
+        check_tag_numbers(plate["tag_numbers"], plate["front"])
+        assert not os.path.isfile(path_to_new_svg_file), f"New svg file {path_to_new_svg_file} that is supposed to be created does alreaddy exist, choose other name"
+
+    with span("load_templates"):
+        compiled_templates = {front: load_compiled_template(get_path_to_template(front))
+                              for front in {plate["front"] for plate in plates}}
+    with span("read_tags"):
+        tag_numbers = {tag_number for plate in plates for tag_number in complete_tag_numbers(plate["tag_numbers"])}
+        svg_tags = {tag_number: read_svg_tag(tag_number) for tag_number in sorted(tag_numbers)}
+
+    with span("render_plates"), ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                    initargs=(compiled_templates, svg_tags)) as executor:
+        futures = [executor.submit(run_in_worker, is_enabled(), _render_and_save_plate, plate, path_to_new_svg_file,
+                                   optimize_toolpath)
+                   for plate, path_to_new_svg_file in zip(plates, paths_to_new_svg_files)]
+        for idx, (future, plate, path_to_new_svg_file) in enumerate(zip(futures, plates, paths_to_new_svg_files)):
+            travel_distances, records = future.result()
+            merge_records(records)
+            print(f"[{idx + 1}/{len(plates)}] Saved {path_to_new_svg_file}")
+            if travel_distances is not None:
+                report_travel_distance(plate["name"], *travel_distances)
 
 
 def main():
@@ -48,7 +365,16 @@ def main():
      so that a single wall has for example the tags 0 (big) and 1 (small) on the front and the following tag ids
      2 (big) and 3 (small) on the back.
      There are 2 x 6 walls (170mm x 250mm) (portrait orientation) on a plate (landscape orientation). They are
-     indexed beginning on the top left of the plate going to the right, and then down."""
+     indexed beginning on the top left of the plate going to the right, and then down.
+     With --batch, all plates of a plate manifest (e.g. plates.json) are created instead."""
+    args = parser.parse_args()
+    if args.trace is not None:
+        enable(args.trace)
+    if args.plate_manifest is not None:
+        with span("create_plates"):
+            create_plates(read_plate_manifest(args.plate_manifest), args.output_folder, args.workers,
+                          args.optimize_toolpath)
+        return
 
     # USER INPUT START
     name_for_new_svg_file = "Plate_4_hinten.svg"
@@ -85,132 +411,9 @@ def main():
 
     # USER INPUT END
 
-    path_to_new_svg_file = os.path.join(os.getcwd(), "final_plates_to_laser", name_for_new_svg_file)
-
-    # Do not change anything from here on
-    assert len(tag_numbers) == 12, "There must be given 12 tag numbers"
-    for idx, tag_number in enumerate(tag_numbers):
-        assert tag_number%2 == 0, "Tag numbers must be even"
-        if idx == 0:
-            continue
-        if front:
-            assert tag_number == tag_numbers[idx-1]+4, "Front plate tag numbers should always be spaced 4"
-        else:
-            assert int(np.abs(tag_number - tag_numbers[idx-1])) in [4, 44], "Back plate numbers no not follow specified convention. See given expamples"
-
-
-
-    assert not os.path.isfile(path_to_new_svg_file), "New svg file that is supposed to be created does alreaddy exist, choose other name"
-
-    # complete the tag_numbers with the respective uneven ones
-    new_tag_numbers = []
-    for tag_number in tag_numbers:
-        new_tag_numbers.append(tag_number)
-        new_tag_numbers.append(tag_number+1)
-    tag_numbers = cp.deepcopy(new_tag_numbers)
-    del new_tag_numbers
-
-    if front:
-        path_to_svg = os.path.join(os.getcwd(), "do_not_touch", "sample_vorne_empty.svg")
-        # left to right, top to bottom
-        blueprints_for_tags = ["hier_tag_000",
-                               "hier_tag_001",
-                               "hier_tag_004",
-                               "hier_tag_005",
-                               "hier_tag_008",
-                               "hier_tag_009",
-                               "hier_tag_012",
-                               "hier_tag_013",
-                               "hier_tag_016",
-                               "hier_tag_017",
-                               "hier_tag_020",
-                               "hier_tag_021",
-                               "hier_tag_024",
-                               "hier_tag_025",
-                               "hier_tag_028",
-                               "hier_tag_029",
-                               "hier_tag_032",
-                               "hier_tag_033",
-                               "hier_tag_036",
-                               "hier_tag_037",
-                               "hier_tag_040",
-                               "hier_tag_041",
-                               "hier_tag_044",
-                               "hier_tag_045"]
-        blueprints_for_texts = ["id000 &amp; id001",
-                                "id004 &amp; id005",
-                                "id008 &amp; id009",
-                                "id012 &amp; id013",
-                                "id016 &amp; id017",
-                                "id020 &amp; id021",
-                                "id024 &amp; id025",
-                                "id028 &amp; id029",
-                                "id032 &amp; id033",
-                                "id036 &amp; id037",
-                                "id040 &amp; id041",
-                                "id044 &amp; id045"]
-    else:
-        path_to_svg = os.path.join(os.getcwd(), "do_not_touch", "sample_hinten_empty.svg")
-        blueprints_for_tags = ["hier_tag_022",
-                               "hier_tag_023",
-                               "hier_tag_018",
-                               "hier_tag_019",
-                               "hier_tag_014",
-                               "hier_tag_015",
-                               "hier_tag_010",
-                               "hier_tag_011",
-                               "hier_tag_006",
-                               "hier_tag_007",
-                               "hier_tag_002",
-                               "hier_tag_003",
-                               "hier_tag_046",
-                               "hier_tag_047",
-                               "hier_tag_042",
-                               "hier_tag_043",
-                               "hier_tag_038",
-                               "hier_tag_039",
-                               "hier_tag_034",
-                               "hier_tag_035",
-                               "hier_tag_030",
-                               "hier_tag_031",
-                               "hier_tag_026",
-                               "hier_tag_027"]
-        blueprints_for_texts = ["id022 &amp; id023",
-                                "id018 &amp; id019",
-                                "id014 &amp; id015",
-                                "id010 &amp; id011",
-                                "id006 &amp; id007",
-                                "id002 &amp; id003",
-                                "id046 &amp; id047",
-                                "id042 &amp; id043",
-                                "id038 &amp; id039",
-                                "id034 &amp; id035",
-                                "id030 &amp; id031",
-                                "id026 &amp; id027"]
-
-    svg_file = read_svg_file(path_to_svg)
-
-
-    for idx, tag_number in enumerate(tag_numbers):
-        # replace tags
-        svg_tag = read_svg_tag(tag_number)
-        old_tag_string = blueprints_for_tags[idx]
-        svg_file = replace_string_in_string(svg_file, old_tag_string, svg_tag)
-
-        # replace text (only once per wall so only when even)
-        if idx % 2 == 0:
-            new_text = f"id{str(tag_number).zfill(3)} &amp; id{str(tag_number+1).zfill(3)}"
-            old_text = blueprints_for_texts[int(idx/2)]
-            svg_file = replace_string_in_string(svg_file, old_text, new_text)
-
-
-    save_svg_file(svg_file, path_to_new_svg_file)
-
-
-
-
-
+    with span("create_plate"):
+        create_plate(name_for_new_svg_file, front, tag_numbers, args.output_folder, args.optimize_toolpath)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+import io
+import re
+import argparse
+import numpy as np
+import xml.etree.ElementTree as ET
+
+# Post-processing stage for the plate svgs from create_plate_for_laser.py. The lasercutter processes the primitives in
+# the order of the svg document, so the order decides how far the laser head travels between primitives. The
+# primitives are reordered group by group (walls on the plate, tags and texts within a wall, grid squares within a tag)
+# with a nearest neighbour tour that is improved by 2-opt. Siblings whose bounding boxes overlap (e.g. the small tag
+# within the area of the big tag of a wall, or the text next to it) paint over each other, so they keep their document
+# order (a precedence constraint of the tour) and only siblings without overlap change places. Cuts always stay behind
+# the engraving of their group, they are unfilled outlines and do not paint over the engraving. To be sure that the
+# plate is engraved the same, optimize_svg compares a rasterization of the fills before and after the optimization.
+
+SVG_NAMESPACE = "http://www.w3.org/2000/svg"
+DRAWABLE_TAGS = [f"{{{SVG_NAMESPACE}}}{tag}" for tag in ["rect", "path", "text", "g"]]
+GROUP_TAG = f"{{{SVG_NAMESPACE}}}g"
+PRIMITIVE_TAGS = [f"{{{SVG_NAMESPACE}}}{tag}" for tag in ["rect", "path", "text"]]
+TRANSFORM_PATTERN = re.compile(r"(matrix|translate|scale|rotate)\s*\(([^)]*)\)")
+MOVETO_PATTERN = re.compile(r"M\s*(-?[\d.]+)[\s,]+(-?[\d.]+)")
+TSPAN_TAG = f"{{{SVG_NAMESPACE}}}tspan"
+PATH_TOKEN_PATTERN = re.compile(r"[A-Za-z]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+PATH_ARGUMENT_COUNTS = {"m": 2, "l": 2, "h": 1, "v": 1, "c": 6, "s": 4, "q": 4, "t": 2, "a": 7, "z": 0}
+NUMBER_PATTERN = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+# initial values of the inherited presentation properties that are needed for the geometry and the fills
+INITIAL_STYLE = {"fill": "#000000", "stroke": "none", "stroke-width": "1", "font-size": "16", "text-anchor": "start"}
+# boxes that overlap by less than this (in user units) do not overlap, e.g. the adjacent squares of a tag
+OVERLAP_TOLERANCE = 1e-6
+# pixels per user unit (mm for the plates) of the rasterization that checks the optimization
+RASTER_RESOLUTION = 2
+
+parser = argparse.ArgumentParser(
+    description='Reorders the primitives of a plate svg to minimize the travel distance of the laser head.',
+    epilog='Example: "python optimize_toolpath.py final_plates_to_laser/Plate_3_vorne.svg Plate_3_vorne_optimized.svg"'
+)
+parser.add_argument(
+    'in_file', type=str,
+    help='The path to the plate svg you want to optimize.'
+)
+parser.add_argument(
+    'out_file', type=str,
+    help='The path to the optimized svg output file.'
+)
+
+
+def parse_transform(transform: str) -> np.ndarray:
+    """Returns the 3x3 matrix of an svg transform attribute"""
+    matrix = np.eye(3)
+    for name, arguments in TRANSFORM_PATTERN.findall(transform or ""):
+        values = [float(value) for value in re.split(r"[\s,]+", arguments.strip())]
+        if name == "matrix":
+            a, b, c, d, e, f = values
+            step = np.array([[a, c, e], [b, d, f], [0, 0, 1]])
+        elif name == "translate":
+            step = np.eye(3)
+            step[0, 2] = values[0]
+            step[1, 2] = values[1] if len(values) > 1 else 0
+        elif name == "scale":
+            step = np.diag([values[0], values[1] if len(values) > 1 else values[0], 1])
+        else:  # rotate
+            angle = np.radians(values[0])
+            cx, cy = values[1:3] if len(values) == 3 else (0, 0)
+            rotation = np.array([[np.cos(angle), -np.sin(angle), 0], [np.sin(angle), np.cos(angle), 0], [0, 0, 1]])
+            to_center = np.array([[1, 0, cx], [0, 1, cy], [0, 0, 1]])
+            from_center = np.array([[1, 0, -cx], [0, 1, -cy], [0, 0, 1]])
+            step = to_center @ rotation @ from_center
+        matrix = matrix @ step
+    return matrix
+
+
+def is_cut(element) -> bool:
+    """Cuts are the unfilled (red stroked) outlines of the walls"""
+    return element.tag != GROUP_TAG and "fill:none" in (element.get("style") or "")
+
+
+def get_local_points(element) -> np.ndarray:
+    """Returns the points (in the coordinates of the element) where the laser works on a primitive"""
+    if element.tag.endswith("rect"):
+        x, y = float(element.get("x", 0)), float(element.get("y", 0))
+        width, height = float(element.get("width", 0)), float(element.get("height", 0))
+        return np.array([[x + width / 2, y + height / 2]])
+    if element.tag.endswith("path"):
+        return np.array([[float(x), float(y)] for x, y in MOVETO_PATTERN.findall(element.get("d", ""))]).reshape(-1, 2)
+    # text
+    return np.array([[float(element.get("x", 0)), float(element.get("y", 0))]])
+
+
+def get_primitive_points(element, matrix: np.ndarray) -> np.ndarray:
+    """Returns the absolute points of all primitives within an element in document order"""
+    matrix = matrix @ parse_transform(element.get("transform"))
+    if element.tag not in PRIMITIVE_TAGS:
+        points = [get_primitive_points(child, matrix) for child in element if child.tag in DRAWABLE_TAGS]
+        return np.concatenate(points) if points else np.zeros((0, 2))
+    local_points = get_local_points(element)
+    if len(local_points) == 0:
+        return np.zeros((0, 2))
+    # a primitive is represented by the mean of its points
+    homogeneous = np.append(local_points.mean(axis=0), 1)
+    return (matrix @ homogeneous)[np.newaxis, :2]
+
+
+def get_style(element, name: str, default: str = None) -> str:
+    """Returns a presentation property of an element from its style attribute or its presentation attribute"""
+    for declaration in (element.get("style") or "").split(";"):
+        key, _, value = declaration.partition(":")
+        if key.strip() == name:
+            return value.strip()
+    return element.get(name, default)
+
+
+def get_inherited_style(element, style: dict) -> dict:
+    return {name: get_style(element, name, value) for name, value in style.items()}
+
+
+def parse_length(value: str, default: float = 0) -> float:
+    """Returns the first number of an attribute (e.g. "10.58px" or the x list of a tspan)"""
+    match = NUMBER_PATTERN.search(value or "")
+    return float(match.group()) if match else default
+
+
+def get_path_polygons(d: str):
+    """Returns the subpaths of a path as polygons through their end and control points and a margin around them.
+    The control points bound the curves, arcs are bounded by the margin (their largest diameter)."""
+    polygons = []
+    polygon = []
+    current = np.zeros(2)
+    subpath_start = np.zeros(2)
+    margin = 0.0
+    command = None
+    tokens = PATH_TOKEN_PATTERN.findall(d or "")
+    idx = 0
+    while idx < len(tokens):
+        if tokens[idx].isalpha():
+            command = tokens[idx]
+            idx += 1
+        if command is None or command.lower() not in PATH_ARGUMENT_COUNTS:
+            break
+        lower = command.lower()
+        offset = current if command.islower() else np.zeros(2)
+        if lower == "z":
+            if polygon:
+                polygons.append(np.array(polygon))
+            polygon = []
+            current = subpath_start
+            continue
+        values = [float(value) for value in tokens[idx:idx + PATH_ARGUMENT_COUNTS[lower]]]
+        idx += PATH_ARGUMENT_COUNTS[lower]
+        if len(values) < PATH_ARGUMENT_COUNTS[lower]:
+            break
+        if lower == "h":
+            points = [np.array([values[0] + offset[0], current[1]])]
+        elif lower == "v":
+            points = [np.array([current[0], values[0] + offset[1]])]
+        elif lower == "a":
+            points = [np.array(values[5:7]) + offset]
+            margin = max(margin, 2 * max(abs(values[0]), abs(values[1])))
+        else:
+            points = [np.array(values[k:k + 2]) + offset for k in range(0, len(values), 2)]
+        if lower == "m":
+            if polygon:
+                polygons.append(np.array(polygon))
+            polygon = []
+            subpath_start = points[-1]
+            # further coordinate pairs of a moveto are linetos
+            command = "l" if command.islower() else "L"
+        elif not polygon:
+            polygon = [current]
+        polygon.extend(points)
+        current = points[-1]
+    if polygon:
+        polygons.append(np.array(polygon))
+    return polygons, margin
+
+
+def get_text_polygons(element, style: dict) -> list:
+    """Returns a box for every line (the text and its tspans) of a text. The width of a glyph is at most the font
+    size, so the boxes cover the glyphs."""
+    polygons = []
+    lines = [(element, element.text, style)] + [
+        (child, "".join(child.itertext()), get_inherited_style(child, style))
+        for child in element if child.tag == TSPAN_TAG]
+    for line, content, line_style in lines:
+        content = (content or "").strip()
+        if not content:
+            continue
+        font_size = parse_length(line_style["font-size"])
+        x = parse_length(line.get("x"), parse_length(element.get("x")))
+        y = parse_length(line.get("y"), parse_length(element.get("y")))
+        width = font_size * len(content)
+        x -= {"middle": width / 2, "end": width}.get(line_style["text-anchor"], 0)
+        top, bottom = y - font_size, y + font_size / 2
+        polygons.append(np.array([[x, top], [x + width, top], [x + width, bottom], [x, bottom]]))
+    return polygons
+
+
+def get_primitives(element, matrix: np.ndarray, style: dict) -> list:
+    """Returns the primitives within an element in document order as (absolute polygons, fill, margin). The margin
+    around the polygons bounds strokes and arcs."""
+    matrix = matrix @ parse_transform(element.get("transform"))
+    style = get_inherited_style(element, style)
+    if element.tag not in PRIMITIVE_TAGS:
+        return [primitive for child in element if child.tag in DRAWABLE_TAGS
+                for primitive in get_primitives(child, matrix, style)]
+    margin = 0.0
+    if element.tag.endswith("rect"):
+        x, y = float(element.get("x", 0)), float(element.get("y", 0))
+        width, height = float(element.get("width", 0)), float(element.get("height", 0))
+        polygons = [np.array([[x, y], [x + width, y], [x + width, y + height], [x, y + height]])]
+    elif element.tag.endswith("path"):
+        polygons, margin = get_path_polygons(element.get("d"))
+    else:
+        polygons = get_text_polygons(element, style)
+    if not polygons:
+        return []
+    if style["stroke"] != "none":
+        margin += parse_length(style["stroke-width"], 1) / 2
+    if margin > 0:
+        # the margin is scaled by the largest stretch of the transformation
+        margin *= np.linalg.norm(matrix[:2, :2], 2)
+    absolute_polygons = [polygon @ matrix[:2, :2].T + matrix[:2, 2] for polygon in polygons]
+    return [(absolute_polygons, style["fill"], margin)]
+
+
+def get_bounding_box(primitives: list) -> np.ndarray:
+    """Returns [min x, min y, max x, max y] of primitives (see get_primitives)"""
+    boxes = [np.concatenate([polygon.min(axis=0) - margin, polygon.max(axis=0) + margin])
+             for polygons, _, margin in primitives for polygon in polygons]
+    boxes = np.array(boxes)
+    return np.concatenate([boxes[:, :2].min(axis=0), boxes[:, 2:].max(axis=0)])
+
+
+def get_conflicts(boxes: np.ndarray) -> np.ndarray:
+    """Returns a boolean matrix that is True for every pair of boxes that overlap (not only touch)"""
+    overlap_x = (boxes[:, np.newaxis, 0] < boxes[np.newaxis, :, 2] - OVERLAP_TOLERANCE) & \
+                (boxes[np.newaxis, :, 0] < boxes[:, np.newaxis, 2] - OVERLAP_TOLERANCE)
+    overlap_y = (boxes[:, np.newaxis, 1] < boxes[np.newaxis, :, 3] - OVERLAP_TOLERANCE) & \
+                (boxes[np.newaxis, :, 1] < boxes[:, np.newaxis, 3] - OVERLAP_TOLERANCE)
+    conflicts = overlap_x & overlap_y
+    np.fill_diagonal(conflicts, False)
+    return conflicts
+
+
+def get_travel_distance(points: np.ndarray, start=(0, 0)) -> float:
+    """Returns the distance the laser head travels from start along the points"""
+    path = np.concatenate([np.array([start], dtype=float), points])
+    return float(np.linalg.norm(np.diff(path, axis=0), axis=1).sum())
+
+
+def order_points(points: np.ndarray, start: np.ndarray, conflicts: np.ndarray = None, max_passes: int = 20) -> list:
+    """Returns an order of the points that approximately minimizes the travel distance of an open path from start.
+    A nearest neighbour tour is improved by 2-opt moves until no move is better (or max_passes is reached).
+    conflicts[i, j] is True if the points i and j (e.g. overlapping primitives) have to keep their relative order."""
+    num_points = len(points)
+    if num_points < 2:
+        return list(range(num_points))
+    if conflicts is None:
+        conflicts = np.zeros((num_points, num_points), dtype=bool)
+    successors = np.triu(conflicts, 1)
+
+    # nearest neighbour tour among the points whose conflicting predecessors are all visited
+    order = []
+    unvisited = np.ones(num_points, dtype=bool)
+    num_blocking = successors.sum(axis=0)
+    current = start
+    for _ in range(num_points):
+        distances = np.linalg.norm(points - current, axis=1)
+        distances[~unvisited | (num_blocking > 0)] = np.inf
+        nearest = int(np.argmin(distances))
+        order.append(nearest)
+        unvisited[nearest] = False
+        num_blocking[successors[nearest]] -= 1
+        current = points[nearest]
+
+    # 2-opt: reverse the segment order[i:j+1] whenever that shortens the path and the segment has no conflicts
+    tour = np.concatenate([[start], points[order]])
+    order = np.array(order)
+    has_conflicts = bool(conflicts.any())
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, num_points):
+            j = np.arange(i + 1, num_points + 1)
+            removed = np.linalg.norm(tour[i - 1] - tour[i]) + np.append(
+                np.linalg.norm(tour[j[:-1]] - tour[j[:-1] + 1], axis=1), 0)
+            added = np.linalg.norm(tour[j] - tour[i - 1], axis=1) + np.append(
+                np.linalg.norm(tour[i] - tour[j[:-1] + 1], axis=1), 0)
+            gains = removed - added
+            if has_conflicts:
+                # the segment order[i-1:j] may only reach up to the first point that conflicts with an earlier one
+                remaining = order[i - 1:]
+                blocked = np.tril(conflicts[np.ix_(remaining, remaining)], -1).any(axis=1)
+                max_length = int(np.argmax(blocked)) if blocked.any() else len(remaining)
+                gains[j - i + 1 > max_length] = -np.inf
+            best = int(np.argmax(gains))
+            if gains[best] > 1e-9:
+                tour[i:j[best] + 1] = tour[i:j[best] + 1][::-1].copy()
+                order[i - 1:j[best]] = order[i - 1:j[best]][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return order.tolist()
+
+
+def reorder_group(group, matrix: np.ndarray, start: np.ndarray, style: dict = None) -> np.ndarray:
+    """Reorders the children of a group (recursively) and returns the position of the laser head afterwards.
+    Non drawable children stay in front, cuts are moved behind the engraving and overlapping children keep their
+    order."""
+    matrix = matrix @ parse_transform(group.get("transform"))
+    style = get_inherited_style(group, style or INITIAL_STYLE)
+    children = list(group)
+    others = [child for child in children if child.tag not in DRAWABLE_TAGS]
+    engravings = [child for child in children if child.tag in DRAWABLE_TAGS and not is_cut(child)]
+    cuts = [child for child in children if child.tag in DRAWABLE_TAGS and is_cut(child)]
+
+    units = [(child, get_primitive_points(child, matrix), get_primitives(child, matrix, style))
+             for child in engravings]
+    # children without primitives draw nothing and are moved behind the others
+    units = [unit for unit in units if len(unit[1]) > 0 and unit[2]] + \
+            [unit for unit in units if not (len(unit[1]) > 0 and unit[2])]
+    num_placed = sum(1 for _, points, primitives in units if len(points) > 0 and primitives)
+    centers = np.array([points.mean(axis=0) for _, points, _ in units[:num_placed]]).reshape(-1, 2)
+    conflicts = get_conflicts(np.array([get_bounding_box(primitives) for _, _, primitives in units[:num_placed]])
+                              .reshape(-1, 4))
+    order = order_points(centers, start, conflicts) + list(range(num_placed, len(units)))
+
+    position = start
+    for idx in order:
+        child, points, _ = units[idx]
+        if child.tag == GROUP_TAG:
+            position = reorder_group(child, matrix, position, style)
+        elif len(points) > 0:
+            position = points[-1]
+    for cut in cuts:
+        points = get_primitive_points(cut, matrix)
+        if len(points) > 0:
+            position = points[-1]
+
+    tail = group.tail
+    for child in children:
+        group.remove(child)
+    group.extend(others + [units[idx][0] for idx in order] + cuts)
+    group.tail = tail
+    return position
+
+
+def get_canvas(root) -> tuple:
+    """Returns the origin and the size (in user units) of an svg from its viewBox (or width and height)"""
+    view_box = [float(value) for value in NUMBER_PATTERN.findall(root.get("viewBox") or "")]
+    if len(view_box) == 4:
+        return np.array(view_box[:2]), np.array(view_box[2:])
+    return np.zeros(2), np.array([parse_length(root.get("width")), parse_length(root.get("height"))])
+
+
+def paint_polygons(canvas: np.ndarray, polygons: list, value: int, origin: np.ndarray, pixels_per_unit: float):
+    """Sets the pixels of the canvas whose centers are within the polygons (even-odd rule) to value"""
+    points = np.concatenate(polygons)
+    low = np.clip(np.floor((points.min(axis=0) - origin) * pixels_per_unit).astype(int), 0, None)
+    high = np.minimum(np.ceil((points.max(axis=0) - origin) * pixels_per_unit).astype(int) + 1,
+                      [canvas.shape[1], canvas.shape[0]])
+    if np.any(high <= low):
+        return
+    xs = origin[0] + (np.arange(low[0], high[0]) + 0.5) / pixels_per_unit
+    ys = origin[1] + (np.arange(low[1], high[1]) + 0.5) / pixels_per_unit
+    inside = np.zeros((len(ys), len(xs)), dtype=bool)
+    for polygon in polygons:
+        for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+            rows = (y1 > ys) != (y2 > ys)
+            if not rows.any():
+                continue
+            crossings = x1 + (ys[rows] - y1) * (x2 - x1) / (y2 - y1)
+            inside[rows] ^= xs[np.newaxis, :] < crossings[:, np.newaxis]
+    canvas[low[1]:high[1], low[0]:high[0]][inside] = value
+
+
+def rasterize_svg(svg_text: str, fills: dict, pixels_per_unit: float = RASTER_RESOLUTION) -> np.ndarray:
+    """Paints the fills of all primitives of an svg in document order. Returns for every pixel the index of its fill
+    in fills (0 is the background), new fills are added to fills. Texts are painted as the boxes of their lines."""
+    root = ET.fromstring(svg_text)
+    origin, size = get_canvas(root)
+    canvas = np.zeros(np.ceil(size[::-1] * pixels_per_unit).astype(int), dtype=np.int32)
+    for polygons, fill, _ in get_primitives(root, np.eye(3), INITIAL_STYLE):
+        if fill == "none":
+            continue
+        value = fills.setdefault(fill, len(fills) + 1)
+        paint_polygons(canvas, polygons, value, origin, pixels_per_unit)
+    return canvas
+
+
+def register_namespaces(svg_text: str):
+    """Registers the namespace prefixes of the svg so that they are kept when writing it"""
+    for _, (prefix, uri) in ET.iterparse(io.StringIO(svg_text), events=["start-ns"]):
+        if uri != SVG_NAMESPACE:
+            ET.register_namespace(prefix, uri)
+    ET.register_namespace("", SVG_NAMESPACE)
+
+
+def optimize_svg(svg_text: str, check: bool = True):
+    """Reorders the primitives of a plate svg to minimize the travel distance of the laser head. Returns the optimized
+    svg text and the travel distances (in user units, i.e. mm for the plates) before and after. With check, the
+    rasterized svg has to be the same before and after the optimization."""
+    register_namespaces(svg_text)
+    root = ET.fromstring(svg_text)
+    identity = np.eye(3)
+    start = np.zeros(2)
+    distance_before = get_travel_distance(get_primitive_points(root, identity))
+    for child in root:
+        if child.tag == GROUP_TAG:
+            start = reorder_group(child, identity, start)
+    distance_after = get_travel_distance(get_primitive_points(root, identity))
+    optimized_svg_text = '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n' + \
+                         ET.tostring(root, encoding="unicode")
+    if check:
+        fills = {}
+        assert np.array_equal(rasterize_svg(svg_text, fills), rasterize_svg(optimized_svg_text, fills)), \
+            "The optimized svg would be engraved differently than the original svg"
+    return optimized_svg_text, distance_before, distance_after
+
+
+def report_travel_distance(name: str, distance_before: float, distance_after: float):
+    print(f"{name}: travel distance of the laser head {distance_before / 1000:.2f}m before and "
+          f"{distance_after / 1000:.2f}m after optimization "
+          f"({100 * (1 - distance_after / max(distance_before, 1e-9)):.1f}% saved)")
+
+
+def main():
+    args = parser.parse_args()
+    with open(args.in_file) as f:
+        svg_text = f.read()
+    optimized_svg_text, distance_before, distance_after = optimize_svg(svg_text)
+    with open(args.out_file, 'w') as f:
+        f.write(optimized_svg_text)
+    report_travel_distance(args.out_file, distance_before, distance_after)
+
+
+if __name__ == '__main__':
+    main()
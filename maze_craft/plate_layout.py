@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+import os
+import json
+import math
+import argparse
+import numpy as np
+import xml.etree.ElementTree as ET
+from typing import List
+from create_plate_for_laser import read_svg_tag
+from create_plate_for_laser import save_plate_svg
+from optimize_toolpath import report_travel_distance
+from optimize_toolpath import parse_transform
+from optimize_toolpath import GROUP_TAG
+
+# Layout engine that packs the walls to produce onto as few MDF sheets as possible and writes the svg files of the
+# sheets without the hand-made sample_*_empty.svg templates.
+# A wall is described in its own (portrait) coordinate system with the origin in the top left corner of its cut
+# outline. The positions of the tags and the text are the same as in the templates.
+# For the back, the sheet is flipped around its vertical axis. Therefore the back layout is the mirrored front layout
+# (the back of a wall is at sheet_width - x - slot width, like the placement of the backs in plates.json and the
+# plates in final_plates_to_laser) and every wall is rotated by 180 degree around its center. create_sheets checks
+# for every back that its center is the mirrored center of its front before saving it.
+
+WALL_WIDTH = 170  # mm (portrait orientation)
+WALL_HEIGHT = 250  # mm
+TAG_GRID_SIZE = 10  # number of grid squares along the edge of a tag of the tagCustom48h12 family
+BIG_TAG_SIZE = 140  # mm
+SMALL_TAG_SIZE = 28  # mm
+BIG_TAG_POSITION = (9.95, 195)  # bottom left corner of the big tag (the tags are rotated by -90 degree)
+SMALL_TAG_POSITION = (65.95, 139)  # bottom left corner of the small tag
+TEXT_POSITION = (-178.54457, 161.97043)  # position of the text (rotated by -90 degree)
+TEXT_STYLE = "font-style:normal;font-weight:normal;font-size:10.5833px;line-height:1.25;font-family:sans-serif;" \
+             "letter-spacing:0px;word-spacing:0px;fill:#000000;fill-opacity:1;stroke:none;stroke-width:0.264583"
+TSPAN_STYLE = "font-style:normal;font-variant:normal;font-weight:normal;font-stretch:normal;font-size:5.29167px;" \
+              "font-family:Sans;-inkscape-font-specification:'Sans, Normal';font-variant-ligatures:normal;" \
+              "font-variant-caps:normal;font-variant-numeric:normal;font-variant-east-asian:normal;" \
+              "stroke-width:0.264583"
+CUT_STYLE = "fill:none;stroke:#ff0000;stroke-width:0.1;stroke-linejoin:round"
+
+parser = argparse.ArgumentParser(
+    description='Packs walls onto as few MDF sheets as possible and creates the svg files to laser them.',
+    epilog='Example: "python plate_layout.py walls.json --output_folder=new_plates"'
+)
+parser.add_argument(
+    'walls', type=str,
+    help='Path to a json list of the walls to produce, e.g. [{"front": 0, "back": 22}, {"front": 48, "back": null}]. '
+         '"front" and "back" are the even (big) tag ids on the sides of a wall, "back" is null for single sided walls.'
+)
+parser.add_argument(
+    '--sheet_width', type=float, required=False, default=1100, dest="sheet_width",
+    help='The width of the MDF sheets in mm (default: 1100)'
+)
+parser.add_argument(
+    '--sheet_height', type=float, required=False, default=550, dest="sheet_height",
+    help='The height of the MDF sheets in mm (default: 550)'
+)
+parser.add_argument(
+    '--margin', type=float, required=False, default=15, dest="margin",
+    help='The distance between the walls and the edge of a sheet in mm (default: 15)'
+)
+parser.add_argument(
+    '--spacing', type=float, required=False, default=10, dest="spacing",
+    help='The distance between neighbouring walls in mm (default: 10)'
+)
+parser.add_argument(
+    '--name', type=str, required=False, default="Plate", dest="name",
+    help='Prefix of the svg file names, the files are named <name>_<sheet>_vorne.svg and <name>_<sheet>_hinten.svg'
+)
+parser.add_argument(
+    '--output_folder', type=str, required=False, default="final_plates_to_laser", dest="output_folder",
+    help='The folder the svg files are saved to (default: final_plates_to_laser)'
+)
+parser.add_argument(
+    '--optimize_toolpath', action='store_true', required=False, dest="optimize_toolpath",
+    help='Reorder the primitives of the sheets to minimize the travel distance of the laser head'
+)
+
+
+class Slot(object):
+    """Position of a wall on a sheet. x and y are the top left corner of the space the wall takes on the sheet. A
+    rotated wall is placed in landscape orientation."""
+
+    def __init__(self, x: float, y: float, rotated: bool = False):
+        self.x = x
+        self.y = y
+        self.rotated = rotated
+
+    def get_mirrored(self, sheet_width: float):
+        """Returns the slot that is behind this slot once the sheet is flipped around its vertical axis"""
+        slot_width = WALL_HEIGHT if self.rotated else WALL_WIDTH
+        return Slot(sheet_width - self.x - slot_width, self.y, self.rotated)
+
+    def get_transform(self) -> str:
+        if self.rotated:
+            return f"translate({self.x + WALL_HEIGHT:g},{self.y:g}) rotate(90)"
+        return f"translate({self.x:g},{self.y:g})"
+
+
+def get_grid_slots(x: float, y: float, width: float, height: float, spacing: float, rotated: bool) -> List[Slot]:
+    """Returns the slots of a regular grid of walls within the given area, left to right, then top to bottom"""
+    slot_width, slot_height = (WALL_HEIGHT, WALL_WIDTH) if rotated else (WALL_WIDTH, WALL_HEIGHT)
+    num_columns = max(0, math.floor((width + spacing) / (slot_width + spacing)))
+    num_rows = max(0, math.floor((height + spacing) / (slot_height + spacing)))
+    return [Slot(x + column * (slot_width + spacing), y + row * (slot_height + spacing), rotated)
+            for row in range(num_rows) for column in range(num_columns)]
+
+
+def get_sheet_slots(sheet_width: float, sheet_height: float, margin: float, spacing: float) -> List[Slot]:
+    """Computes the slots of a sheet so that as many walls as possible fit on it. The usable area is split (vertically
+    or horizontally) into a block of portrait walls and a block of landscape walls, all splits are tried."""
+    width = sheet_width - 2 * margin
+    height = sheet_height - 2 * margin
+    best_slots = []
+    for portrait_first in [True, False]:
+        first_width = WALL_WIDTH if portrait_first else WALL_HEIGHT
+        # vertical split: block of the first orientation left, block of the other orientation right
+        for num_columns in range(0, math.floor((width + spacing) / (first_width + spacing)) + 1):
+            split = num_columns * (first_width + spacing)
+            slots = get_grid_slots(margin, margin, split - spacing, height, spacing, not portrait_first) + \
+                    get_grid_slots(margin + split, margin, width - split, height, spacing, portrait_first)
+            if len(slots) > len(best_slots):
+                best_slots = slots
+        first_height = WALL_HEIGHT if portrait_first else WALL_WIDTH
+        # horizontal split: block of the first orientation on top, block of the other orientation below
+        for num_rows in range(0, math.floor((height + spacing) / (first_height + spacing)) + 1):
+            split = num_rows * (first_height + spacing)
+            slots = get_grid_slots(margin, margin, width, split - spacing, spacing, not portrait_first) + \
+                    get_grid_slots(margin, margin + split, width, height - split, spacing, portrait_first)
+            if len(slots) > len(best_slots):
+                best_slots = slots
+    return best_slots
+
+
+def pack_walls(walls: list, num_slots: int) -> List[list]:
+    """Distributes the walls onto the minimal number of sheets. Double sided walls are packed first, so that as few
+    sheets as possible need to be lasered on the back."""
+    assert num_slots > 0, "Not a single wall fits on the sheet"
+    ordered_walls = [wall for wall in walls if wall["back"] is not None] + \
+                    [wall for wall in walls if wall["back"] is None]
+    return [ordered_walls[idx:idx + num_slots] for idx in range(0, len(ordered_walls), num_slots)]
+
+
+def gen_wall_svg(tag_number: int, slot: Slot, front: bool, svg_tags: dict) -> str:
+    """Returns the svg group of one side of a wall with its big and small tag, the text and (on the front) the cut"""
+    transform = slot.get_transform()
+    if not front:
+        transform += f" rotate(180,{WALL_WIDTH / 2:g},{WALL_HEIGHT / 2:g})"
+    big_scale = BIG_TAG_SIZE / TAG_GRID_SIZE
+    small_scale = SMALL_TAG_SIZE / TAG_GRID_SIZE
+    text = f"AprilTag tagCustom48h12 id{str(tag_number).zfill(3)} &amp; id{str(tag_number + 1).zfill(3)}"
+    wall_svg = [
+        f'<g id="wall{tag_number}" transform="{transform}" inkscape:label="wall{tag_number}">',
+        f'<g id="tag{tag_number}" transform="matrix(0,{-big_scale:g},{big_scale:g},0,{BIG_TAG_POSITION[0]:g},'
+        f'{BIG_TAG_POSITION[1]:g})" inkscape:label="tag{tag_number}">{svg_tags[tag_number]}</g>',
+        f'<g id="tag{tag_number + 1}" transform="matrix(0,{-small_scale:g},{small_scale:g},0,'
+        f'{SMALL_TAG_POSITION[0]:g},{SMALL_TAG_POSITION[1]:g})" inkscape:label="tag{tag_number + 1}">'
+        f'{svg_tags[tag_number + 1]}</g>',
+        f'<text xml:space="preserve" style="{TEXT_STYLE}" x="{TEXT_POSITION[0]:g}" y="{TEXT_POSITION[1]:g}" '
+        f'id="text{tag_number}" inkscape:label="text_{tag_number}" transform="rotate(-90)"><tspan '
+        f'sodipodi:role="line" id="tspan{tag_number}" style="{TSPAN_STYLE}" x="{TEXT_POSITION[0]:g}" '
+        f'y="{TEXT_POSITION[1]:g}">{text}</tspan></text>']
+    if front:
+        # the cut comes after the engraving of the wall
+        wall_svg.append(f'<rect style="{CUT_STYLE}" id="cut{tag_number}" width="{WALL_WIDTH}" '
+                        f'height="{WALL_HEIGHT}" x="0" y="0" inkscape:label="cut{tag_number}" />')
+    wall_svg.append('</g>')
+    return "\n".join(wall_svg)
+
+
+def gen_sheet_svg(walls: list, slots: List[Slot], front: bool, sheet_width: float, sheet_height: float,
+                  svg_tags: dict) -> str:
+    """Returns the svg text of the front or the back of a sheet. On the back only double sided walls are engraved."""
+    sheet_svg = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="no"?>',
+        f'<svg width="{sheet_width:g}mm" height="{sheet_height:g}mm" viewBox="0 0 {sheet_width:g} {sheet_height:g}" '
+        'version="1.1" xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" '
+        'xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd" xmlns="http://www.w3.org/2000/svg">',
+        '<g inkscape:label="plain" inkscape:groupmode="layer" id="layer1">']
+    for wall, slot in zip(walls, slots):
+        tag_number = wall["front"] if front else wall["back"]
+        if tag_number is None:
+            continue
+        if not front:
+            slot = slot.get_mirrored(sheet_width)
+        sheet_svg.append(gen_wall_svg(tag_number, slot, front, svg_tags))
+    sheet_svg.append('</g>\n</svg>\n')
+    return "\n".join(sheet_svg)
+
+
+def get_wall_transforms(sheet_svg: str) -> dict:
+    """Returns the transformation matrix of every wall group of a sheet svg by its id"""
+    root = ET.fromstring(sheet_svg.encode())
+    return {group.get("id"): parse_transform(group.get("transform")) for group in root.iter(GROUP_TAG)
+            if (group.get("id") or "").startswith("wall")}
+
+
+def check_back_positions(sheet: list, front_svg: str, back_svg: str, sheet_width: float):
+    """Checks that the back of every double sided wall is behind its front once the sheet is flipped around its
+    vertical axis, i.e. that the center of the back is the center of the front mirrored at the middle of the sheet"""
+    front_transforms = get_wall_transforms(front_svg)
+    back_transforms = get_wall_transforms(back_svg)
+    center = np.array([WALL_WIDTH / 2, WALL_HEIGHT / 2, 1])
+    for wall in sheet:
+        if wall["back"] is None:
+            continue
+        front_x, front_y = (front_transforms[f"wall{wall['front']}"] @ center)[:2]
+        back_x, back_y = (back_transforms[f"wall{wall['back']}"] @ center)[:2]
+        assert np.allclose([back_x, back_y], [sheet_width - front_x, front_y]), \
+            f"The back {wall['back']} at ({back_x:g}, {back_y:g}) is not behind its front {wall['front']} at " \
+            f"({front_x:g}, {front_y:g})"
+
+
+def read_walls(path: str) -> list:
+    """Reads the json list of walls to produce and checks the tag ids"""
+    with open(path) as f:
+        walls = json.load(f)
+    used_tag_numbers = []
+    for wall in walls:
+        assert "front" in wall and "back" in wall, f"Wall {wall} must have an entry front and back"
+        for tag_number in [wall["front"], wall["back"]]:
+            if tag_number is None:
+                continue
+            assert tag_number % 2 == 0, "Tag numbers must be even"
+            used_tag_numbers.append(tag_number)
+    assert len(used_tag_numbers) == len(set(used_tag_numbers)), "Each tag number must only be there once"
+    return walls
+
+
+def create_sheets(walls: list, sheet_width: float = 1100, sheet_height: float = 550, margin: float = 15,
+                  spacing: float = 10, name: str = "Plate", output_folder: str = "final_plates_to_laser",
+                  optimize_toolpath: bool = False) -> List[str]:
+    """Packs the walls onto as few sheets as possible and saves the svg files of their fronts and (if there are double
+    sided walls on a sheet) backs. Returns the paths of the saved files."""
+    slots = get_sheet_slots(sheet_width, sheet_height, margin, spacing)
+    sheets = pack_walls(walls, len(slots))
+    num_backs = sum(1 for sheet in sheets if any(wall["back"] is not None for wall in sheet))
+    print(f"{len(walls)} walls fit on {len(sheets)} sheets ({len(slots)} walls per sheet), "
+          f"{num_backs} of them need to be lasered on the back.")
+
+    files_to_create = []
+    for idx, sheet in enumerate(sheets):
+        files_to_create.append((sheet, True, os.path.join(os.getcwd(), output_folder, f"{name}_{idx + 1}_vorne.svg")))
+        if any(wall["back"] is not None for wall in sheet):
+            files_to_create.append((sheet, False,
+                                    os.path.join(os.getcwd(), output_folder, f"{name}_{idx + 1}_hinten.svg")))
+    for _, _, path in files_to_create:
+        assert not os.path.isfile(path), f"New svg file {path} that is supposed to be created does alreaddy exist, choose other name"
+
+    svg_tags = {}
+    for wall in walls:
+        for tag_number in [wall["front"], wall["back"]]:
+            if tag_number is not None:
+                svg_tags[tag_number] = read_svg_tag(tag_number)
+                svg_tags[tag_number + 1] = read_svg_tag(tag_number + 1)
+
+    for sheet, front, path in files_to_create:
+        svg_file = gen_sheet_svg(sheet, slots, front, sheet_width, sheet_height, svg_tags)
+        if front:
+            front_svg_file = svg_file
+        else:
+            # the back of a sheet directly follows its front
+            check_back_positions(sheet, front_svg_file, svg_file, sheet_width)
+        travel_distances = save_plate_svg(svg_file, path, optimize_toolpath)
+        print(f"Saved {path}")
+        if travel_distances is not None:
+            report_travel_distance(os.path.basename(path), *travel_distances)
+    return [path for _, _, path in files_to_create]
+
+
+def main():
+    args = parser.parse_args()
+    create_sheets(read_walls(args.walls), args.sheet_width, args.sheet_height, args.margin, args.spacing, args.name,
+                  args.output_folder, args.optimize_toolpath)
+
+
+if __name__ == '__main__':
+    main()
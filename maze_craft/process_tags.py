@@ -1,35 +1,197 @@
 #!/usr/bin/env python3
 import os
+import sys
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from tag_to_svg import convert_tag_file
+from tag_to_svg import SVG_MODES
+from tag_to_svg import CONVERTER_VERSION
+# instrumentation.py is shared with the other folder and lies in the folder above
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import span
+from instrumentation import count
+from instrumentation import count_file_size
+from instrumentation import enable
+from instrumentation import is_enabled
+from instrumentation import merge_records
+from instrumentation import run_in_worker
+
+MANIFEST_FILE_NAME = "manifest.json"
+
+parser = argparse.ArgumentParser(
+    description='Converts the pngs of an AprilTag family into scaled svg files.',
+    epilog='Example: "python process_tags.py --workers=4"'
+)
+parser.add_argument(
+    '--workers', type=int, required=False, default=os.cpu_count(), dest="workers",
+    help='The number of worker processes used for the conversion (default: number of CPUs)'
+)
+parser.add_argument(
+    '--mode', type=str, required=False, default='pixel', dest="svg_mode", choices=SVG_MODES,
+    help='The svg geometry that is written (see tag_to_svg.py)'
+)
+parser.add_argument(
+    '--skip-white', action='store_true', required=False, dest="skip_white",
+    help='Leave out the white grid squares of the tags'
+)
+parser.add_argument(
+    '--force', action='store_true', required=False, dest="force",
+    help='Convert all tags, even the ones that are unchanged according to the manifest in tags_scaled'
+)
+parser.add_argument(
+    '--trace', type=str, required=False, default=None, dest="trace",
+    help='Print the time spent per stage and counters ("summary") or save them as Chrome trace to the given json path '
+         '(see instrumentation.py, like the environment variable MAZE_TRACE)'
+)
+
+
+def get_conversion_jobs(input_folder_path: str, output_folder_path: str, files_to_process: int):
+    """Returns a list of (png path, svg path, svg size) for every tag in the input folder that should be converted.
+    Even tag ids are converted to 140mm sized svg, uneven tag ids to 28mm sized svg."""
+    jobs = []
+    for filename in sorted(os.listdir(input_folder_path)):
+        if not filename.endswith(".png"):
+            continue
+        filename_without_ending = filename.split(".png")[0]
+        counter = int(filename.split("_12_")[1].split(".")[0])
+        if counter >= files_to_process:
+            continue
+        if counter % 2 == 0:  # make large tag
+            svg_size = "140mm"
+        else:  # make small tag
+            svg_size = "28mm"
+        output_filename = f"{filename_without_ending}_{svg_size}.svg"
+        jobs.append((os.path.join(input_folder_path, filename),
+                     os.path.join(output_folder_path, output_filename),
+                     svg_size))
+    return jobs
+
+
+def get_file_hash(path: str) -> str:
+    """Returns the sha256 hash of the content of a file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    count("bytes_read", len(data))
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_cache_key(tag_file: str, svg_size: str, mode: str, skip_white: bool) -> dict:
+    """Returns everything the content of a converted svg depends on"""
+    return {"source": os.path.basename(tag_file),
+            "sha256": get_file_hash(tag_file),
+            "size": svg_size,
+            "mode": mode,
+            "skip_white": skip_white,
+            "converter_version": CONVERTER_VERSION}
+
+
+def read_manifest(output_folder_path: str) -> dict:
+    """Reads the manifest of converted tags (svg file name -> cache key). Returns an empty manifest if there is none."""
+    path = os.path.join(output_folder_path, MANIFEST_FILE_NAME)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, output_folder_path: str):
+    """Writes the manifest of converted tags. The file is replaced atomically so an interrupted run does not leave a
+    broken manifest behind."""
+    path = os.path.join(output_folder_path, MANIFEST_FILE_NAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    count_file_size("bytes_written", path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def report_orphans(manifest: dict, jobs, output_folder_path: str):
+    """Reports svg files in the output folder (or entries in the manifest) that do not belong to any tag that is
+    converted, e.g. because their source png was removed."""
+    expected_files = {os.path.basename(out_file) for _, out_file, _ in jobs}
+    orphans = {file_name for file_name in os.listdir(output_folder_path) if file_name.endswith(".svg")}
+    orphans |= set(manifest.keys())
+    orphans -= expected_files
+    for file_name in sorted(orphans):
+        print(f"Orphaned: {file_name} does not belong to any tag that is converted.")
+
+
+def convert_tags(jobs, workers: int, mode: str = 'pixel', skip_white: bool = False) -> list:
+    """Converts the given jobs in-process on a pool of worker processes. Reports progress and failures per tag and
+    returns the jobs that could not be converted."""
+    failed_jobs = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_in_worker, is_enabled(), convert_tag_file, tag_file, out_file, svg_size, mode,
+                                   skip_white): (tag_file, out_file, svg_size) for tag_file, out_file, svg_size in jobs}
+        for idx, future in enumerate(as_completed(futures)):
+            tag_file, out_file, svg_size = futures[future]
+            try:
+                _, records = future.result()
+                merge_records(records)
+            except Exception as e:
+                failed_jobs.append(futures[future])
+                print(f"[{idx + 1}/{len(jobs)}] Failed to convert {os.path.basename(tag_file)}: {e}")
+            else:
+                print(f"[{idx + 1}/{len(jobs)}] {os.path.basename(tag_file)} -> {os.path.basename(out_file)} "
+                      f"with size: {svg_size}")
+    return failed_jobs
+
 
 def main():
     """Loads tags (png) from AprilTag base folder from Repository
     and stores them as svg (even tags ids are stored as 140mm sized svg and uneven tag ids are stored as 28mm sized
-    svg data in the folder named tags_scaled"""
+    svg data in the folder named tags_scaled.
+    A manifest in tags_scaled keeps track of the source png's hash, the size and the converter version of every svg,
+    so that only new or modified tags are converted again."""
+    args = parser.parse_args()
+    if args.trace is not None:
+        enable(args.trace)
+    with span("process_tags"):
+        process_tags(args.svg_mode, args.skip_white, args.force, args.workers)
+
+
+def process_tags(mode: str, skip_white: bool, force: bool, workers: int):
+    """Converts the new or modified tags of tagCustom48h12 into tags_scaled and updates the manifest (see main)"""
     output_folder = "tags_scaled"
     output_folder_path = os.path.join(os.getcwd(), output_folder)
     input_folder = "tagCustom48h12"
     input_folder_path = os.path.join(os.getcwd(), input_folder)
     files_to_process = 500
 
-    directory = os.fsencode(input_folder_path)
+    with span("check_manifest"):
+        jobs = get_conversion_jobs(input_folder_path, output_folder_path, files_to_process)
+        manifest = read_manifest(output_folder_path)
+        report_orphans(manifest, jobs, output_folder_path)
 
-    for file in os.listdir(directory):
-        filename = os.fsdecode(file)
-        if not filename.endswith(".png"):
-            continue
-        else:
-            filename_without_ending = filename.split(".png")[0]
-            counter = int(filename.split("_12_")[1].split(".")[0])
-            if counter < files_to_process:
-                if counter%2 == 0:  # make large tag
-                    output_filename = f"{filename_without_ending}_140mm.svg"
-                    os.system(f"python3 tag_to_svg.py {os.path.join(os.fsdecode(directory), filename)}"
-                              f" {os.path.join(os.getcwd(),output_folder, output_filename)} --size=140mm")
-                else:  # make small tag
-                    output_filename = f"{filename_without_ending}_28mm.svg"
-                    os.system(f"python3 tag_to_svg.py {os.path.join(os.fsdecode(directory), filename)} "
-                              f"{os.path.join(os.getcwd(),output_folder, output_filename)} --size=28mm")
+        cache_keys = {}
+        stale_jobs = []
+        for tag_file, out_file, svg_size in jobs:
+            file_name = os.path.basename(out_file)
+            cache_keys[file_name] = get_cache_key(tag_file, svg_size, mode, skip_white)
+            if force or manifest.get(file_name) != cache_keys[file_name] or not os.path.isfile(out_file):
+                stale_jobs.append((tag_file, out_file, svg_size))
+        count("tags_skipped", len(jobs) - len(stale_jobs))
+    print(f"{len(jobs) - len(stale_jobs)} of {len(jobs)} tags are unchanged and skipped.")
+
+    failed_jobs = []
+    if stale_jobs:
+        with span("convert_tags"):
+            failed_jobs = convert_tags(stale_jobs, workers, mode, skip_white)
+        failed_files = {os.path.basename(out_file) for _, out_file, _ in failed_jobs}
+        for _, out_file, _ in stale_jobs:
+            file_name = os.path.basename(out_file)
+            if file_name in failed_files:
+                manifest.pop(file_name, None)
+            else:
+                manifest[file_name] = cache_keys[file_name]
+        with span("save_manifest"):
+            save_manifest(manifest, output_folder_path)
+
+    print(f"Converted {len(stale_jobs) - len(failed_jobs)} of {len(stale_jobs)} tags.")
+    assert not failed_jobs, f"{len(failed_jobs)} tags could not be converted. See output above."
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -2,13 +2,25 @@
 import os
 import sys
 import argparse
+import numpy as np
 from PIL import Image
+# instrumentation.py is shared with the other folder and lies in the folder above
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import span
+from instrumentation import count
+from instrumentation import count_file_size
+from instrumentation import is_enabled
 # Copyright (c) 2013-2016, The Regents of The University of Michigan.
 # All rights reserved.
 
 # This is mainly a copy from https://github.com/AprilRobotics/apriltag-imgs
 # But adapted so that the created svg files can be opened properly in inkscape
 
+# Increase whenever the svg output for the same input changes, so that cached conversions are redone
+CONVERTER_VERSION = 1
+SVG_MODES = ['pixel', 'rect', 'path']
+WHITE = '#ffffff'
+
 # Thanks to https://stackoverflow.com/a/54547257
 def dir_path(file_path):
     if os.path.isfile(file_path):
@@ -34,6 +46,15 @@ parser.add_argument(
     '--size', type=str, required=False, default='20mm', dest="svg_size", 
     help='The size (edge length) of the generated svg such as "20mm" "2in" "20px"'
 )
+parser.add_argument(
+    '--mode', type=str, required=False, default='pixel', dest="svg_mode", choices=SVG_MODES,
+    help='"pixel" writes one rect per grid square, "rect" merges runs of same colored grid squares into larger rects, '
+         '"path" writes a single path per color'
+)
+parser.add_argument(
+    '--skip-white', action='store_true', required=False, dest="skip_white",
+    help='Leave out the white grid squares (e.g. for engraving, where white means no material is removed)'
+)
 # TODO add support for a blank margin around the tag
 # parser.add_argument(
 #     '--margin', type=int, required=False, default='0', dest="tag_margin", 
@@ -41,35 +62,106 @@ parser.add_argument(
 # )
 
 
-def gen_apriltag_svg(width, height, pixel_array, size):
-    def gen_rgba(rbga):
-        (_r, _g, _b, _raw_a) = rbga
-        _a = _raw_a / 255
-        return f'rgba({_r}, {_g}, {_b}, {_a})'
-
-    def gen_hex(rbga):
-        (_r, _g, _b, _a) = rbga
-        #print(f"r:{int(_r)}, g:{int(_g)}, b:{int(_b)}, a:{int(_a)}")
-        #hex_code = '#{:02x}{:02x}{:02x}{:02x}'.format(_r, _g , _b, _a )
-        hex_code = '#{:02x}{:02x}{:02x}'.format(_r, _g , _b)
-        #hex_code = rgba_to_hex(_r, _g, _b, _a)
-        return hex_code
-
-    def gen_gridsquare(row_num, col_num, pixel):
-        _rgba = gen_rgba(pixel)
-        _hex = gen_hex(pixel)
-        _id = f'box{row_num}-{col_num}'
-        #return f'\t<rect width="1" height="1" x="{row_num}" y="{col_num}" fill="{_rgba}" style="fill:{_hex}" id="{_id}"/>\n'
-        return f'\t<rect width="1" height="1" x="{row_num}" y="{col_num}" style="fill:{_hex}" id="{_id}"/>\n'
-
-    svg_text = '<?xml version="1.0" standalone="yes"?>\n'
-    svg_text += f'<svg width="{size}" height="{size}" viewBox="0,0,{width},{height}" xmlns="http://www.w3.org/2000/svg">\n'
-    for _y in range(height):
-        for _x in range(width):
-            svg_text += gen_gridsquare(_x, _y, pixel_array[_x, _y])
-    svg_text += '</svg>\n'
-
-    return svg_text
+def read_tag_pixels(tag_file):
+    """Reads an apriltag png file once into an array of shape (height, width, 4) holding the rgba values"""
+    with Image.open(tag_file, 'r') as im:
+        return np.asarray(im.convert('RGBA'))
+
+
+def gen_palette(pixel_array):
+    """Maps the pixels to a per-palette lookup table. Returns the hex codes of the palette and an array of shape
+    (height, width) with the palette index of every grid square. Just like the original svg output, the alpha channel
+    is ignored."""
+    rgb = pixel_array[:, :, :3].astype(np.uint32)
+    codes = (rgb[:, :, 0] << 16) | (rgb[:, :, 1] << 8) | rgb[:, :, 2]
+    palette, labels = np.unique(codes, return_inverse=True)
+    hex_codes = ['#{:06x}'.format(int(code)) for code in palette]
+    return hex_codes, labels.reshape(codes.shape)
+
+
+def gen_merged_rects(labels):
+    """Merges horizontal runs of same colored grid squares and stacks equal runs of consecutive rows on top of each
+    other. Returns the arrays x, y, width, height and palette index of the rects sorted from top left to bottom right."""
+    height, width = labels.shape
+    # a run starts at the beginning of each row and wherever the color changes within a row
+    run_starts = np.ones(labels.shape, dtype=bool)
+    run_starts[:, 1:] = labels[:, 1:] != labels[:, :-1]
+    run_y, run_x = np.nonzero(run_starts)
+    run_ends = np.append(run_x[1:], width)
+    run_ends[np.append(run_y[1:] != run_y[:-1], True)] = width
+    run_w = run_ends - run_x
+    run_color = labels[run_y, run_x]
+
+    # runs of consecutive rows with equal start, width and color form one rect
+    order = np.lexsort((run_y, run_color, run_w, run_x))
+    run_x, run_y, run_w, run_color = run_x[order], run_y[order], run_w[order], run_color[order]
+    new_rect = np.ones(len(order), dtype=bool)
+    new_rect[1:] = ((run_x[1:] != run_x[:-1]) | (run_w[1:] != run_w[:-1]) | (run_color[1:] != run_color[:-1]) |
+                    (run_y[1:] != run_y[:-1] + 1))
+    rect_starts = np.flatnonzero(new_rect)
+    rect_h = np.diff(np.append(rect_starts, len(order)))
+    rect_x, rect_y, rect_w, rect_color = run_x[rect_starts], run_y[rect_starts], run_w[rect_starts], run_color[rect_starts]
+
+    order = np.lexsort((rect_x, rect_y))
+    return rect_x[order], rect_y[order], rect_w[order], rect_h[order], rect_color[order]
+
+
+def iter_apriltag_svg(pixel_array, size, mode='pixel', skip_white=False):
+    """Yields the svg text of an apriltag piece by piece. In mode "pixel" every grid square is written as its own rect,
+    in mode "rect" runs of same colored grid squares are merged into larger rects and in mode "path" a single path is
+    written per color. All modes rasterize identically. With skip_white, white grid squares are left out."""
+    assert mode in SVG_MODES, f"Unknown svg mode {mode}. Choose one of {SVG_MODES}"
+    height, width = pixel_array.shape[:2]
+    hex_codes, labels = gen_palette(pixel_array)
+    skipped_color = hex_codes.index(WHITE) if skip_white and WHITE in hex_codes else -1
+
+    yield '<?xml version="1.0" standalone="yes"?>\n'
+    yield f'<svg width="{size}" height="{size}" viewBox="0,0,{width},{height}" xmlns="http://www.w3.org/2000/svg">\n'
+    if mode == 'pixel':
+        if is_enabled():
+            count("rects", int(np.count_nonzero(labels != skipped_color)))
+        styles = [f'" style="fill:{hex_code}" id="box' for hex_code in hex_codes]
+        for _y in range(height):
+            row = labels[_y].tolist()
+            yield ''.join(f'\t<rect width="1" height="1" x="{_x}" y="{_y}{styles[color]}{_x}-{_y}"/>\n'
+                          for _x, color in enumerate(row) if color != skipped_color)
+    else:
+        rect_x, rect_y, rect_w, rect_h, rect_color = gen_merged_rects(labels)
+        kept = rect_color != skipped_color
+        if is_enabled():
+            count("rects", int(np.count_nonzero(kept)))
+        rects = zip(rect_x[kept].tolist(), rect_y[kept].tolist(), rect_w[kept].tolist(), rect_h[kept].tolist(),
+                    rect_color[kept].tolist())
+        if mode == 'rect':
+            yield ''.join(f'\t<rect width="{_w}" height="{_h}" x="{_x}" y="{_y}" style="fill:{hex_codes[color]}" '
+                          f'id="box{_x}-{_y}"/>\n' for _x, _y, _w, _h, color in rects)
+        else:
+            subpaths_per_color = {}
+            for _x, _y, _w, _h, color in rects:
+                subpaths_per_color.setdefault(color, []).append(f'M{_x},{_y}h{_w}v{_h}h-{_w}z')
+            for color, subpaths in subpaths_per_color.items():
+                _hex = hex_codes[color]
+                yield f'\t<path d="{"".join(subpaths)}" style="fill:{_hex}" id="path{_hex[1:]}"/>\n'
+    yield '</svg>\n'
+
+
+def gen_apriltag_svg(pixel_array, size, mode='pixel', skip_white=False):
+    """Returns the svg text of an apriltag (see iter_apriltag_svg)"""
+    return ''.join(iter_apriltag_svg(pixel_array, size, mode=mode, skip_white=skip_white))
+
+
+def convert_tag_file(tag_file, out_file, svg_size, mode='pixel', skip_white=False):
+    """Converts a single apriltag png file into an svg file of the given size (edge length). The svg text is streamed
+    straight to the output file."""
+    with span("read_tag_pixels"):
+        pixel_array = read_tag_pixels(tag_file)
+        count_file_size("bytes_read", tag_file)
+
+    with span("write_svg"):
+        with open(out_file, 'w') as fp:
+            fp.writelines(iter_apriltag_svg(pixel_array, svg_size, mode=mode, skip_white=skip_white))
+        count_file_size("bytes_written", out_file)
+    count("tags")
 
 def main():
     args = parser.parse_args()
@@ -78,19 +170,7 @@ def main():
     svg_size = args.svg_size
     # tag_margin = args.tag_margin #TODO no support for margin yet
 
-    apriltag_svg = None
-
-    with Image.open(tag_file, 'r') as im:
-
-        width, height = im.size
-        pix_vals = im.load()
-        
-        apriltag_svg = gen_apriltag_svg(width, height, pix_vals, svg_size)
-
-    assert apriltag_svg is not None, 'Error: Failed to create SVG.'
-
-    with open(out_file, 'w') as fp:
-        fp.write(apriltag_svg)
+    convert_tag_file(tag_file, out_file, svg_size, mode=args.svg_mode, skip_white=args.skip_white)
 
     print(f'Output SVG file: {out_file} with size: {svg_size}')
 
@@ -1,8 +1,19 @@
+import os
+import sys
 from typing import Optional
 from typing import List
+from typing import Tuple
 from wall import Wall
 from wall import Placement
-import math
+from tag_store import TagStore
+from maze_graph import MazeGraph
+from maze_map import iter_ascii_lines
+# instrumentation.py is shared with the other folder and lies in the folder above
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import span
+from instrumentation import count
+from instrumentation import traced
+import numpy as np
 
 
 
@@ -21,7 +32,14 @@ class Maze(object):
         self.rows_with_horizontal_walls: Optional[List[List[int]]] = None
         self.rows_with_vertical_walls: Optional[List[List[int]]] = None
 
-        self.walls: Optional[List[Wall]] = []
+        self.tag_store: TagStore = TagStore.empty()
+        # reject layouts with cells that can not be reached from the other cells (see check_input)
+        self.require_connected_cells = False
+
+    @property
+    def walls(self) -> List[Wall]:
+        """The walls of the maze as views over the columnar tag store"""
+        return self.tag_store.get_walls()
 
     def set_number_of_rows(self, num_rows:int):
         self.number_of_rows = num_rows
@@ -39,6 +57,7 @@ class Maze(object):
         self.number_of_rows_vertical_walls = self.number_of_rows
         self.number_of_rows_horizontal_walls = self.number_of_rows + 1
 
+    @traced("check_input")
     def check_input(self) -> bool:
         """When this function is called, the input of the maze is assumed to be finished. This function checks for
         correct input that is
@@ -46,6 +65,7 @@ class Maze(object):
         2. Correct number of walls per rows
         3. Only even wall IDs or -1
         4. No repitions in tag IDs
+        5. All cells are reachable from each other (only with require_connected_cells)
         """
         everything_okay = True
         if not len(self.rows_with_horizontal_walls) == self.number_of_rows_horizontal_walls:
@@ -58,18 +78,17 @@ class Maze(object):
             everything_okay = False
         if not self.check_row_of_walls(self.rows_with_vertical_walls, self.num_vertical_walls_per_row):
             everything_okay = False
-        used_ids = []
-        for row in self.rows_with_horizontal_walls:
-            for tag in row:
-                if tag > -1:
-                    used_ids.append(tag)
-        for row in self.rows_with_vertical_walls:
-            for tag in row:
-                if tag > -1:
-                    used_ids.append(tag)
-        if not len(used_ids) == len(set(used_ids)):
+        used_ids = np.array([tag for row in self.rows_with_horizontal_walls + self.rows_with_vertical_walls
+                             for tag in row], dtype=np.int64)
+        used_ids = used_ids[used_ids > -1]
+        if not len(used_ids) == len(np.unique(used_ids)):
             print("Each ID must only be there once.")
             everything_okay = False
+        if everything_okay and self.require_connected_cells:
+            unreachable_cells = MazeGraph.from_maze(self).get_unreachable_cells()
+            if len(unreachable_cells) > 0:
+                print(f"{len(unreachable_cells)} cells can not be reached from cell (0, 0), e.g. {unreachable_cells[:5]}")
+                everything_okay = False
 
         return everything_okay
 
@@ -92,191 +111,80 @@ class Maze(object):
                     everything_okay = False
         return everything_okay
 
+    def get_wall_arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the placement values, rows, columns and smallest tag IDs of all walls of the layout in the order of
+        the tag store (horizontal walls before vertical walls, each by row and column)"""
+        horizontal_walls = np.array(self.rows_with_horizontal_walls, dtype=np.int64).ravel()
+        horizontal_slots = np.flatnonzero(horizontal_walls != -1)
+        horizontal_rows, horizontal_columns = np.divmod(horizontal_slots, self.num_horizontal_walls_per_row)
+        vertical_walls = np.array(self.rows_with_vertical_walls, dtype=np.int64).ravel()
+        vertical_slots = np.flatnonzero(vertical_walls != -1)
+        vertical_rows, vertical_columns = np.divmod(vertical_slots, self.num_vertical_walls_per_row)
+
+        rows = np.concatenate([horizontal_rows, vertical_rows])
+        columns = np.concatenate([horizontal_columns, vertical_columns])
+        placements = np.repeat([Placement.HORIZONTAL.value, Placement.VERTICAL.value],
+                               [len(horizontal_slots), len(vertical_slots)])
+        smallest_tag_ids = np.concatenate([horizontal_walls[horizontal_slots], vertical_walls[vertical_slots]])
+        return placements, rows, columns, smallest_tag_ids
+
+    @traced("create_walls")
     def create_walls(self):
+        # all walls are created at once from the row and column indices of the walls
+        placements, rows, columns, smallest_tag_ids = self.get_wall_arrays()
+
+        # all walls and tags are kept in one columnar store, self.walls are views over its rows
+        with span("create_tag_store"):
+            self.tag_store = self.create_tag_store(placements, rows, columns, smallest_tag_ids)
+        with span("validate_tags"):
+            assert self.tag_store.validate(), "Tag IDs of the walls overlap. Check the wall inventory."
+        count("walls", len(self.tag_store.walls))
+        count("tags", len(self.tag_store.tags))
+
+    def create_tag_store(self, placements: np.ndarray, rows: np.ndarray, columns: np.ndarray,
+                         smallest_tag_ids: np.ndarray) -> TagStore:
+        """Creates the walls (and their tags) with the given placement values, rows and columns (the index of the wall
+        in its row) in the rows of horizontal or vertical walls. Positions are computed with numpy broadcasting over
+        all walls at once."""
         wall = Wall()
         assert wall.thickness == self.space_between_walls, "Wall thickness is assumed to equal the space_between_walls " \
                                                            "in the position calculations. Here they differ. " \
                                                            "No guarantee for proper results."
-        for row_id, row in enumerate(self.rows_with_horizontal_walls):
-            for tag_index, tag_id in enumerate(row):
-                if tag_id == -1:
-                    continue
-                pos_y = self.space_between_walls + int(wall.width/2) + tag_index * (self.space_between_walls + wall.width)
-                pos_x = row_id * (self.space_between_walls + wall.width)
-                pos_z = self.offset_to_ground + int(wall.height / 2)
-                self.walls.append(Wall(Placement.HORIZONTAL, pos_x = pos_x, pos_y=pos_y, pos_z=pos_z,
-                                       smallest_tag_id=tag_id))
-
-        for row_id, row in enumerate(self.rows_with_vertical_walls):
-            for tag_index, tag_id in enumerate(row):
-                if tag_id == -1:
-                    continue
-                pos_y = tag_index * (self.space_between_walls + wall.width)
-                pos_x = self.space_between_walls + int(wall.width/2) + row_id * (self.space_between_walls + wall.width)
-                pos_z = self.offset_to_ground + int(wall.height / 2)
-                self.walls.append(Wall(Placement.VERTICAL, pos_x=pos_x, pos_y=pos_y, pos_z=pos_z,
-                                       smallest_tag_id=tag_id))
+        pitch = self.space_between_walls + wall.width
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = np.asarray(columns, dtype=np.int64)
+        horizontal = np.asarray(placements) == Placement.HORIZONTAL.value
+        pos_x = np.where(horizontal, rows * pitch, self.space_between_walls + int(wall.width/2) + rows * pitch)
+        pos_y = np.where(horizontal, self.space_between_walls + int(wall.width/2) + columns * pitch, columns * pitch)
+        pos_z = np.full(len(rows), self.offset_to_ground + int(wall.height / 2))
+        return TagStore.from_arrays(placements, pos_x, pos_y, pos_z, smallest_tag_ids, rows, columns)
 
     def simple_plot(self):
+        """Prints the plain ascii map of the maze (see maze_map.py)"""
         print("Your maze should look like this.")
         print("")
-        ksy_space = "          "
-        ksy = " ---> y \n|\n|\nv\nx\n"
-        maze_string = ""
-        maze_string += ksy
-        vert_wall = "|"
-        hor_placeholder = " "
-        hor_wall = "----"
-        no_hor_wall = "    "
-        no_vert_wall = " "
-        vert_placeholder = "    "
-        for idx in range(0, max(self.number_of_rows_horizontal_walls, self.number_of_rows_vertical_walls)):
-            if idx < self.number_of_rows_horizontal_walls:
-                maze_string += ksy_space
-                maze_string += hor_placeholder
-                for tag in self.rows_with_horizontal_walls[idx]:
-                    if tag != -1:
-                        maze_string += hor_wall
-                    else:
-                        maze_string += no_hor_wall
-                    maze_string += hor_placeholder
-                maze_string += "\n"
-
-            if idx < self.number_of_rows_vertical_walls:
-                maze_string += ksy_space
-                for tag in self.rows_with_vertical_walls[idx]:
-                    if tag != -1:
-                        maze_string += vert_wall
-                    else:
-                        maze_string += no_vert_wall
-                    maze_string += vert_placeholder
-                maze_string += "\n"
-        print(maze_string)
-
-
-    def advanced_plot(self):
-        user_input = input("Do you want a 3D plot of your maze (matplotlib package must be installed)? (y or n):")
-
-        if user_input == "y":
-            import matplotlib
-            import matplotlib.pyplot as plt
-            matplotlib.use('TkAgg')
-            from matplotlib.patches import PathPatch
-            from matplotlib.patches import Rectangle
-            from matplotlib.text import TextPath
-            from matplotlib.transforms import Affine2D
-            import mpl_toolkits.mplot3d.art3d as art3d
-            matlib_version = matplotlib.__version__.split(".")
-            if int(matlib_version[0]) < 3 or (int(matlib_version[0]) == 3 and int(matlib_version[1]) < 8):
-                print(f"Your matplotlib version is {matplotlib.__version__}")
-                print("You need ad least matplotlib version 3.8.0.")
-                print("Continue without 3D plot.")
+        for line in iter_ascii_lines(self.rows_with_horizontal_walls, self.rows_with_vertical_walls):
+            print(line)
+        print("")
+
+
+    def advanced_plot(self, save_path: Optional[str] = None):
+        """Plots the maze in 3D (see maze_plot.py). Without save_path the user is asked first and the plot is shown,
+        with save_path it is rendered offscreen and saved without any prompt."""
+        if save_path is None:
+            user_input = input("Do you want a 3D plot of your maze (matplotlib package must be installed)? (y or n):")
+            if user_input != "y":
                 return
 
-            def text3d(ax, xyz, s, zdir="z", size=None, angle=0, **kwargs):
-                """
-                Copyright: https://matplotlib.org/stable/gallery/mplot3d/pathpatch3d.html#sphx-glr-gallery-mplot3d-pathpatch3d-py
-                Plots the string *s* on the axes *ax*, with position *xyz*, size *size*,
-                and rotation angle *angle*. *zdir* gives the axis which is to be treated as
-                the third dimension. *usetex* is a boolean indicating whether the string
-                should be run through a LaTeX subprocess or not.  Any additional keyword
-                arguments are forwarded to `.transform_path`.
-
-                Note: zdir affects the interpretation of xyz.
-                """
-                x, y, z = xyz
-                if zdir == "y":
-                    xy1, z1 = (x, z), y
-                    zdir = (0,1,0)
-                elif zdir == "x":
-                    xy1, z1 = (y, z), x
-                    zdir = (1, 0, 0)
-                elif zdir == "z":
-                    xy1, z1 = (x, y), z
-                    zdir = (0,0,1)
-                else:
-                    assert 1 == 0, "zdir not defined"
-
-                text_path = TextPath((0, 0), s, size=size, usetex=False)
-                trans = Affine2D().rotate(angle).translate(xy1[0], xy1[1])
-
-                p1 = PathPatch(trans.transform_path(text_path), edgecolor="k", facecolor="k", **kwargs)
-                ax.add_patch(p1)
-                art3d.pathpatch_2d_to_3d(p1, z=z1, zdir=zdir)
-            fig = plt.figure()
-            ax = fig.add_subplot(projection='3d')
-
-            ris_green = (0.0, 157/255, 129/255, 1.0) # RGBA
-            cream = (209/255, 240/255, 177/255, 1.0) # RGBA
-            light_blue = (0/255, 105/255, 146/255, 1.0) # RGBA
-            dark_blue = (39/255, 71/255, 110/255, 1.0) # RGBA
-
-            for wall in self.walls:
-                # plot the side of the wall with the smallest id
-                if wall.placement == Placement.HORIZONTAL:
-                    r1 = Rectangle((wall.pos_y - (wall.width / 2),
-                                   wall.pos_z - (wall.height / 2)),
-                                   wall.width,
-                                   wall.height,
-                                   color=ris_green)
-                    if wall.smallest_tag_id >= 0:
-                        text3d(ax, (wall.pos_x-50, wall.pos_y, 0), str(wall.tags[0].tag_id), zdir="z", angle=-math.pi/2, size=40, zorder=10)
-                    else:
-                        text3d(ax, (wall.pos_x + 50, wall.pos_y, 0), str(wall.tags[0].tag_id), zdir="z",
-                               angle=math.pi / 2, size=40, zorder=10)
-                    r2 = Rectangle((wall.pos_y - (wall.width / 2),
-                                    wall.pos_z - (wall.height / 2)),
-                                   wall.width,
-                                   wall.height,
-                                   color=cream)
-                    if len(wall.tags) > 2:
-                        if wall.smallest_tag_id >= 0:
-                            text3d(ax, (wall.pos_x+50, wall.pos_y, 0), str(wall.tags[2].tag_id), zdir="z", angle=math.pi/2, size=40, zorder=10)
-                        else:
-                            text3d(ax, (wall.pos_x - 50, wall.pos_y, 0), str(wall.tags[2].tag_id), zdir="z",
-                                   angle=-math.pi / 2, size=40, zorder=10)
-                elif wall.placement == Placement.VERTICAL:
-                    r1 = Rectangle((wall.pos_x - (wall.width / 2),
-                                    wall.pos_z - (wall.height / 2)),
-                                   wall.width,
-                                   wall.height,
-                                   color=light_blue)
-                    if wall.smallest_tag_id >= 0:
-                        text3d(ax, (wall.pos_x, wall.pos_y-50, 0), str(wall.tags[0].tag_id), zdir="z", size=40, zorder=10)
-                    else:
-                        text3d(ax, (wall.pos_x, wall.pos_y + 50, 0), str(wall.tags[0].tag_id), zdir="z", angle=math.pi,
-                               size=40, zorder=10)
-                    r2 = Rectangle((wall.pos_x - (wall.width / 2),
-                                    wall.pos_z - (wall.height / 2)),
-                                   wall.width,
-                                   wall.height,
-                                   color=dark_blue)
-                    if len(wall.tags) > 2:
-                        if wall.smallest_tag_id >= 0:
-                            text3d(ax, (wall.pos_x, wall.pos_y+50, 0), str(wall.tags[2].tag_id), zdir="z", angle=math.pi, size=40, zorder=10)
-                        else:
-                            text3d(ax, (wall.pos_x, wall.pos_y - 50, 0), str(wall.tags[2].tag_id), zdir="z", size=40,
-                                   zorder=10)
-                ax.add_patch(r1)
-                ax.add_patch(r2)
-                if wall.placement == Placement.HORIZONTAL:
-                    art3d.pathpatch_2d_to_3d(r1, z=wall.pos_x, zdir="x")
-                    art3d.pathpatch_2d_to_3d(r2, z=wall.pos_x+wall.thickness, zdir="x")
-                elif wall.placement == Placement.VERTICAL:
-                    art3d.pathpatch_2d_to_3d(r1, z=wall.pos_y, zdir="y")
-                    art3d.pathpatch_2d_to_3d(r2, z=wall.pos_y + wall.thickness, zdir="y")
-            x_size = (self.number_of_rows+1)*self.walls[0].width
-            y_size = (self.number_of_columns+1)*self.walls[0].width
-            z_size = int(self.walls[0].height*1.5)
-            ax.set_xlim(0, x_size)
-            ax.set_ylim(0, y_size)
-            ax.set_zlim(0, z_size)
-            ax.set_xlabel("x")
-            ax.set_ylabel("y")
-            ax.set_zlabel("z")
-
-            ax.set_box_aspect((1, y_size/x_size, z_size/x_size))
-            plt.show()
+        import matplotlib
+        matlib_version = matplotlib.__version__.split(".")
+        if int(matlib_version[0]) < 3 or (int(matlib_version[0]) == 3 and int(matlib_version[1]) < 8):
+            print(f"Your matplotlib version is {matplotlib.__version__}")
+            print("You need ad least matplotlib version 3.8.0.")
+            print("Continue without 3D plot.")
+            return
+        from maze_plot import plot_maze
+        plot_maze(self, save_path)
 
 
 
@@ -1,9 +1,77 @@
 from maze import Maze
 from typing import Optional
 from typing import List
+from typing import Tuple
 import os
+import sys
+import csv
+import json
+import argparse
+import numpy as np
 from wall import Tag
 from wall import Orientation
+from wall_inventory import WallInventory
+from wall_inventory import VIRTUAL_WALL_INVENTORY_PATH
+from wall_inventory import set_wall_inventory
+from tag_lookup import save_lookup_table
+from tag_lookup import get_lookup_file_path
+from visibility import save_visibility_table
+from visibility import get_visibility_file_path
+# instrumentation.py is shared with the other folder and lies in the folder above
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrumentation import span
+from instrumentation import count
+from instrumentation import count_file_size
+from instrumentation import enable
+from instrumentation import traced
+
+LAYOUT_FILE_ENDINGS = [".json", ".csv"]
+
+# placeholders in do_not_touch/empty_tags.yaml
+TAG_BUNDLE_MARKER = "add_tag_bundle_description_here"
+STANDALONE_TAGS_MARKER = "add_standalone_tag_description_here"
+# number of tags that are converted to yaml lines at once when writing the yaml file
+YAML_CHUNK_SIZE = 10000
+
+TAG_SIZE_STRINGS = {140: "0.084",   # the yaml file takes the inner size of the tag in m
+                    28: "0.0168"}   # the yaml file takes the inner size of the tag in m
+ORIENTATION_STRINGS = {Orientation.NORTH.value: "qw: 0.5, qx: 0.5, qy: -0.5, qz: -0.5",
+                       Orientation.WEST.value: "qw: 0.7071068, qx: 0.7071068, qy: 0, qz: 0",
+                       Orientation.SOUTH.value: "qw: 0.5, qx: 0.5, qy: 0.5, qz: 0.5",
+                       Orientation.EAST.value: "qw: 0, qx: 0, qy: 0.7071068, qz: 0.7071068"}
+
+parser = argparse.ArgumentParser(
+    description='Generates the AprilTag Tag Bundle YAML file of a maze. Without --layout the maze is given '
+                'interactively.',
+    epilog='Example: "python maze_builder.py --layout=layouts/ --output_folder=output"'
+)
+parser.add_argument(
+    '--layout', type=str, required=False, default=None, dest="layout",
+    help='Path to a layout file (json or csv) or to a folder of layout files. The mazes are created without any '
+         'prompt and saved as <name of layout file>.yaml in the output folder.'
+)
+parser.add_argument(
+    '--output_folder', type=str, required=False, default="output", dest="output_folder",
+    help='The folder the yaml files of layout files are saved to (default: output)'
+)
+parser.add_argument(
+    '--virtual', action='store_true', required=False, dest="virtual",
+    help='Use the virtual wall inventory (do_not_touch/wall_inventory_virtual.json) for simulated mazes'
+)
+parser.add_argument(
+    '--connected', action='store_true', required=False, dest="connected",
+    help='Reject mazes with cells that can not be reached from the other cells'
+)
+parser.add_argument(
+    '--visibility', type=int, required=False, default=None, dest="heading_bins",
+    help='Also save which tags are visible from every cell with the given number of heading bins as '
+         '<name of layout file>.visibility.npz (see visibility.py), only for layout files'
+)
+parser.add_argument(
+    '--trace', type=str, required=False, default=None, dest="trace",
+    help='Print the time spent per stage and counters ("summary") or save them as Chrome trace to the given json path '
+         '(see instrumentation.py, like the environment variable MAZE_TRACE)'
+)
 
 def new_line():
     print("")
@@ -16,48 +84,32 @@ def read_yaml_file(path:str) -> str:
     assert os.path.isfile(path), f"Given path {path} does not exist"
     with open(path) as f:
         s = f.read()
+    count_file_size("bytes_read", path)
     return s
 
-def save_yaml_file(string_to_save:str, path:str):
-    """Writes text to a path"""
-    assert not os.path.isfile(path), "Filename that you want to use to save already exits. Choose another one."
-    with open(path, 'w') as f:
-        f.write(string_to_save)
-
-def replace_string_in_string(complete_string:str, old_string:str, new_string:str) -> str:
-    """Replaces a text within a string"""
-    assert old_string in complete_string, f"Expected string {old_string} not found in complete string"
-    return complete_string.replace(old_string, new_string)
+def split_template(template: str, markers: List[str]) -> Tuple[List[str], List[str]]:
+    """Splits a template at the given markers (each is expected exactly once). Returns the texts around the markers
+    and the markers in the order they appear in the template, i.e. texts[0], markers[0], texts[1], ..., texts[-1]."""
+    for marker in markers:
+        assert template.count(marker) == 1, f"Expected string {marker} exactly once in the template"
+    markers = sorted(markers, key=template.index)
+    texts = []
+    position = 0
+    for marker in markers:
+        marker_position = template.index(marker)
+        texts.append(template[position:marker_position])
+        position = marker_position + len(marker)
+    texts.append(template[position:])
+    return texts, markers
 
 def get_yaml_line_for(tag: Tag, last_tag=False, standalone=False) -> str:
-    if tag.size.x == 140:
-        size = "0.084"   # the yaml file takes the inner size of the tag in m
-    elif tag.size.x == 28:
-        size = "0.0168"  # the yaml file takes the inner size of the tag in m
-    else:
-        assert 1 == 0, f"Tag size {tag.size} not known."
-    id = tag.tag_id
-    x = tag.position.x/1000  # tag file takes position in m
-    y = tag.position.y/1000  # tag file takes position in m
-    z = tag.position.z/1000  # tag file takes position in m
-
-    if tag.orientation == Orientation.NORTH:
-        orientation_string = "qw: 0.5, qx: 0.5, qy: -0.5, qz: -0.5"
-    elif tag.orientation == Orientation.WEST:
-        orientation_string = "qw: 0.7071068, qx: 0.7071068, qy: 0, qz: 0"
-    elif tag.orientation == Orientation.SOUTH:
-        orientation_string = "qw: 0.5, qx: 0.5, qy: 0.5, qz: 0.5"
-    elif tag.orientation == Orientation.EAST:
-        orientation_string = "qw: 0, qx: 0, qy: 0.7071068, qz: 0.7071068"
-    else:
-        assert 1 == 0, "Unknown orientation"
+    return get_yaml_line_for_values(tag.tag_id, tag.position.x, tag.position.y, tag.position.z, tag.orientation.value,
+                                    tag.size.x, last_tag=last_tag, standalone=standalone)
 
-    if standalone:
-        # only id, size and name for standalone tags
-        tag_string = f"{{id: {id}, size: {size}, name: tag_{id}}}"
-    else:
-        # x,y,z-position and orientation as extra entries for tag_bundle
-        tag_string = f"{{id: {id}, size: {size}, x: {x}, y: {y}, z: {z}, {orientation_string}}}"
+def get_yaml_line_for_values(id: int, pos_x: int, pos_y: int, pos_z: int, orientation: int, tag_size: int,
+                             last_tag=False, standalone=False) -> str:
+    """Returns the yaml line of a tag given by the values of its row in the tag store (see tag_store.py)"""
+    tag_string = get_yaml_entry_for_values(id, pos_x, pos_y, pos_z, orientation, tag_size, standalone)
     if last_tag:
         tag_string += "\n"
     else:
@@ -65,6 +117,106 @@ def get_yaml_line_for(tag: Tag, last_tag=False, standalone=False) -> str:
 
     return tag_string
 
+def get_yaml_entry_for_values(id: int, pos_x: int, pos_y: int, pos_z: int, orientation: int, tag_size: int,
+                              standalone=False) -> str:
+    """Returns the yaml entry of a tag without the separator at the end of the line"""
+    assert tag_size in TAG_SIZE_STRINGS, f"Tag size {tag_size} not known."
+    size = TAG_SIZE_STRINGS[tag_size]
+    if standalone:
+        # only id, size and name for standalone tags
+        return f"{{id: {id}, size: {size}, name: tag_{id}}}"
+
+    assert orientation in ORIENTATION_STRINGS, "Unknown orientation"
+    x = pos_x/1000  # tag file takes position in m
+    y = pos_y/1000  # tag file takes position in m
+    z = pos_z/1000  # tag file takes position in m
+    # x,y,z-position and orientation as extra entries for tag_bundle
+    return f"{{id: {id}, size: {size}, x: {x}, y: {y}, z: {z}, {ORIENTATION_STRINGS[orientation]}}}"
+
+def get_yaml_entries(tags, standalone=False) -> List[str]:
+    """Returns the yaml entries (see get_yaml_entry_for_values) of the tags of a tag store. Converting the positions to
+    text is the slow part, so every distinct coordinate is converted only once."""
+    size_strings = [TAG_SIZE_STRINGS.get(size) for size in tags["size"].tolist()]
+    assert None not in size_strings, f"Tag size {tags['size'][size_strings.index(None)]} not known."
+    if standalone:
+        # only id, size and name for standalone tags
+        return [f"{{id: {tag_id}, size: {size}, name: tag_{tag_id}}}"
+                for tag_id, size in zip(tags["tag_id"].tolist(), size_strings)]
+
+    orientation_strings = [ORIENTATION_STRINGS.get(orientation) for orientation in tags["orientation"].tolist()]
+    assert None not in orientation_strings, "Unknown orientation"
+    coordinates, indices = np.unique(np.stack([tags["x"], tags["y"], tags["z"]]), return_inverse=True)
+    # the tag file takes positions in m
+    coordinate_strings = [str(coordinate / 1000) for coordinate in coordinates.tolist()]
+    x_indices, y_indices, z_indices = indices.reshape(3, -1).tolist()
+    return [f"{{id: {tag_id}, size: {size}, x: {coordinate_strings[x]}, y: {coordinate_strings[y]}, "
+            f"z: {coordinate_strings[z]}, {orientation}}}"
+            for tag_id, size, x, y, z, orientation in zip(tags["tag_id"].tolist(), size_strings, x_indices,
+                                                          y_indices, z_indices, orientation_strings)]
+
+def iter_yaml_lines(tags, standalone=False):
+    """Yields the yaml lines of all tags of a tag store (see tag_store.py) in chunks of YAML_CHUNK_SIZE tags, so that
+    only one chunk is held in memory at a time. Every line but the last ends with a comma."""
+    num_tags = len(tags)
+    for start in range(0, num_tags, YAML_CHUNK_SIZE):
+        # the chunk is yielded outside of the span, so writing it is not counted as formatting
+        with span("format_yaml"):
+            entries = get_yaml_entries(tags[start:start + YAML_CHUNK_SIZE], standalone)
+            last_chunk = start + YAML_CHUNK_SIZE >= num_tags
+            lines = ",\n".join(entries) + ("\n" if last_chunk else ",\n")
+        yield lines
+
+def read_yaml_template() -> Tuple[List[str], List[str]]:
+    """Reads the yaml template and splits it at its markers (see split_template)"""
+    template = read_yaml_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "do_not_touch",
+                                           "empty_tags.yaml"))
+    return split_template(template, [TAG_BUNDLE_MARKER, STANDALONE_TAGS_MARKER])
+
+def write_maze_yaml(tags, save_path: str, template: Optional[Tuple[List[str], List[str]]] = None):
+    """Writes the tag bundle yaml of the tags of a tag store (see tag_store.py) to save_path (an existing file is
+    replaced). The template's text and the lines of the tags are streamed to the file chunk by chunk. Callers that
+    write many mazes pass the template from read_yaml_template, otherwise it is read for every file."""
+    yaml_lines = {TAG_BUNDLE_MARKER: iter_yaml_lines(tags, standalone=False),
+                  STANDALONE_TAGS_MARKER: iter_yaml_lines(tags, standalone=True)}
+    write_yaml_lines(yaml_lines, save_path, template)
+
+def write_yaml_lines(yaml_lines: dict, save_path: str, template: Optional[Tuple[List[str], List[str]]] = None):
+    """Writes the yaml template to save_path with the yaml lines (an iterable of texts per marker) at its markers"""
+    texts, markers = template if template is not None else read_yaml_template()
+    with open(save_path, 'w') as f:
+        for text, marker in zip(texts, markers):
+            f.write(text)
+            f.writelines(yaml_lines[marker])
+        f.write(texts[-1])
+    count_file_size("bytes_written", save_path)
+
+def read_layout_file(path: str) -> Tuple[List[List[int]], List[List[int]]]:
+    """Reads the tag IDs of a maze layout (the same IDs that are given interactively, -1 for missing walls) and returns
+    the rows with horizontal walls and the rows with vertical walls.
+    A json layout is {"horizontal_walls": [[...], ...], "vertical_walls": [[...], ...]}.
+    A csv layout has one row of walls per line (separated by commas or spaces) in the order they are asked for
+    interactively: horizontal walls no. 1, vertical walls no. 1, horizontal walls no. 2, ..., horizontal walls no. n+1.
+    Empty lines and lines starting with # are ignored."""
+    assert os.path.isfile(path), f"Given path {path} does not exist"
+    count_file_size("bytes_read", path)
+    if path.endswith(".json"):
+        with open(path) as f:
+            layout = json.load(f)
+        return layout["horizontal_walls"], layout["vertical_walls"]
+    assert path.endswith(".csv"), f"Layout file {path} must be a json or csv file"
+    with open(path, newline='') as f:
+        rows = [[int(val) for val in " ".join(line).split()] for line in csv.reader(f)
+                if line and not line[0].strip().startswith("#") and " ".join(line).strip()]
+    return rows[0::2], rows[1::2]
+
+def get_layout_files(path: str) -> List[str]:
+    """Returns the layout file or all layout files (sorted) of a folder"""
+    if os.path.isdir(path):
+        return [os.path.join(path, file_name) for file_name in sorted(os.listdir(path))
+                if os.path.splitext(file_name)[1] in LAYOUT_FILE_ENDINGS]
+    assert os.path.isfile(path), f"Given path {path} does not exist"
+    return [path]
+
 def get_positive_interger_input(message:str) -> int:
     """Asks for a user input being a positive integer"""
     while True:
@@ -196,7 +348,21 @@ class MazeBuilder(object):
         self.maze.rows_with_horizontal_walls = tag_ids_horizontal_walls
         self.maze.rows_with_vertical_walls = tag_ids_vertical_walls
 
-    def save_maze_as_yaml(self):
+    @traced("load_maze")
+    def load_maze_from_file(self, path: str):
+        """Reads the layout of the maze from a layout file (see read_layout_file) instead of asking the user"""
+        with span("read_layout"):
+            rows_with_horizontal_walls, rows_with_vertical_walls = read_layout_file(path)
+        assert len(rows_with_horizontal_walls) > 0 and len(rows_with_horizontal_walls[0]) > 0, \
+            f"Layout file {path} does not contain any horizontal walls"
+        self.maze.set_number_of_rows(len(rows_with_vertical_walls))
+        self.maze.set_number_of_columns(len(rows_with_horizontal_walls[0]))
+        self.maze.rows_with_horizontal_walls = rows_with_horizontal_walls
+        self.maze.rows_with_vertical_walls = rows_with_vertical_walls
+        assert self.maze.check_input(), f"The tag IDs in layout file {path} are not correct. See output above."
+        self.maze.create_walls()
+
+    def get_save_path_from_user(self) -> str:
         while True:
             while True:
                 save_name = input("Type in name of YAML file (no spaces)")
@@ -211,32 +377,73 @@ class MazeBuilder(object):
             if os.path.isfile(save_path):
                 print("Name does already exist. Please choose other name.")
             else:
-                break
-
-        maze_yaml_text = ""
-        standalone_yaml_text = ""
-
-        for wall_idx, wall in enumerate(self.maze.walls):
-            for tag_idx, tag in enumerate(wall.tags):
-                # text for tag_bundle
-                maze_yaml_text += get_yaml_line_for(tag, last_tag=(wall_idx==len(self.maze.walls)-1 and tag_idx == len(wall.tags)-1), standalone=False)
-                # text for standalone_tags
-                standalone_yaml_text += get_yaml_line_for(tag, last_tag=(wall_idx==len(self.maze.walls)-1 and tag_idx == len(wall.tags)-1), standalone=True)
+                return save_path
+
+    @traced("save_maze_as_yaml")
+    def save_maze_as_yaml(self, save_path: Optional[str] = None):
+        """Saves the tag bundle yaml of the maze. Without save_path the user is asked for a name."""
+        if save_path is None:
+            save_path = self.get_save_path_from_user()
+
+        assert not os.path.isfile(save_path), "Filename that you want to use to save already exits. Choose another one."
+        with span("write_yaml"):
+            write_maze_yaml(self.maze.tag_store.tags, save_path)
+        # table of all tags indexed by tag ID for the localization (see tag_lookup.py)
+        with span("save_lookup_table"):
+            save_lookup_table(self.maze.tag_store, self.maze.number_of_rows, self.maze.number_of_columns,
+                              get_lookup_file_path(save_path))
+            count_file_size("bytes_written", get_lookup_file_path(save_path))
 
-        file_content = read_yaml_file(os.path.join(os.getcwd(), "do_not_touch", "empty_tags.yaml"))
-
-        file_content = replace_string_in_string(file_content, "add_tag_bundle_description_here", maze_yaml_text)
-        file_content = replace_string_in_string(file_content, "add_standalone_tag_description_here", standalone_yaml_text)
+        print(f"Maze yaml file was saved to {save_path}.")
 
-        save_yaml_file(file_content, save_path)
 
-        print(f"Maze yaml file was saved to {save_path}.")
 
+def build_mazes_from_files(layout_path: str, output_folder: str, heading_bins: Optional[int] = None,
+                           connected: bool = False):
+    """Creates the yaml files of a layout file or of all layout files in a folder without any prompt. A broken layout
+    does not stop the others, all failures are reported at the end. With heading_bins the visibility tables of the
+    mazes are saved next to the yaml files as well. With connected layouts with unreachable cells are broken."""
+    layout_files = get_layout_files(layout_path)
+    output_folder_path = os.path.join(os.getcwd(), output_folder)
+    os.makedirs(output_folder_path, exist_ok=True)
+    failed_files = []
+    for idx, layout_file in enumerate(layout_files):
+        save_name = os.path.splitext(os.path.basename(layout_file))[0] + ".yaml"
+        try:
+            maze_builder = MazeBuilder()
+            maze_builder.init_maze()
+            maze_builder.maze.require_connected_cells = connected
+            maze_builder.load_maze_from_file(layout_file)
+            maze_builder.save_maze_as_yaml(os.path.join(output_folder_path, save_name))
+            if heading_bins is not None:
+                with span("save_visibility_table"):
+                    save_visibility_table(maze_builder.maze,
+                                          get_visibility_file_path(os.path.join(output_folder_path, save_name)),
+                                          heading_bins)
+            count("mazes")
+        except (AssertionError, ValueError, KeyError) as e:
+            failed_files.append(layout_file)
+            print(f"[{idx + 1}/{len(layout_files)}] Failed to build maze of {layout_file}: {e}")
+        else:
+            print(f"[{idx + 1}/{len(layout_files)}] {os.path.basename(layout_file)} -> {save_name}")
+    print(f"Built {len(layout_files) - len(failed_files)} of {len(layout_files)} mazes.")
+    assert not failed_files, f"{len(failed_files)} layouts could not be built. See output above."
 
 
 def main():
+    args = parser.parse_args()
+    if args.trace is not None:
+        enable(args.trace)
+    if args.virtual:
+        set_wall_inventory(WallInventory.from_file(VIRTUAL_WALL_INVENTORY_PATH))
+    if args.layout is not None:
+        with span("build_mazes"):
+            build_mazes_from_files(args.layout, args.output_folder, args.heading_bins, args.connected)
+        return
+
     maze_builder = MazeBuilder()
     maze_builder.init_maze()
+    maze_builder.maze.require_connected_cells = args.connected
     maze_builder.get_maze_parameters_from_user()
     maze_builder.save_maze_as_yaml()
     print("End of program. Thanks and see you soon.")
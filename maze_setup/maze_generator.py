@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import argparse
+from typing import List
+from typing import Optional
+from typing import Tuple
+import numpy as np
+from maze import Maze
+from wall import Placement
+from maze_builder import get_yaml_entries
+from maze_builder import read_yaml_template
+from maze_builder import write_yaml_lines
+from maze_builder import TAG_BUNDLE_MARKER
+from maze_builder import STANDALONE_TAGS_MARKER
+from wall_inventory import WallInventory
+from wall_inventory import VIRTUAL_WALL_INVENTORY_PATH
+from wall_inventory import get_wall_inventory
+from wall_inventory import set_wall_inventory
+from wall_allocator import INNER
+from wall_allocator import FRONT_ONLY
+from wall_allocator import BACK_ONLY
+from wall_allocator import allocate_wall_ids
+
+# Generates random maze layouts that can be built from the wall inventory. The maze is always closed by walls at its
+# border. "perfect" mazes have exactly one route between any two cells (randomized Kruskal), "braid" mazes start as
+# perfect maze and then remove a wall of each dead end with the braid probability, which creates loops.
+# The walls inside the maze are seen from both sides and get double sided walls, the walls at the border are only seen
+# from inside and get single sided walls whose tags look into the maze (see wall_allocator.py).
+
+ALGORITHMS = ["perfect", "braid"]
+# number of mazes whose walls are created and whose yaml entries are formatted at once
+BATCH_SIZE = 256
+
+parser = argparse.ArgumentParser(
+    description='Generates random maze layouts from the wall inventory and saves their tag bundle yaml and layout '
+                'files.',
+    epilog='Example: "python maze_generator.py --rows=4 --columns=4 --count=100 --algorithm=braid --seed=7"'
+)
+parser.add_argument(
+    '--rows', type=int, required=False, default=4, dest="rows",
+    help='Number of rows of the mazes (default: 4)'
+)
+parser.add_argument(
+    '--columns', type=int, required=False, default=4, dest="columns",
+    help='Number of columns of the mazes (default: 4)'
+)
+parser.add_argument(
+    '--count', type=int, required=False, default=1, dest="count",
+    help='Number of mazes (default: 1)'
+)
+parser.add_argument(
+    '--algorithm', type=str, required=False, default="perfect", choices=ALGORITHMS, dest="algorithm",
+    help='perfect: one route between any two cells, braid: perfect maze with dead ends removed (default: perfect)'
+)
+parser.add_argument(
+    '--braid', type=float, required=False, default=1.0, dest="braid",
+    help='Probability that a dead end is removed for the braid algorithm (default: 1.0)'
+)
+parser.add_argument(
+    '--seed', type=int, required=False, default=0, dest="seed",
+    help='Seed of the random generator, maze number i of a seed is always the same (default: 0)'
+)
+parser.add_argument(
+    '--output_folder', type=str, required=False, default="output", dest="output_folder",
+    help='The folder the mazes are saved to as maze_<i>.yaml and maze_<i>.json (default: output)'
+)
+parser.add_argument(
+    '--virtual', action='store_true', required=False, dest="virtual",
+    help='Use the virtual wall inventory (do_not_touch/wall_inventory_virtual.json) for mazes that are larger than '
+         'the physical inventory'
+)
+
+
+def find_root(parents: List[int], cell: int) -> int:
+    while parents[cell] != cell:
+        parents[cell] = parents[parents[cell]]
+        cell = parents[cell]
+    return cell
+
+
+class MazeGenerator(object):
+    """Generates the wall rows of random mazes of one size. The slots of the walls and the inventory are prepared once,
+    so that generating a maze only draws the random walls and IDs."""
+
+    def __init__(self, number_of_rows: int, number_of_columns: int, algorithm: str = "perfect", braid: float = 1.0):
+        assert algorithm in ALGORITHMS, f"Algorithm must be one of {ALGORITHMS}"
+        self.number_of_rows = number_of_rows
+        self.number_of_columns = number_of_columns
+        self.algorithm = algorithm
+        self.braid = braid
+
+        # the inner walls as indices into the flattened horizontal walls (followed by the vertical walls) and the two
+        # cells they separate
+        num_horizontal_walls = (number_of_rows + 1) * number_of_columns
+        cells = np.arange(number_of_rows * number_of_columns).reshape(number_of_rows, number_of_columns)
+        horizontal_slots = np.arange(num_horizontal_walls).reshape(number_of_rows + 1, number_of_columns)
+        vertical_slots = num_horizontal_walls + np.arange(number_of_rows * (number_of_columns + 1)).reshape(
+            number_of_rows, number_of_columns + 1)
+        self.num_walls = num_horizontal_walls + vertical_slots.size
+        # placement, row and column of every wall slot, the slots are in the order of the tag store
+        horizontal_rows, horizontal_columns = np.divmod(np.arange(num_horizontal_walls), number_of_columns)
+        vertical_rows, vertical_columns = np.divmod(np.arange(vertical_slots.size), number_of_columns + 1)
+        self.slot_placements = np.repeat([Placement.HORIZONTAL.value, Placement.VERTICAL.value],
+                                         [num_horizontal_walls, vertical_slots.size])
+        self.slot_rows = np.concatenate([horizontal_rows, vertical_rows])
+        self.slot_columns = np.concatenate([horizontal_columns, vertical_columns])
+        self.inner_slots = np.concatenate([horizontal_slots[1:-1].ravel(), vertical_slots[:, 1:-1].ravel()]).tolist()
+        self.first_cells = np.concatenate([cells[:-1].ravel(), cells[:, :-1].ravel()]).tolist()
+        self.second_cells = np.concatenate([cells[1:].ravel(), cells[:, 1:].ravel()]).tolist()
+        # the border walls and which of their sides looks into the maze (see wall_allocator.py)
+        self.border_slots = np.concatenate([horizontal_slots[0], horizontal_slots[-1],
+                                            vertical_slots[:, 0], vertical_slots[:, -1]])
+        self.border_kinds = np.repeat(np.array([BACK_ONLY, FRONT_ONLY, BACK_ONLY, FRONT_ONLY], dtype=np.int8),
+                                      [number_of_columns, number_of_columns, number_of_rows, number_of_rows])
+
+        num_inner_walls = self.get_max_num_inner_walls()
+        inventory = get_wall_inventory()
+        double_sided_ids = inventory.get_smallest_ids(True, num_inner_walls + len(self.border_slots))
+        single_sided_ids = inventory.get_smallest_ids(False, num_inner_walls + len(self.border_slots))
+        assert num_inner_walls + len(self.border_slots) <= len(double_sided_ids) + len(single_sided_ids), \
+            f"The wall inventory has not enough walls for a maze with {number_of_rows} rows and {number_of_columns} " \
+            f"columns. Use the virtual wall inventory for larger mazes."
+        self.double_sided_ids = double_sided_ids
+        self.single_sided_ids = single_sided_ids
+
+    def get_max_num_inner_walls(self) -> int:
+        """Returns the maximum number of walls inside a maze (a perfect maze has the most walls)"""
+        return len(self.inner_slots) - (self.number_of_rows * self.number_of_columns - 1)
+
+    def generate_inner_walls(self, rng: np.random.Generator) -> List[int]:
+        """Returns the slots of the walls inside a random maze"""
+        parents = list(range(self.number_of_rows * self.number_of_columns))
+        inner_walls = []
+        for idx in rng.permutation(len(self.inner_slots)).tolist():
+            first_root = find_root(parents, self.first_cells[idx])
+            second_root = find_root(parents, self.second_cells[idx])
+            if first_root == second_root:
+                inner_walls.append(idx)
+            else:
+                parents[first_root] = second_root
+        if self.algorithm == "braid":
+            inner_walls = self.remove_dead_ends(inner_walls, rng)
+        return [self.inner_slots[idx] for idx in inner_walls]
+
+    def remove_dead_ends(self, inner_walls: List[int], rng: np.random.Generator) -> List[int]:
+        """Removes one wall of each dead end (a cell with three walls) with the braid probability"""
+        walls_of_cells = [[] for _ in range(self.number_of_rows * self.number_of_columns)]
+        for idx in inner_walls:
+            walls_of_cells[self.first_cells[idx]].append(idx)
+            walls_of_cells[self.second_cells[idx]].append(idx)
+        # the border walls count as walls as well
+        num_walls_of_cells = [len(walls) for walls in walls_of_cells]
+        for cell in range(len(walls_of_cells)):
+            row, column = divmod(cell, self.number_of_columns)
+            num_walls_of_cells[cell] += (row == 0) + (row == self.number_of_rows - 1) + \
+                (column == 0) + (column == self.number_of_columns - 1)
+        removed = set()
+        for cell in rng.permutation(len(walls_of_cells)).tolist():
+            if num_walls_of_cells[cell] != 3 or rng.random() >= self.braid:
+                continue
+            candidates = [idx for idx in walls_of_cells[cell] if idx not in removed]
+            if not candidates:
+                continue
+            idx = candidates[rng.integers(len(candidates))]
+            removed.add(idx)
+            num_walls_of_cells[self.first_cells[idx]] -= 1
+            num_walls_of_cells[self.second_cells[idx]] -= 1
+        return [idx for idx in inner_walls if idx not in removed]
+
+    def assign_wall_ids(self, inner_walls: List[int], rng: np.random.Generator) -> np.ndarray:
+        """Returns the signed smallest IDs of all wall slots (-1 where there is no wall). The walls are allocated by
+        allocate_wall_ids (see wall_allocator.py) and then shuffled within the inner and the border walls. Inner walls
+        get a random side up."""
+        ids = np.full(self.num_walls, -1, dtype=np.int64)
+        num_inner_walls = len(inner_walls)
+        kinds = np.concatenate([np.full(num_inner_walls, INNER, dtype=np.int8), self.border_kinds])
+        allocated_ids = np.abs(allocate_wall_ids(kinds, self.double_sided_ids, self.single_sided_ids))
+        inner_ids = rng.permutation(allocated_ids[:num_inner_walls])
+        border_ids = rng.permutation(allocated_ids[num_inner_walls:])
+        ids[np.array(inner_walls, dtype=np.int64)] = np.where(rng.random(num_inner_walls) < 0.5, inner_ids, -inner_ids)
+        ids[self.border_slots] = np.where(self.border_kinds == BACK_ONLY, -border_ids, border_ids)
+        return ids
+
+    def generate_ids(self, rng: np.random.Generator) -> np.ndarray:
+        """Returns the signed smallest IDs of all wall slots of a random maze (see assign_wall_ids)"""
+        return self.assign_wall_ids(self.generate_inner_walls(rng), rng)
+
+    def generate(self, rng: np.random.Generator) -> Tuple[List[List[int]], List[List[int]]]:
+        """Returns the rows with horizontal walls and the rows with vertical walls of a random maze"""
+        return self.get_rows(self.generate_ids(rng))
+
+    def get_rows(self, ids: np.ndarray) -> Tuple[List[List[int]], List[List[int]]]:
+        """Returns the rows with horizontal walls and the rows with vertical walls of the IDs of all wall slots"""
+        num_horizontal_walls = (self.number_of_rows + 1) * self.number_of_columns
+        return ids[:num_horizontal_walls].reshape(self.number_of_rows + 1, -1).tolist(), \
+            ids[num_horizontal_walls:].reshape(self.number_of_rows, -1).tolist()
+
+
+def save_mazes(generator: MazeGenerator, ids: np.ndarray, save_paths: List[str],
+               template: Optional[Tuple[List[str], List[str]]] = None):
+    """Saves the tag bundle yamls of a batch of generated mazes (one row of ids per maze, see
+    MazeGenerator.generate_ids) and their layouts next to them as json layout files. The walls of all mazes are created
+    as one tag store and the yaml entries of all their tags are formatted at once, only the files are written maze by
+    maze. The layouts of MazeGenerator are correct by construction, so Maze.check_input is skipped, only the walls are
+    checked to be used once per maze. template is the split yaml template (see read_yaml_template)."""
+    sorted_ids = np.sort(np.where(ids == -1, -1, np.abs(ids)), axis=1)
+    assert not np.any((sorted_ids[:, 1:] == sorted_ids[:, :-1]) & (sorted_ids[:, 1:] != -1)), \
+        "A generated maze uses a wall twice."
+    maze_indices, slots = np.nonzero(ids != -1)
+    tags = Maze().create_tag_store(generator.slot_placements[slots], generator.slot_rows[slots],
+                                   generator.slot_columns[slots], ids[maze_indices, slots]).tags
+    # the tags are ordered by wall and the walls by maze
+    bounds = np.searchsorted(maze_indices[tags["wall_index"]], np.arange(len(save_paths) + 1)).tolist()
+    entries = {TAG_BUNDLE_MARKER: get_yaml_entries(tags, standalone=False),
+               STANDALONE_TAGS_MARKER: get_yaml_entries(tags, standalone=True)}
+    for idx, save_path in enumerate(save_paths):
+        start, end = bounds[idx], bounds[idx + 1]
+        # like iter_yaml_lines, every line but the last ends with a comma
+        yaml_lines = {marker: [",\n".join(marker_entries[start:end]) + "\n"] if end > start else []
+                      for marker, marker_entries in entries.items()}
+        write_yaml_lines(yaml_lines, save_path, template)
+        rows_with_horizontal_walls, rows_with_vertical_walls = generator.get_rows(ids[idx])
+        with open(os.path.splitext(save_path)[0] + ".json", 'w') as f:
+            f.write(json.dumps({"horizontal_walls": rows_with_horizontal_walls,
+                                "vertical_walls": rows_with_vertical_walls}))
+
+
+def main():
+    args = parser.parse_args()
+    if args.virtual:
+        set_wall_inventory(WallInventory.from_file(VIRTUAL_WALL_INVENTORY_PATH))
+    generator = MazeGenerator(args.rows, args.columns, args.algorithm, args.braid)
+    output_folder_path = os.path.join(os.getcwd(), args.output_folder)
+    os.makedirs(output_folder_path, exist_ok=True)
+    template = read_yaml_template()
+    start = time.perf_counter()
+    for batch_start in range(0, args.count, BATCH_SIZE):
+        batch = range(batch_start, min(batch_start + BATCH_SIZE, args.count))
+        ids = np.array([generator.generate_ids(np.random.default_rng([args.seed, idx])) for idx in batch])
+        save_mazes(generator, ids, [os.path.join(output_folder_path, f"maze_{idx:05d}.yaml") for idx in batch],
+                   template)
+    duration = time.perf_counter() - start
+    print(f"{args.count} mazes were saved to {output_folder_path} in {duration:.2f}s "
+          f"({args.count / max(duration, 1e-9):.0f} mazes/s).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+import os
+import heapq
+import hashlib
+import argparse
+from typing import List
+from typing import Optional
+from typing import Tuple
+import numpy as np
+
+# Graph of the cells of a maze: cell (row, column) has the index row * number_of_columns + column and is connected to
+# its neighbour cells if there is no wall in between. Only the walls inside the maze matter, the outer walls do not
+# connect any cells. The neighbours are stored as sparse adjacency array (CSR): the neighbours of cell i are
+# indices[indptr[i]:indptr[i + 1]].
+
+Cell = Tuple[int, int]
+
+parser = argparse.ArgumentParser(
+    description='Prints the connectivity of the cells of a maze layout and optionally a shortest route.',
+    epilog='Example: "python maze_graph.py output/lab.json --route 0:0 1:2"'
+)
+parser.add_argument(
+    'layout', type=str,
+    help='The path to a layout file (json or csv, see maze_builder.py)'
+)
+parser.add_argument(
+    '--route', type=str, nargs=2, required=False, default=None, dest="route",
+    help='Start and goal cell given as ROW:COLUMN'
+)
+parser.add_argument(
+    '--distances', type=str, required=False, default=None, dest="cache_folder",
+    help='Compute the distances between all cells and cache them in the given folder as <layout hash>.npy'
+)
+
+
+def get_layout_hash(rows_with_horizontal_walls: List[List[int]], rows_with_vertical_walls: List[List[int]]) -> str:
+    """Returns a hash of where walls are in a layout (the tag IDs do not change the graph)"""
+    hash_object = hashlib.sha256()
+    for rows in [rows_with_horizontal_walls, rows_with_vertical_walls]:
+        walls = np.array(rows, dtype=np.int64) != -1
+        hash_object.update(np.array(walls.shape, dtype=np.int64).tobytes())
+        hash_object.update(np.packbits(walls).tobytes())
+    return hash_object.hexdigest()
+
+
+class MazeGraph(object):
+    def __init__(self, number_of_rows: int, number_of_columns: int, indptr: np.ndarray, indices: np.ndarray,
+                 layout_hash: str):
+        self.number_of_rows = number_of_rows
+        self.number_of_columns = number_of_columns
+        self.num_cells = number_of_rows * number_of_columns
+        self.indptr = indptr
+        self.indices = indices
+        self.layout_hash = layout_hash
+
+    @classmethod
+    def from_rows(cls, rows_with_horizontal_walls: List[List[int]], rows_with_vertical_walls: List[List[int]]):
+        """Creates the graph from the rows of walls of a maze (see Maze)"""
+        horizontal_walls = np.array(rows_with_horizontal_walls, dtype=np.int64)
+        vertical_walls = np.array(rows_with_vertical_walls, dtype=np.int64)
+        number_of_rows, number_of_columns = vertical_walls.shape[0], horizontal_walls.shape[1]
+        cells = np.arange(number_of_rows * number_of_columns).reshape(number_of_rows, number_of_columns)
+        # the inner horizontal walls separate a cell from the one below, the inner vertical walls from the one right
+        open_down = horizontal_walls[1:-1] == -1
+        open_right = vertical_walls[:, 1:-1] == -1
+        sources = np.concatenate([cells[:-1][open_down], cells[:, :-1][open_right]])
+        targets = np.concatenate([cells[1:][open_down], cells[:, 1:][open_right]])
+        edges_from = np.concatenate([sources, targets])
+        edges_to = np.concatenate([targets, sources])
+        order = np.lexsort((edges_to, edges_from))
+        indptr = np.searchsorted(edges_from[order], np.arange(cells.size + 1))
+        return cls(number_of_rows, number_of_columns, indptr, edges_to[order],
+                   get_layout_hash(rows_with_horizontal_walls, rows_with_vertical_walls))
+
+    @classmethod
+    def from_maze(cls, maze):
+        return cls.from_rows(maze.rows_with_horizontal_walls, maze.rows_with_vertical_walls)
+
+    def get_index(self, cell: Cell) -> int:
+        row, column = cell
+        assert 0 <= row < self.number_of_rows and 0 <= column < self.number_of_columns, f"Cell {cell} is not in the maze"
+        return row * self.number_of_columns + column
+
+    def get_cell(self, index: int) -> Cell:
+        return divmod(int(index), self.number_of_columns)
+
+    def get_neighbours(self, nodes: np.ndarray) -> np.ndarray:
+        """Returns the neighbours of all given cell indices (with repetitions)"""
+        starts = self.indptr[nodes]
+        counts = self.indptr[nodes + 1] - starts
+        offsets = np.cumsum(counts) - counts
+        return self.indices[np.arange(counts.sum()) - np.repeat(offsets - starts, counts)]
+
+    def bfs(self, start: Cell) -> np.ndarray:
+        """Returns the number of steps from start to every cell (index as in the graph, -1 if not reachable)"""
+        distances = np.full(self.num_cells, -1, dtype=np.int32)
+        frontier = np.array([self.get_index(start)])
+        distance = 0
+        while len(frontier) > 0:
+            distances[frontier] = distance
+            neighbours = np.unique(self.get_neighbours(frontier))
+            frontier = neighbours[distances[neighbours] == -1]
+            distance += 1
+        return distances
+
+    def find_route(self, start: Cell, goal: Cell) -> Optional[List[Cell]]:
+        """Returns a shortest route of cells from start to goal (A* with the manhattan distance), None if the goal can
+        not be reached"""
+        start_index, goal_index = self.get_index(start), self.get_index(goal)
+        goal_row, goal_column = goal
+        previous = {start_index: -1}
+        costs = {start_index: 0}
+        queue = [(abs(start[0] - goal_row) + abs(start[1] - goal_column), start_index)]
+        while queue:
+            _, index = heapq.heappop(queue)
+            if index == goal_index:
+                route = []
+                while index != -1:
+                    route.append(self.get_cell(index))
+                    index = previous[index]
+                return route[::-1]
+            for neighbour in self.indices[self.indptr[index]:self.indptr[index + 1]].tolist():
+                cost = costs[index] + 1
+                if cost < costs.get(neighbour, self.num_cells):
+                    costs[neighbour] = cost
+                    previous[neighbour] = index
+                    row, column = self.get_cell(neighbour)
+                    heapq.heappush(queue, (cost + abs(row - goal_row) + abs(column - goal_column), neighbour))
+        return None
+
+    def get_components(self) -> np.ndarray:
+        """Returns the label of the connected component of every cell (labels start at 0)"""
+        labels = np.full(self.num_cells, -1, dtype=np.int32)
+        label = 0
+        for index in range(self.num_cells):
+            if labels[index] != -1:
+                continue
+            frontier = np.array([index])
+            while len(frontier) > 0:
+                labels[frontier] = label
+                neighbours = np.unique(self.get_neighbours(frontier))
+                frontier = neighbours[labels[neighbours] == -1]
+            label += 1
+        return labels
+
+    def get_unreachable_cells(self) -> List[Cell]:
+        """Returns the cells that can not be reached from cell (0, 0)"""
+        if self.num_cells == 0:
+            return []
+        return [self.get_cell(index) for index in np.flatnonzero(self.bfs((0, 0)) == -1)]
+
+    def get_all_pairs_distances(self) -> np.ndarray:
+        """Returns the number of steps between all pairs of cells (num_cells x num_cells, -1 if not reachable). The
+        breadth first searches from all cells run at once: for every cell a bitset (in uint64 words) holds the start
+        cells that have reached it."""
+        num_words = (self.num_cells + 63) // 64
+        distances = np.full((self.num_cells, self.num_cells), -1, dtype=np.int32)
+        reached = np.zeros((self.num_cells, num_words), dtype='<u8')
+        cells = np.arange(self.num_cells)
+        reached[cells, cells // 64] = np.left_shift(np.uint64(1), (cells % 64).astype(np.uint64))
+        frontier = reached.copy()
+        np.fill_diagonal(distances, 0)
+        # neighbours as (num_cells, 4) array, cells with less neighbours repeat themselves (their bits are reached)
+        degrees = np.diff(self.indptr)
+        neighbours = np.repeat(cells[:, np.newaxis], 4, axis=1)
+        slots = np.arange(len(self.indices)) - np.repeat(self.indptr[:-1], degrees)
+        neighbours[np.repeat(cells, degrees), slots] = self.indices
+
+        distance = 1
+        while frontier.any():
+            new = np.bitwise_or.reduce(frontier[neighbours], axis=1) & ~reached
+            reached |= new
+            frontier = new
+            # only the words with new bits are unpacked
+            new_cells, new_words = np.nonzero(new)
+            bits = np.unpackbits(new[new_cells, new_words].view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+            word_indices, bit_indices = np.nonzero(bits)
+            distances[new_words[word_indices] * 64 + bit_indices, new_cells[word_indices]] = distance
+            distance += 1
+        return distances
+
+    def load_all_pairs_distances(self, cache_folder: str) -> np.ndarray:
+        """Returns the all pairs distances (see get_all_pairs_distances) from a cache file keyed by the layout hash.
+        They are only computed if there is no cache file for the layout yet."""
+        path = os.path.join(cache_folder, f"{self.layout_hash}.npy")
+        if os.path.isfile(path):
+            return np.load(path)
+        distances = self.get_all_pairs_distances()
+        os.makedirs(cache_folder, exist_ok=True)
+        with open(path + ".tmp", 'wb') as f:
+            np.save(f, distances)
+        os.replace(path + ".tmp", path)
+        return distances
+
+
+def main():
+    from maze_builder import read_layout_file
+    args = parser.parse_args()
+    graph = MazeGraph.from_rows(*read_layout_file(args.layout))
+    labels = graph.get_components()
+    print(f"The maze has {graph.num_cells} cells in {labels.max() + 1 if len(labels) > 0 else 0} connected components.")
+    for cell in graph.get_unreachable_cells():
+        print(f"Cell {cell} can not be reached from cell (0, 0).")
+    if args.route is not None:
+        start, goal = [tuple(int(value) for value in cell.split(":")) for cell in args.route]
+        route = graph.find_route(start, goal)
+        print(f"Route: {route}" if route is not None else f"Cell {goal} can not be reached from cell {start}.")
+    if args.cache_folder is not None:
+        distances = graph.load_all_pairs_distances(args.cache_folder)
+        print(f"Distances were saved to {os.path.join(args.cache_folder, graph.layout_hash)}.npy, the longest shortest "
+              f"route has {distances.max()} steps.")
+
+
+if __name__ == '__main__':
+    main()
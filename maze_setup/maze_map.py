@@ -0,0 +1,219 @@
+import os
+import zlib
+import struct
+import argparse
+from typing import Iterator
+from typing import List
+from typing import Optional
+import numpy as np
+
+# Top down map of a maze layout (x axis downwards, y axis to the right, like the layout file). The map is rendered row
+# of walls by row of walls and streamed to its target, so the memory does not grow with the size of the maze:
+# - ascii: the plain picture of Maze.simple_plot or an annotated one with the signed smallest ID of every wall and an
+#   arrow in the direction the smallest ID looks to (^ north, v south, < west, > east)
+# - svg: the walls, a tick on the side the smallest ID looks to and the signed smallest IDs
+# - png: the walls (colored like in the 3D plot) and the ticks, without IDs
+
+ASCII_COORDINATE_SYSTEM = [" ---> y ", "|", "|", "v", "x"]
+ASCII_INDENT = "          "
+ASCII_CELL_WIDTH = 9  # characters between two walls in the annotated ascii map
+
+SVG_CELL_SIZE = 40  # px
+SVG_FONT_SIZE = 8  # px
+DEFAULT_PNG_CELL_SIZE = 8  # px
+
+# RGB colors of the horizontal and vertical walls and of the ticks in the png map
+HORIZONTAL_WALL_COLOR = (0, 157, 129)
+VERTICAL_WALL_COLOR = (0, 105, 146)
+TICK_COLOR = (0, 0, 0)
+
+parser = argparse.ArgumentParser(
+    description='Renders the top down map of a maze layout as ascii (printed or .txt), svg or png.',
+    epilog='Example: "python maze_map.py output/lab.json --output=output/lab.svg"'
+)
+parser.add_argument(
+    'layout', type=str,
+    help='The path to a layout file (json or csv, see maze_builder.py)'
+)
+parser.add_argument(
+    '--output', type=str, required=False, default=None, dest="output",
+    help='The path of the map (.txt, .svg or .png). Without output the ascii map is printed.'
+)
+parser.add_argument(
+    '--annotated', action='store_true', required=False, dest="annotated",
+    help='Show the IDs and the directions of the walls in the ascii map'
+)
+parser.add_argument(
+    '--no_labels', action='store_false', required=False, dest="labels",
+    help='Leave out the IDs in the svg map (for very large mazes)'
+)
+parser.add_argument(
+    '--cell_size', type=int, required=False, default=DEFAULT_PNG_CELL_SIZE, dest="cell_size",
+    help=f'Size of a cell in the png map in px (default: {DEFAULT_PNG_CELL_SIZE})'
+)
+
+
+def get_horizontal_label(tag_id: int) -> str:
+    return ("^" if tag_id >= 0 else "v") + str(tag_id)
+
+
+def get_vertical_label(tag_id: int) -> str:
+    return ("<" if tag_id >= 0 else ">") + str(tag_id)
+
+
+def iter_ascii_lines(rows_with_horizontal_walls: List[List[int]], rows_with_vertical_walls: List[List[int]],
+                     annotated: bool = False) -> Iterator[str]:
+    """Yields the lines of the ascii map. The plain map is the picture of Maze.simple_plot."""
+    yield from ASCII_COORDINATE_SYSTEM
+    for idx, horizontal_walls in enumerate(rows_with_horizontal_walls):
+        if annotated:
+            segments = [get_horizontal_label(tag_id).center(ASCII_CELL_WIDTH, "-") if tag_id != -1
+                        else " " * ASCII_CELL_WIDTH for tag_id in horizontal_walls]
+            yield ASCII_INDENT + "+" + "+".join(segments) + "+"
+        else:
+            yield ASCII_INDENT + " " + \
+                " ".join(["----" if tag_id != -1 else "    " for tag_id in horizontal_walls]) + " "
+        if idx >= len(rows_with_vertical_walls):
+            continue
+        vertical_walls = rows_with_vertical_walls[idx]
+        if annotated:
+            cells = ["|" + get_vertical_label(tag_id).ljust(ASCII_CELL_WIDTH) if tag_id != -1
+                     else " " * (ASCII_CELL_WIDTH + 1) for tag_id in vertical_walls]
+            yield (ASCII_INDENT + "".join(cells)).rstrip()
+        else:
+            yield ASCII_INDENT + "    ".join(["|" if tag_id != -1 else " " for tag_id in vertical_walls]) + "    "
+
+
+def iter_svg_lines(rows_with_horizontal_walls: List[List[int]], rows_with_vertical_walls: List[List[int]],
+                   cell_size: int = SVG_CELL_SIZE, labels: bool = True) -> Iterator[str]:
+    """Yields the lines of the svg map: per row of walls one path of the walls, one path of the ticks and the labels"""
+    number_of_rows, number_of_columns = len(rows_with_vertical_walls), len(rows_with_horizontal_walls[0])
+    tick = cell_size // 8
+    # space around the maze for the labels of walls at the border looking outwards
+    margin = tick + 3 * SVG_FONT_SIZE
+    width, height = number_of_columns * cell_size + 2 * margin, number_of_rows * cell_size + 2 * margin
+    yield f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" ' \
+          f'viewBox="{-margin} {-margin} {width} {height}">'
+    yield f'<g font-family="monospace" font-size="{SVG_FONT_SIZE}" text-anchor="middle" dominant-baseline="central">'
+    # the ticks and labels are on the side the smallest ID looks to: up (north) or left (west) for positive IDs
+    label_distance = tick + SVG_FONT_SIZE // 2 + 1
+    for idx, horizontal_walls in enumerate(rows_with_horizontal_walls):
+        y = idx * cell_size
+        walls = [(column * cell_size, tag_id, -1 if tag_id >= 0 else 1)
+                 for column, tag_id in enumerate(horizontal_walls) if tag_id != -1]
+        if walls:
+            yield '<path stroke="#009d81" stroke-width="2" d="' + \
+                  "".join([f"M{x} {y}h{cell_size}" for x, _, _ in walls]) + '"/>'
+            yield '<path stroke="#000" d="' + \
+                  "".join([f"M{x + cell_size // 2} {y}v{direction * tick}" for x, _, direction in walls]) + '"/>'
+            if labels:
+                yield "".join([f'<text x="{x + cell_size // 2}" y="{y + direction * label_distance}">{tag_id}</text>'
+                               for x, tag_id, direction in walls])
+        if idx >= len(rows_with_vertical_walls):
+            continue
+        walls = [(column * cell_size, tag_id, -1 if tag_id >= 0 else 1)
+                 for column, tag_id in enumerate(rows_with_vertical_walls[idx]) if tag_id != -1]
+        if walls:
+            yield '<path stroke="#006992" stroke-width="2" d="' + \
+                  "".join([f"M{x} {y}v{cell_size}" for x, _, _ in walls]) + '"/>'
+            yield '<path stroke="#000" d="' + \
+                  "".join([f"M{x} {y + cell_size // 2}h{direction * tick}" for x, _, direction in walls]) + '"/>'
+            if labels:
+                yield "".join([f'<text x="{x + direction * (tick + SVG_FONT_SIZE)}" y="{y + cell_size // 2}">{tag_id}'
+                               f'</text>' for x, tag_id, direction in walls])
+    yield '</g>'
+    yield '</svg>'
+
+
+def iter_png_bands(rows_with_horizontal_walls: List[List[int]], rows_with_vertical_walls: List[List[int]],
+                   cell_size: int = DEFAULT_PNG_CELL_SIZE) -> Iterator[np.ndarray]:
+    """Yields the pixel rows (RGB, uint8) of the png map, one band of cell_size rows per row of cells and a last band
+    for the last row of horizontal walls"""
+    number_of_rows, number_of_columns = len(rows_with_vertical_walls), len(rows_with_horizontal_walls[0])
+    width = number_of_columns * cell_size + 1
+    thickness = max(1, cell_size // 8)
+    tick = max(1, cell_size // 4)
+    middle = cell_size // 2
+    for idx in range(number_of_rows + 1):
+        horizontal_walls = np.array(rows_with_horizontal_walls[idx], dtype=np.int64)
+        band = np.full((cell_size if idx < number_of_rows else thickness, width, 3), 255, dtype=np.uint8)
+        # horizontal walls from corner to corner
+        pixels = np.zeros(width, dtype=bool)
+        pixels[:-1] = np.repeat(horizontal_walls != -1, cell_size)
+        pixels[1:] |= pixels[:-1]
+        band[:thickness, pixels] = HORIZONTAL_WALL_COLOR
+        # ticks of the walls of this row looking south (into this band)
+        band[thickness:thickness + tick, np.flatnonzero(horizontal_walls < -1) * cell_size + middle] = TICK_COLOR
+        if idx == number_of_rows:
+            yield band
+            continue
+        # ticks of the walls of the next row looking north (at the bottom of this band)
+        next_walls = np.array(rows_with_horizontal_walls[idx + 1], dtype=np.int64)
+        band[cell_size - tick:, np.flatnonzero(next_walls >= 0) * cell_size + middle] = TICK_COLOR
+
+        vertical_walls = np.array(rows_with_vertical_walls[idx], dtype=np.int64)
+        columns = np.flatnonzero(vertical_walls != -1)
+        band[:, (columns[:, np.newaxis] * cell_size + np.arange(thickness)).ravel().clip(0, width - 1)] = \
+            VERTICAL_WALL_COLOR
+        west = columns[vertical_walls[columns] >= 0] * cell_size
+        east = columns[vertical_walls[columns] < 0] * cell_size
+        band[middle, (west[:, np.newaxis] - np.arange(1, tick + 1)).ravel().clip(0, width - 1)] = TICK_COLOR
+        band[middle, (east[:, np.newaxis] + thickness + np.arange(tick)).ravel().clip(0, width - 1)] = TICK_COLOR
+        yield band
+
+
+def write_png(f, bands: Iterator[np.ndarray], width: int, height: int):
+    """Writes an RGB png to the binary file f, compressing the pixel rows band by band"""
+    def write_chunk(chunk_type: bytes, data: bytes):
+        f.write(struct.pack(">I", len(data)) + chunk_type + data)
+        f.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff))
+
+    f.write(b"\x89PNG\r\n\x1a\n")
+    write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+    compressor = zlib.compressobj()
+    for band in bands:
+        # every pixel row starts with filter type 0 (none)
+        rows = np.concatenate([np.zeros((len(band), 1), dtype=np.uint8), band.reshape(len(band), -1)], axis=1)
+        data = compressor.compress(rows.tobytes())
+        if data:
+            write_chunk(b"IDAT", data)
+    write_chunk(b"IDAT", compressor.flush())
+    write_chunk(b"IEND", b"")
+
+
+def save_map(rows_with_horizontal_walls: List[List[int]], rows_with_vertical_walls: List[List[int]], path: str,
+             annotated: bool = False, labels: bool = True, cell_size: Optional[int] = None):
+    """Saves the map of a layout, the target is given by the file ending of path (.txt, .svg or .png)"""
+    ending = os.path.splitext(path)[1]
+    assert ending in [".txt", ".svg", ".png"], f"Map {path} must be a .txt, .svg or .png file"
+    if ending == ".png":
+        cell_size = cell_size or DEFAULT_PNG_CELL_SIZE
+        number_of_rows, number_of_columns = len(rows_with_vertical_walls), len(rows_with_horizontal_walls[0])
+        with open(path, 'wb') as f:
+            write_png(f, iter_png_bands(rows_with_horizontal_walls, rows_with_vertical_walls, cell_size),
+                      number_of_columns * cell_size + 1, number_of_rows * cell_size + max(1, cell_size // 8))
+        return
+    if ending == ".svg":
+        lines = iter_svg_lines(rows_with_horizontal_walls, rows_with_vertical_walls, cell_size or SVG_CELL_SIZE, labels)
+    else:
+        lines = iter_ascii_lines(rows_with_horizontal_walls, rows_with_vertical_walls, annotated)
+    with open(path, 'w') as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+def main():
+    from maze_builder import read_layout_file
+    args = parser.parse_args()
+    rows_with_horizontal_walls, rows_with_vertical_walls = read_layout_file(args.layout)
+    if args.output is None:
+        for line in iter_ascii_lines(rows_with_horizontal_walls, rows_with_vertical_walls, args.annotated):
+            print(line)
+        return
+    save_map(rows_with_horizontal_walls, rows_with_vertical_walls, args.output, args.annotated, args.labels,
+             args.cell_size)
+    print(f"Map was saved to {args.output}.")
+
+
+if __name__ == '__main__':
+    main()
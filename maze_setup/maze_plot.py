@@ -0,0 +1,208 @@
+import argparse
+from functools import lru_cache
+from typing import List
+from typing import Optional
+from typing import Tuple
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+from matplotlib.path import Path
+from matplotlib.text import TextPath
+from mpl_toolkits.mplot3d import proj3d
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from maze import Maze
+from wall import Wall
+from wall import Placement
+from tag_store import TagStore
+from maze_builder import MazeBuilder
+from wall_inventory import WallInventory
+from wall_inventory import VIRTUAL_WALL_INVENTORY_PATH
+from wall_inventory import set_wall_inventory
+
+# 3D plot of a maze (see Maze.advanced_plot). All sides of all walls are drawn as one Poly3DCollection and all tag ID
+# labels (on the floor in front of the walls) as one compound path, so the number of artists does not grow with the
+# size of the maze.
+
+RIS_GREEN = (0.0, 157 / 255, 129 / 255, 1.0)  # RGBA
+CREAM = (209 / 255, 240 / 255, 177 / 255, 1.0)  # RGBA
+LIGHT_BLUE = (0 / 255, 105 / 255, 146 / 255, 1.0)  # RGBA
+DARK_BLUE = (39 / 255, 71 / 255, 110 / 255, 1.0)  # RGBA
+
+LABEL_SIZE = 40
+LABEL_DISTANCE = 50  # mm from the center of the wall
+# number of glyphs (character and size) whose paths are kept
+GLYPH_CACHE_SIZE = 256
+
+parser = argparse.ArgumentParser(
+    description='Saves the 3D plot of a maze layout as image without any prompt.',
+    epilog='Example: "python maze_plot.py output/lab.json output/lab.png"'
+)
+parser.add_argument(
+    'layout', type=str,
+    help='The path to a layout file (json or csv, see maze_builder.py)'
+)
+parser.add_argument(
+    'save_path', type=str,
+    help='The path of the image, the format is given by the file ending (e.g. png or svg)'
+)
+parser.add_argument(
+    '--virtual', action='store_true', required=False, dest="virtual",
+    help='Use the virtual wall inventory (do_not_touch/wall_inventory_virtual.json) for simulated mazes'
+)
+
+
+class LabelPatch3D(Patch):
+    """A 2D path (e.g. all labels) that lies in the plane z of the 3D axes. Unlike art3d.PathPatch3D the vertices are
+    projected all at once."""
+
+    def __init__(self, path: Path, z: float, **kwargs):
+        super().__init__(**kwargs)
+        self._vertices3d = np.column_stack([path.vertices, np.full(len(path.vertices), z)])
+        self._codes = path.codes
+        self._path2d = path
+
+    def get_path(self):
+        return self._path2d
+
+    def do_3d_projection(self):
+        xs, ys, zs = proj3d.proj_transform(self._vertices3d[:, 0], self._vertices3d[:, 1], self._vertices3d[:, 2],
+                                           self.axes.M)
+        self._path2d = Path(np.column_stack([xs, ys]), self._codes)
+        return np.min(zs) if len(zs) > 0 else np.nan
+
+
+def get_wall_faces(tag_store: TagStore) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the corners (number of walls * 2, 4, 3) and the colors of both sides of all walls of a tag store"""
+    walls = tag_store.walls
+    horizontal = walls["placement"] == Placement.HORIZONTAL.value
+    pos_x, pos_y, pos_z = walls["x"].astype(float), walls["y"].astype(float), walls["z"].astype(float)
+    # a side spans the width of the wall along the wall (y for horizontal, x for vertical walls) and its height
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) * [Wall.width / 2, Wall.height / 2]
+    along = np.where(horizontal, pos_y, pos_x)[:, np.newaxis] + corners[:, 0]
+    across = np.where(horizontal, pos_x, pos_y)[:, np.newaxis]
+    heights = pos_z[:, np.newaxis] + corners[:, 1]
+
+    faces = []
+    for offset in [0, Wall.thickness]:
+        face = np.empty((len(walls), 4, 3))
+        face[:, :, 0] = np.where(horizontal[:, np.newaxis], across + offset, along)
+        face[:, :, 1] = np.where(horizontal[:, np.newaxis], along, across + offset)
+        face[:, :, 2] = heights
+        faces.append(face)
+    colors = np.concatenate([np.where(horizontal[:, np.newaxis], RIS_GREEN, LIGHT_BLUE),
+                             np.where(horizontal[:, np.newaxis], CREAM, DARK_BLUE)])
+    return np.concatenate(faces), colors
+
+
+def get_labels(tag_store: TagStore) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Returns the texts, positions (x, y) on the floor and rotation angles of the labels of the first tag on both
+    sides of every wall. The labels lie in front of the side the tag looks to and can be read from the wall."""
+    walls = tag_store.walls
+    tag_ids = tag_store.tags["tag_id"]
+    horizontal = walls["placement"] == Placement.HORIZONTAL.value
+    # +1 if the first tag looks north or west, -1 if the wall is flipped
+    signs = np.where(walls["smallest_tag_id"] >= 0, 1, -1)
+    positions, angles, texts = [], [], []
+    for side, has_tag in [(1, np.ones(len(walls), dtype=bool)), (-1, walls["num_tags"] > 2)]:
+        direction = side * signs[has_tag]
+        offsets = -LABEL_DISTANCE * direction
+        side_horizontal = horizontal[has_tag]
+        positions.append(np.stack([walls["x"][has_tag] + np.where(side_horizontal, offsets, 0),
+                                   walls["y"][has_tag] + np.where(side_horizontal, 0, offsets)], axis=1))
+        angles.append(np.where(side_horizontal, -np.pi / 2 * direction, np.where(direction > 0, 0, np.pi)))
+        texts += [str(tag_id) for tag_id in tag_ids[walls["first_tag"][has_tag] + (0 if side == 1 else 2)].tolist()]
+    return texts, np.concatenate(positions).astype(float), np.concatenate(angles)
+
+
+@lru_cache(maxsize=GLYPH_CACHE_SIZE)
+def get_glyph(character: str, size: float) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Returns the vertices and codes of the path of one character at the origin and its advance width (the shift of
+    the second glyph if the character is written twice)"""
+    text_path = TextPath((0, 0), character, size=size, usetex=False)
+    num_vertices = len(text_path.vertices)
+    assert num_vertices > 0, f"Character {character!r} of a label has no glyph"
+    double_text_path = TextPath((0, 0), character * 2, size=size, usetex=False)
+    return text_path.vertices, text_path.codes, double_text_path.vertices[num_vertices, 0] - text_path.vertices[0, 0]
+
+
+def get_label_path(texts: List[str], positions: np.ndarray, angles: np.ndarray, size: float = LABEL_SIZE) -> Path:
+    """Returns one compound path of all labels, each rotated by its angle and moved to its position. The labels are
+    put together from the cached glyphs of their characters, all vertices are placed at once."""
+    if not texts:
+        return Path(np.zeros((0, 2)))
+    characters = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    unique_characters = np.unique(characters)
+    glyphs = [get_glyph(chr(character), size) for character in unique_characters.tolist()]
+    glyph_vertices = np.concatenate([vertices for vertices, _, _ in glyphs])
+    glyph_codes = np.concatenate([codes for _, codes, _ in glyphs])
+    glyph_counts = np.array([len(vertices) for vertices, _, _ in glyphs])
+    glyph_starts = np.cumsum(glyph_counts) - glyph_counts
+    advances = np.array([advance for _, _, advance in glyphs])
+
+    # x offset of every character within its label
+    glyph_indices = np.searchsorted(unique_characters, characters)
+    label_lengths = np.array([len(text) for text in texts])
+    labels_of_characters = np.repeat(np.arange(len(texts)), label_lengths)
+    character_advances = advances[glyph_indices]
+    ends = np.cumsum(character_advances)
+    label_starts = np.concatenate([[0], ends])[np.cumsum(label_lengths) - label_lengths]
+    x_offsets = ends - character_advances - label_starts[labels_of_characters]
+
+    # the vertices of the glyphs of all characters, rotated and moved with their label
+    counts = glyph_counts[glyph_indices]
+    vertex_indices = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - glyph_starts[glyph_indices],
+                                                         counts)
+    x = glyph_vertices[vertex_indices, 0] + np.repeat(x_offsets, counts)
+    y = glyph_vertices[vertex_indices, 1]
+    labels_of_vertices = np.repeat(labels_of_characters, counts)
+    cos, sin = np.cos(angles)[labels_of_vertices], np.sin(angles)[labels_of_vertices]
+    vertices = np.stack([x * cos - y * sin, x * sin + y * cos], axis=1) + positions[labels_of_vertices]
+    return Path(vertices, glyph_codes[vertex_indices])
+
+
+def plot_maze(maze: Maze, save_path: Optional[str] = None):
+    """Plots the walls and the tag IDs of a maze (after Maze.create_walls) in 3D. With save_path the plot is rendered
+    offscreen and saved (the format is given by the file ending), otherwise it is shown."""
+    if save_path is None:
+        import matplotlib.pyplot as plt
+        fig = plt.figure()
+    else:
+        fig = Figure()  # no pyplot, so no window or interactive backend is needed
+    ax = fig.add_subplot(projection='3d')
+    # the labels lie on the floor, so they are drawn before the walls
+    ax.computed_zorder = False
+
+    faces, colors = get_wall_faces(maze.tag_store)
+    ax.add_collection3d(Poly3DCollection(faces, facecolors=colors, edgecolors=colors, zorder=2))
+    labels = LabelPatch3D(get_label_path(*get_labels(maze.tag_store)), 0, edgecolor="k", facecolor="k", zorder=1)
+    ax.add_artist(labels)  # add_patch would update the data limits segment by segment
+
+    x_size = (maze.number_of_rows + 1) * Wall.width
+    y_size = (maze.number_of_columns + 1) * Wall.width
+    z_size = int(Wall.height * 1.5)
+    ax.set_xlim(0, x_size)
+    ax.set_ylim(0, y_size)
+    ax.set_zlim(0, z_size)
+    ax.set_xlabel("x")
+    ax.set_ylabel("y")
+    ax.set_zlabel("z")
+    ax.set_box_aspect((1, y_size / x_size, z_size / x_size))
+    if save_path is None:
+        plt.show()
+    else:
+        fig.savefig(save_path)
+
+
+def main():
+    args = parser.parse_args()
+    if args.virtual:
+        set_wall_inventory(WallInventory.from_file(VIRTUAL_WALL_INVENTORY_PATH))
+    maze_builder = MazeBuilder()
+    maze_builder.init_maze()
+    maze_builder.load_maze_from_file(args.layout)
+    plot_maze(maze_builder.maze, args.save_path)
+    print(f"Plot was saved to {args.save_path}.")
+
+
+if __name__ == '__main__':
+    main()
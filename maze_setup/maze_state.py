@@ -0,0 +1,254 @@
+import os
+import json
+import argparse
+from typing import List
+from typing import Optional
+from typing import Tuple
+import numpy as np
+from maze import Maze
+from wall import Placement
+from tag_store import TagStore
+from maze_builder import read_layout_file
+from maze_builder import write_maze_yaml
+from maze_builder import TAG_SIZE_STRINGS
+from maze_builder import ORIENTATION_STRINGS
+from tag_lookup import save_lookup_table
+from tag_lookup import get_lookup_file_path
+from wall_inventory import WallInventory
+from wall_inventory import VIRTUAL_WALL_INVENTORY_PATH
+from wall_inventory import set_wall_inventory
+
+# A persisted maze state is a json layout file (see read_layout_file in maze_builder.py), optionally with
+# "virtual": true for mazes from the virtual wall inventory. Next to it the tag store of the maze (<state>.tags.npz),
+# the tag bundle yaml (<state>.yaml), the lookup table of the tags (<state>.lookup.npz) and the diff of the last edit
+# (<state>.diff.json) are kept. An edit loads the stored tag store, only creates the tags of the walls it touches and
+# patches them into the store, which is saved again. No other wall is created again; the yaml and the lookup table
+# are written anew from the patched store (their rows are ordered by wall, so a changed wall shifts all later rows).
+# Only init (or a state whose tag store is missing or does not fit its layout) checks the layout and creates all
+# walls.
+
+PLACEMENTS = {"h": Placement.HORIZONTAL, "v": Placement.VERTICAL}
+
+# quaternions of the tag orientations, as numbers
+ORIENTATION_QUATERNIONS = {orientation: {key: float(value) for key, value in
+                                         (entry.split(": ") for entry in orientation_string.split(", "))}
+                           for orientation, orientation_string in ORIENTATION_STRINGS.items()}
+
+WallSlot = Tuple[Placement, int, int]
+
+parser = argparse.ArgumentParser(
+    description='Edits a persisted maze state and updates its tag bundle yaml. Walls are given as '
+                'h:ROW:COLUMN (row of horizontal walls) or v:ROW:COLUMN (row of vertical walls), counted from 0 '
+                'like in the layout file.',
+    epilog='Example: "python maze_state.py output/lab.json flip h:1:2"'
+)
+parser.add_argument(
+    'state', type=str,
+    help='The path to the maze state (a json layout file). The yaml and the diff are saved next to it.'
+)
+parser.add_argument(
+    'edit', type=str, choices=["init", "flip", "move", "add", "remove", "swap"],
+    help='init: create the yaml of the state, flip WALL, move WALL NEW_WALL, add WALL ID, remove WALL, '
+         'swap WALL OTHER_WALL'
+)
+parser.add_argument(
+    'arguments', type=str, nargs='*',
+    help='The walls (and the smallest tag ID for add) the edit is applied to'
+)
+parser.add_argument(
+    '--virtual', action='store_true', required=False, dest="virtual",
+    help='Use the virtual wall inventory (only needed for init, it is remembered in the state)'
+)
+
+
+def parse_wall_slot(text: str) -> WallSlot:
+    """Parses a wall given as h:ROW:COLUMN or v:ROW:COLUMN"""
+    parts = text.split(":")
+    assert len(parts) == 3 and parts[0] in PLACEMENTS, f"Wall {text} must be given as h:ROW:COLUMN or v:ROW:COLUMN"
+    return PLACEMENTS[parts[0]], int(parts[1]), int(parts[2])
+
+
+def get_tag_pose(tag) -> dict:
+    """Returns the pose of a tag (a row of the tag store) as in the yaml file: size and position in m, quaternion"""
+    pose = {"id": int(tag["tag_id"]),
+            "size": float(TAG_SIZE_STRINGS[int(tag["size"])]),
+            "x": int(tag["x"]) / 1000,
+            "y": int(tag["y"]) / 1000,
+            "z": int(tag["z"]) / 1000}
+    pose.update(ORIENTATION_QUATERNIONS[int(tag["orientation"])])
+    return pose
+
+
+def get_tag_diff(old_tags: np.ndarray, new_tags: np.ndarray) -> dict:
+    """Returns which tags were added, removed or changed their pose between the tags of the touched walls before and
+    after an edit"""
+    old_poses = {int(tag["tag_id"]): get_tag_pose(tag) for tag in old_tags}
+    new_poses = {int(tag["tag_id"]): get_tag_pose(tag) for tag in new_tags}
+    return {"added": [new_poses[tag_id] for tag_id in sorted(new_poses.keys() - old_poses.keys())],
+            "removed": sorted(old_poses.keys() - new_poses.keys()),
+            "changed": [new_poses[tag_id] for tag_id in sorted(new_poses.keys() & old_poses.keys())
+                        if new_poses[tag_id] != old_poses[tag_id]]}
+
+
+def get_store_file_path(state_path: str) -> str:
+    return os.path.splitext(state_path)[0] + ".tags.npz"
+
+
+def store_fits_layout(store: TagStore, maze: Maze) -> bool:
+    """Checks that a stored tag store has exactly the walls of the layout of the maze"""
+    placements, rows, columns, smallest_tag_ids = maze.get_wall_arrays()
+    walls = store.walls
+    return len(walls) == len(smallest_tag_ids) and np.array_equal(walls["placement"], placements) and \
+        np.array_equal(walls["row"], rows) and np.array_equal(walls["column"], columns) and \
+        np.array_equal(walls["smallest_tag_id"], smallest_tag_ids)
+
+
+class MazeState(object):
+    """A maze whose walls can be moved, flipped, added, removed and swapped one by one. Every edit returns the diff
+    of the tag poses (see get_tag_diff)."""
+
+    def __init__(self, maze: Maze, virtual: bool = False):
+        self.maze = maze
+        self.virtual = virtual
+
+    @classmethod
+    def from_file(cls, path: str):
+        """Loads a maze state (a json layout file) and its stored tag store. Without a tag store that fits the layout
+        the layout is checked and all walls are created."""
+        with open(path) as f:
+            virtual = json.load(f).get("virtual", False)
+        if virtual:
+            set_wall_inventory(WallInventory.from_file(VIRTUAL_WALL_INVENTORY_PATH))
+        rows_with_horizontal_walls, rows_with_vertical_walls = read_layout_file(path)
+        maze = Maze()
+        maze.set_number_of_rows(len(rows_with_vertical_walls))
+        maze.set_number_of_columns(len(rows_with_horizontal_walls[0]))
+        maze.rows_with_horizontal_walls = rows_with_horizontal_walls
+        maze.rows_with_vertical_walls = rows_with_vertical_walls
+        store_path = get_store_file_path(path)
+        if os.path.isfile(store_path):
+            store = TagStore.from_file(store_path)
+            if store_fits_layout(store, maze):
+                maze.tag_store = store
+                return cls(maze, virtual)
+            print(f"The tag store {store_path} does not fit the layout, all walls are created again.")
+        assert maze.check_input(), f"The tag IDs in maze state {path} are not correct. See output above."
+        maze.create_walls()
+        return cls(maze, virtual)
+
+    def save(self, path: str):
+        """Saves the layout of the maze (the state) as json layout file and the tag store next to it"""
+        state = {"horizontal_walls": self.maze.rows_with_horizontal_walls,
+                 "vertical_walls": self.maze.rows_with_vertical_walls}
+        if self.virtual:
+            state["virtual"] = True
+        with open(path + ".tmp", 'w') as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+        self.maze.tag_store.save(get_store_file_path(path))
+
+    def save_yaml(self, path: str):
+        """Saves the yaml of the maze and the lookup table of its tags next to it (see tag_lookup.py)"""
+        write_maze_yaml(self.maze.tag_store.tags, path)
+        save_lookup_table(self.maze.tag_store, self.maze.number_of_rows, self.maze.number_of_columns,
+                          get_lookup_file_path(path))
+
+    def get_rows(self, placement: Placement) -> List[List[int]]:
+        if placement == Placement.HORIZONTAL:
+            return self.maze.rows_with_horizontal_walls
+        return self.maze.rows_with_vertical_walls
+
+    def get_wall_id(self, slot: WallSlot) -> int:
+        """Returns the (signed) smallest tag ID of the wall at a slot, -1 if there is no wall"""
+        placement, row, column = slot
+        rows = self.get_rows(placement)
+        assert 0 <= row < len(rows) and 0 <= column < len(rows[row]), f"There is no wall slot {slot} in the maze"
+        return rows[row][column]
+
+    def edit(self, changes: List[Tuple[WallSlot, int]]) -> dict:
+        """Sets the walls at the given slots to the given smallest tag IDs (-1 removes a wall). Only the tags of these
+        walls are created, all others are copied from the current tag store. Returns the diff of the tag poses."""
+        store = self.maze.tag_store
+        removed_wall_indices = [store.find_wall(*slot) for slot, _ in changes]
+        removed_wall_indices = [wall_index for wall_index in removed_wall_indices if wall_index is not None]
+        added = [(slot, tag_id) for slot, tag_id in changes if tag_id != -1]
+        for slot, tag_id in added:
+            assert tag_id % 2 == 0, "IDs must be even"
+        added_walls = self.maze.create_tag_store([slot[0].value for slot, _ in added], [slot[1] for slot, _ in added],
+                                                 [slot[2] for slot, _ in added], [tag_id for _, tag_id in added])
+        new_store = store.patch(removed_wall_indices, added_walls)
+        assert new_store.validate(), "The edit would use a wall twice."
+
+        old_tags = np.concatenate([store.tags[:0]] + [store.get_wall_tags(idx) for idx in removed_wall_indices])
+        self.maze.tag_store = new_store
+        for (placement, row, column), tag_id in changes:
+            self.get_rows(placement)[row][column] = tag_id
+        return get_tag_diff(old_tags, added_walls.tags)
+
+    def flip(self, slot: WallSlot) -> dict:
+        tag_id = self.get_wall_id(slot)
+        assert tag_id != -1, f"There is no wall at {slot} to flip"
+        assert tag_id != 0, "The wall with tag ID 0 is a special case that is not allowed to look downwards or right."
+        return self.edit([(slot, -tag_id)])
+
+    def move(self, slot: WallSlot, new_slot: WallSlot) -> dict:
+        tag_id = self.get_wall_id(slot)
+        assert tag_id != -1, f"There is no wall at {slot} to move"
+        assert self.get_wall_id(new_slot) == -1, f"There is already a wall at {new_slot}"
+        return self.edit([(slot, -1), (new_slot, tag_id)])
+
+    def add(self, slot: WallSlot, tag_id: int) -> dict:
+        assert tag_id != -1, "Use remove to remove a wall"
+        assert self.get_wall_id(slot) == -1, f"There is already a wall at {slot}"
+        return self.edit([(slot, tag_id)])
+
+    def remove(self, slot: WallSlot) -> dict:
+        assert self.get_wall_id(slot) != -1, f"There is no wall at {slot} to remove"
+        return self.edit([(slot, -1)])
+
+    def swap(self, slot: WallSlot, other_slot: WallSlot) -> dict:
+        tag_id = self.get_wall_id(slot)
+        other_tag_id = self.get_wall_id(other_slot)
+        assert tag_id != -1 and other_tag_id != -1, "Both walls must exist to swap them"
+        return self.edit([(slot, other_tag_id), (other_slot, tag_id)])
+
+
+def apply_edit(state: MazeState, edit: str, arguments: List[str]) -> Optional[dict]:
+    """Applies an edit given on the command line and returns the diff of the tag poses (None for init)"""
+    if edit == "init":
+        return None
+    slot = parse_wall_slot(arguments[0])
+    if edit == "flip":
+        return state.flip(slot)
+    if edit == "remove":
+        return state.remove(slot)
+    if edit == "add":
+        return state.add(slot, int(arguments[1]))
+    if edit == "move":
+        return state.move(slot, parse_wall_slot(arguments[1]))
+    return state.swap(slot, parse_wall_slot(arguments[1]))
+
+
+def main():
+    """Applies one edit to a maze state, saves the state and its patched tag store, writes its yaml (<state>.yaml) from
+    the store and saves the diff of the tag poses (<state>.diff.json), so that the detection can reload only the
+    changed tags."""
+    args = parser.parse_args()
+    if args.virtual:
+        set_wall_inventory(WallInventory.from_file(VIRTUAL_WALL_INVENTORY_PATH))
+    state = MazeState.from_file(args.state)
+    state.virtual = state.virtual or args.virtual
+    diff = apply_edit(state, args.edit, args.arguments)
+    base_path = os.path.splitext(args.state)[0]
+    state.save(args.state)
+    state.save_yaml(base_path + ".yaml")
+    print(f"Maze yaml file was saved to {base_path}.yaml.")
+    if diff is not None:
+        with open(base_path + ".diff.json", 'w') as f:
+            json.dump(diff, f, indent=1)
+        print(f"{len(diff['added'])} tags added, {len(diff['removed'])} removed and {len(diff['changed'])} changed "
+              f"(see {base_path}.diff.json).")
+
+
+if __name__ == '__main__':
+    main()
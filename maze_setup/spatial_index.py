@@ -0,0 +1,184 @@
+import time
+import argparse
+from typing import List
+from typing import Optional
+import numpy as np
+from wall import Wall
+from wall import Orientation
+from tag_store import TagStore
+from maze import Maze
+from wall_inventory import WallInventory
+from wall_inventory import VIRTUAL_WALL_INVENTORY_PATH
+from wall_inventory import set_wall_inventory
+
+# Direction of the z axis of a tag (the direction it looks to) in the maze frame, indexed by Orientation value
+TAG_NORMALS = np.array([[-1, 0],   # NORTH
+                        [0, -1],   # WEST
+                        [1, 0],    # SOUTH
+                        [0, 1]])   # EAST
+
+parser = argparse.ArgumentParser(
+    description='Benchmarks the spatial index of tags on a random maze of virtual walls.',
+    epilog='Example: "python spatial_index.py --rows=60 --columns=60 --queries=10000"'
+)
+parser.add_argument(
+    '--rows', type=int, required=False, default=60, dest="rows",
+    help='Number of rows of the maze (default: 60)'
+)
+parser.add_argument(
+    '--columns', type=int, required=False, default=60, dest="columns",
+    help='Number of columns of the maze (default: 60)'
+)
+parser.add_argument(
+    '--queries', type=int, required=False, default=10000, dest="queries",
+    help='Number of camera poses queried in one batch (default: 10000)'
+)
+parser.add_argument(
+    '--radius', type=float, required=False, default=1000, dest="radius",
+    help='Radius and range of the queries in mm (default: 1000)'
+)
+
+
+class TagSpatialIndex(object):
+    """Uniform grid over the tag positions (in the x-y plane of the maze, z is ignored) with one bucket per maze cell.
+    The tags of all cells are stored in one array sorted by cell (CSR layout), so a query only looks at the tags of the
+    cells around it. All queries take batches of camera positions and are vectorized over the batch."""
+
+    def __init__(self, tag_ids: np.ndarray, positions: np.ndarray, orientations: np.ndarray, cell_size: float):
+        self.cell_size = cell_size
+        self.origin = positions.min(axis=0) if len(positions) > 0 else np.zeros(2)
+        cells = np.floor((positions - self.origin) / cell_size).astype(np.int64)
+        self.num_cells = cells.max(axis=0) + 1 if len(positions) > 0 else np.ones(2, dtype=np.int64)
+        keys = cells[:, 0] * self.num_cells[1] + cells[:, 1]
+        order = np.argsort(keys, kind="stable")
+        self.tag_ids = tag_ids[order]
+        self.positions = positions[order]
+        self.orientations = orientations[order]
+        # the tags of cell key are self.tag_ids[self.cell_starts[key]:self.cell_starts[key + 1]]
+        self.cell_starts = np.searchsorted(keys[order], np.arange(self.num_cells.prod() + 1))
+
+    @classmethod
+    def from_tag_store(cls, tag_store: TagStore, cell_size: float):
+        tags = tag_store.tags
+        positions = np.stack([tags["x"], tags["y"]], axis=1).astype(float)
+        return cls(tags["tag_id"].astype(np.int64), positions, tags["orientation"].astype(np.int64), cell_size)
+
+    @classmethod
+    def from_maze(cls, maze: Maze):
+        """Creates the index of the tags of a maze (after Maze.create_walls) with the maze cells as buckets"""
+        return cls.from_tag_store(maze.tag_store, maze.space_between_walls + Wall.width)
+
+    def get_candidates(self, points: np.ndarray, radius: float):
+        """Returns (query index, tag index) of all tags in the cells that intersect the square of size 2 * radius
+        around each point"""
+        span = int(np.ceil(2 * radius / self.cell_size)) + 1
+        first_cells = np.floor((points - radius - self.origin) / self.cell_size).astype(np.int64)
+        rows = first_cells[:, 0, np.newaxis, np.newaxis] + np.arange(span)[np.newaxis, :, np.newaxis]
+        columns = first_cells[:, 1, np.newaxis, np.newaxis] + np.arange(span)[np.newaxis, np.newaxis, :]
+        valid = (rows >= 0) & (rows < self.num_cells[0]) & (columns >= 0) & (columns < self.num_cells[1])
+        keys = np.where(valid, rows * self.num_cells[1] + columns, 0).reshape(len(points), -1)
+        starts = self.cell_starts[keys]
+        counts = np.where(valid.reshape(len(points), -1), self.cell_starts[keys + 1] - starts, 0).ravel()
+        starts = starts.ravel()
+        # expand the ranges of tags of all cells into one array of tag indices
+        offsets = np.cumsum(counts) - counts
+        tag_indices = np.arange(counts.sum()) - np.repeat(offsets - starts, counts)
+        query_indices = np.repeat(np.repeat(np.arange(len(points)), span * span), counts)
+        return query_indices, tag_indices
+
+    def filter_orientations(self, tag_indices: np.ndarray, orientations: Optional[List[Orientation]]) -> np.ndarray:
+        if orientations is None:
+            return np.ones(len(tag_indices), dtype=bool)
+        return np.isin(self.orientations[tag_indices], [orientation.value for orientation in orientations])
+
+    def split_by_query(self, query_indices: np.ndarray, tag_indices: np.ndarray, num_queries: int) -> List[np.ndarray]:
+        bounds = np.searchsorted(query_indices, np.arange(num_queries + 1))
+        return [self.tag_ids[tag_indices[bounds[idx]:bounds[idx + 1]]] for idx in range(num_queries)]
+
+    def query_radius(self, points: np.ndarray, radius: float, facing: bool = False,
+                     orientations: Optional[List[Orientation]] = None) -> List[np.ndarray]:
+        """Returns the IDs of the tags within radius (mm) of each point (one array per point). With facing only tags
+        whose front looks towards the point are returned, orientations restricts the directions the tags look to."""
+        points = np.atleast_2d(np.asarray(points, dtype=float))[:, :2]
+        query_indices, tag_indices = self.get_candidates(points, radius)
+        to_points = points[query_indices] - self.positions[tag_indices]
+        keep = np.einsum("ij,ij->i", to_points, to_points) <= radius ** 2
+        if facing:
+            keep &= np.einsum("ij,ij->i", to_points, TAG_NORMALS[self.orientations[tag_indices]]) > 0
+        keep &= self.filter_orientations(tag_indices, orientations)
+        return self.split_by_query(query_indices[keep], tag_indices[keep], len(points))
+
+    def query_frustum(self, points: np.ndarray, headings: np.ndarray, field_of_view: float, max_range: float,
+                      orientations: Optional[List[Orientation]] = None) -> List[np.ndarray]:
+        """Returns the IDs of the tags a camera could see from each point (one array per camera): tags within
+        max_range (mm) and within the horizontal field_of_view (rad) around the heading (rad, measured from the x
+        axis towards the y axis) that look towards the camera. Walls in between are not considered."""
+        points = np.atleast_2d(np.asarray(points, dtype=float))[:, :2]
+        headings = np.broadcast_to(np.asarray(headings, dtype=float), (len(points),))
+        query_indices, tag_indices = self.get_candidates(points, max_range)
+        to_tags = self.positions[tag_indices] - points[query_indices]
+        distances = np.sqrt(np.einsum("ij,ij->i", to_tags, to_tags))
+        directions = np.stack([np.cos(headings), np.sin(headings)], axis=1)[query_indices]
+        keep = distances <= max_range
+        keep &= np.einsum("ij,ij->i", to_tags, directions) >= distances * np.cos(field_of_view / 2)
+        keep &= np.einsum("ij,ij->i", to_tags, TAG_NORMALS[self.orientations[tag_indices]]) < 0
+        keep &= self.filter_orientations(tag_indices, orientations)
+        return self.split_by_query(query_indices[keep], tag_indices[keep], len(points))
+
+
+def main():
+    """Builds a random maze of virtual walls, checks the queries against a brute force search over all tags and
+    reports the time per query"""
+    args = parser.parse_args()
+    set_wall_inventory(WallInventory.from_file(VIRTUAL_WALL_INVENTORY_PATH))
+    rng = np.random.default_rng(0)
+    maze = Maze()
+    maze.set_number_of_rows(args.rows)
+    maze.set_number_of_columns(args.columns)
+    num_horizontal_walls = (args.rows + 1) * args.columns
+    num_walls = num_horizontal_walls + args.rows * (args.columns + 1)
+    smallest_tag_ids = np.where(rng.random(num_walls) < 0.5, 336 + 4 * np.arange(num_walls), -1)
+    maze.rows_with_horizontal_walls = smallest_tag_ids[:num_horizontal_walls].reshape(args.rows + 1, -1).tolist()
+    maze.rows_with_vertical_walls = smallest_tag_ids[num_horizontal_walls:].reshape(args.rows, -1).tolist()
+    maze.create_walls()
+
+    start = time.perf_counter()
+    index = TagSpatialIndex.from_maze(maze)
+    print(f"Index of {len(maze.tag_store.tags)} tags on {len(maze.tag_store.walls)} walls built in "
+          f"{1000 * (time.perf_counter() - start):.1f}ms")
+
+    size = np.array([args.rows, args.columns]) * index.cell_size
+    points = rng.random((args.queries, 2)) * size
+    headings = rng.random(args.queries) * 2 * np.pi
+    field_of_view = np.radians(70)
+    start = time.perf_counter()
+    radius_results = index.query_radius(points, args.radius, facing=True)
+    radius_time = time.perf_counter() - start
+    start = time.perf_counter()
+    frustum_results = index.query_frustum(points, headings, field_of_view, args.radius)
+    frustum_time = time.perf_counter() - start
+    print(f"{args.queries} radius queries: {1e6 * radius_time / args.queries:.1f}us per query, "
+          f"{np.mean([len(result) for result in radius_results]):.1f} tags on average")
+    print(f"{args.queries} frustum queries: {1e6 * frustum_time / args.queries:.1f}us per query, "
+          f"{np.mean([len(result) for result in frustum_results]):.1f} tags on average")
+
+    # brute force over all tags for some of the queries
+    positions = index.positions
+    normals = TAG_NORMALS[index.orientations]
+    num_checks = min(100, args.queries)
+    start = time.perf_counter()
+    for idx in range(num_checks):
+        to_point = points[idx] - positions
+        distances = np.linalg.norm(to_point, axis=1)
+        in_radius = (distances <= args.radius) & (np.einsum("ij,ij->i", to_point, normals) > 0)
+        assert set(index.tag_ids[in_radius]) == set(radius_results[idx]), "Radius query differs from brute force"
+        direction = np.array([np.cos(headings[idx]), np.sin(headings[idx])])
+        in_frustum = (distances <= args.radius) & (-to_point @ direction >= distances * np.cos(field_of_view / 2)) & \
+            (np.einsum("ij,ij->i", to_point, normals) > 0)
+        assert set(index.tag_ids[in_frustum]) == set(frustum_results[idx]), "Frustum query differs from brute force"
+    print(f"Results are equal to a brute force search over all tags "
+          f"({1e6 * (time.perf_counter() - start) / num_checks:.1f}us per radius and frustum query).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import os
+import argparse
+from dataclasses import dataclass
+from typing import List
+from typing import Optional
+from typing import Tuple
+import numpy as np
+from wall import Placement
+from wall import Orientation
+from tag_store import TagStore
+from wall_inventory import get_wall_inventory
+
+# The physical walls were lasered from 7 plates with 12 walls (48 tag IDs) each, plate n has the tag IDs 48 * (n - 1) to
+# 48 * n - 1 (see the tag numbers in create_plate_for_laser.py). Tags with higher IDs are virtual.
+TAG_IDS_PER_PLATE = 48
+NUM_PLATES = 7
+
+# One row per tag ID (the row index is the tag ID, rows of IDs that are not in the maze have tag_id -1).
+# wall_index is the row of the wall in the tag store, row and column the position of the wall in the rows of horizontal
+# or vertical walls and cell_row and cell_column the grid cell the tag looks into (-1 outside the maze).
+# wall_tag_ids are the tag IDs on the wall in the order of the wall inventory (big and small tag on the front, big and
+# small tag on the back, -1 if there is no tag). plate is -1 for virtual tags.
+LOOKUP_DTYPE = np.dtype([("tag_id", np.int32),
+                         ("wall_index", np.int32),
+                         ("smallest_tag_id", np.int32),
+                         ("placement", np.int8),
+                         ("row", np.int32),
+                         ("column", np.int32),
+                         ("cell_row", np.int32),
+                         ("cell_column", np.int32),
+                         ("orientation", np.int8),
+                         ("front", np.bool_),
+                         ("size", np.int16),
+                         ("x", np.int32),
+                         ("y", np.int32),
+                         ("z", np.int32),
+                         ("wall_tag_ids", np.int32, (4,)),
+                         ("plate", np.int16)])
+
+parser = argparse.ArgumentParser(
+    description='Prints what is known about tag IDs from the lookup table of a maze.',
+    epilog='Example: "python tag_lookup.py output/tags.lookup.npz 22 97"'
+)
+parser.add_argument(
+    'lookup_file', type=str,
+    help='The path to the lookup table (<name>.lookup.npz next to the yaml file of the maze)'
+)
+parser.add_argument(
+    'tag_ids', type=int, nargs='+',
+    help='The tag IDs to look up'
+)
+
+
+@dataclass
+class TagInfo:
+    tag_id: int
+    wall_index: int
+    smallest_tag_id: int
+    placement: Placement
+    row: int
+    column: int
+    cell: Optional[Tuple[int, int]]
+    orientation: Orientation
+    side: str
+    size: int
+    position: Tuple[int, int, int]
+    siblings: List[int]
+    plate: Optional[int]
+
+
+def get_lookup_file_path(yaml_path: str) -> str:
+    return os.path.splitext(yaml_path)[0] + ".lookup.npz"
+
+
+def create_lookup_table(tag_store: TagStore, number_of_rows: int, number_of_columns: int) -> np.ndarray:
+    """Creates the table of all tags of a maze indexed by tag ID"""
+    tags = tag_store.tags
+    walls = tag_store.walls[tags["wall_index"]]
+    table = np.zeros(int(tags["tag_id"].max()) + 1 if len(tags) > 0 else 0, dtype=LOOKUP_DTYPE)
+    table["tag_id"] = -1
+
+    for name in ["tag_id", "wall_index", "orientation", "size", "x", "y", "z"]:
+        table[name][tags["tag_id"]] = tags[name]
+    for name in ["smallest_tag_id", "placement", "row", "column"]:
+        table[name][tags["tag_id"]] = walls[name]
+
+    # the tag looks into the cell in front of it, tags looking north or west into the cell before the wall
+    orientations = tags["orientation"]
+    cell_row = walls["row"] - (orientations == Orientation.NORTH.value)
+    cell_column = walls["column"] - (orientations == Orientation.WEST.value)
+    inside = (cell_row >= 0) & (cell_row < number_of_rows) & (cell_column >= 0) & (cell_column < number_of_columns)
+    table["cell_row"][tags["tag_id"]] = np.where(inside, cell_row, -1)
+    table["cell_column"][tags["tag_id"]] = np.where(inside, cell_column, -1)
+
+    wall_tag_ids = get_wall_inventory().get_tag_ids_array(np.abs(walls["smallest_tag_id"]))
+    table["wall_tag_ids"][tags["tag_id"]] = wall_tag_ids
+    table["front"][tags["tag_id"]] = (wall_tag_ids[:, 0] == tags["tag_id"]) | (wall_tag_ids[:, 1] == tags["tag_id"])
+    plates = tags["tag_id"] // TAG_IDS_PER_PLATE + 1
+    table["plate"][tags["tag_id"]] = np.where(plates <= NUM_PLATES, plates, -1)
+    return table
+
+
+def save_lookup_table(tag_store: TagStore, number_of_rows: int, number_of_columns: int, path: str):
+    """Saves the lookup table of a maze (see create_lookup_table) as compressed npz file"""
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, table=create_lookup_table(tag_store, number_of_rows, number_of_columns))
+
+
+class TagLookup(object):
+    """Loads the lookup table of a maze once. A lookup is a single index into the table, no walls are searched."""
+
+    def __init__(self, table: np.ndarray):
+        self.table = table
+
+    @classmethod
+    def from_file(cls, path: str):
+        assert os.path.isfile(path), f"Given path {path} does not exist"
+        with np.load(path) as data:
+            return cls(data["table"])
+
+    def __contains__(self, tag_id: int) -> bool:
+        return 0 <= tag_id < len(self.table) and self.table["tag_id"][tag_id] == tag_id
+
+    def get(self, tag_id: int) -> Optional[TagInfo]:
+        """Returns what is known about a tag, None if the tag is not in the maze"""
+        if tag_id not in self:
+            return None
+        row = self.table[tag_id]
+        cell = (int(row["cell_row"]), int(row["cell_column"])) if row["cell_row"] != -1 else None
+        return TagInfo(tag_id=tag_id,
+                       wall_index=int(row["wall_index"]),
+                       smallest_tag_id=int(row["smallest_tag_id"]),
+                       placement=Placement(int(row["placement"])),
+                       row=int(row["row"]),
+                       column=int(row["column"]),
+                       cell=cell,
+                       orientation=Orientation(int(row["orientation"])),
+                       side="front" if row["front"] else "back",
+                       size=int(row["size"]),
+                       position=(int(row["x"]), int(row["y"]), int(row["z"])),
+                       siblings=[int(sibling) for sibling in row["wall_tag_ids"] if sibling not in (-1, tag_id)],
+                       plate=int(row["plate"]) if row["plate"] != -1 else None)
+
+
+def main():
+    args = parser.parse_args()
+    lookup = TagLookup.from_file(args.lookup_file)
+    for tag_id in args.tag_ids:
+        print(lookup.get(tag_id) or f"Tag {tag_id} is not in the maze.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+import os
+from typing import List
+from typing import Optional
+import numpy as np
+from wall import Wall
+from wall import Tag
+from wall import Placement
+from wall import Orientation
+from wall import Position
+from wall import Size
+from wall_inventory import get_wall_inventory
+
+# One row per tag. wall_index is the row of the wall in WALL_DTYPE the tag belongs to.
+TAG_DTYPE = np.dtype([("tag_id", np.int32),
+                      ("x", np.int32),
+                      ("y", np.int32),
+                      ("z", np.int32),
+                      ("orientation", np.int8),
+                      ("size", np.int16),
+                      ("wall_index", np.int32)])
+
+# One row per wall. row and column give the position of the wall in the rows of horizontal or vertical walls, the tags
+# of the wall are the rows first_tag to first_tag + num_tags - 1 in TAG_DTYPE.
+WALL_DTYPE = np.dtype([("smallest_tag_id", np.int32),
+                       ("placement", np.int8),
+                       ("x", np.int32),
+                       ("y", np.int32),
+                       ("z", np.int32),
+                       ("row", np.int32),
+                       ("column", np.int32),
+                       ("first_tag", np.int32),
+                       ("num_tags", np.int8)])
+
+
+class TagStore(object):
+    """Compact columnar storage of all walls and tags of a maze in two numpy structured arrays (see WALL_DTYPE and
+    TAG_DTYPE). The Wall and Tag objects of the maze are views over the rows of the arrays (see WallView and TagView)."""
+
+    def __init__(self, walls: np.ndarray, tags: np.ndarray):
+        self.walls = walls
+        self.tags = tags
+        self._wall_views: Optional[List[Wall]] = None
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0, dtype=WALL_DTYPE), np.zeros(0, dtype=TAG_DTYPE))
+
+    @classmethod
+    def from_file(cls, path: str):
+        """Loads a store that was saved with save"""
+        assert os.path.isfile(path), f"Given path {path} does not exist"
+        with np.load(path) as data:
+            return cls(data["walls"], data["tags"])
+
+    def save(self, path: str):
+        """Saves the walls and tags as npz file (uncompressed, it is read again on every edit of a maze state)"""
+        with open(path, 'wb') as f:
+            np.savez(f, walls=self.walls, tags=self.tags)
+
+    @classmethod
+    def from_arrays(cls, placements: np.ndarray, pos_x: np.ndarray, pos_y: np.ndarray, pos_z: np.ndarray,
+                    smallest_tag_ids: np.ndarray, rows: np.ndarray, columns: np.ndarray):
+        """Creates the store for all walls at once from arrays with one entry per wall (placement value, position and
+        smallest tag ID of the wall as in Wall, row and column of the wall). All tags are computed with numpy
+        broadcasting over the walls and the four tag slots of a wall, in the same order as Wall.get_tags."""
+        num_walls = len(smallest_tag_ids)
+        smallest_tag_ids = np.asarray(smallest_tag_ids)
+        tag_ids = get_wall_inventory().get_tag_ids_array(np.abs(smallest_tag_ids))
+        # south or east orientation of smallest tag, therefore the order of the tag ids is changed
+        flipped = smallest_tag_ids < 0
+        tag_ids[flipped] = tag_ids[flipped][:, [2, 3, 0, 1]]
+
+        # every tag is given by its wall and its slot on the wall (0 and 1 look to left or up, 2 and 3 are on the other
+        # side of the wall). The values are computed for all four slots of the walls at once from the tables below
+        # (one row per placement value), then the slots without tag are left out.
+        has_tag = tag_ids != -1
+        # summing the four columns is much faster than a reduction along the short rows
+        num_tags = has_tag[:, 0].astype(np.int8) + has_tag[:, 1] + has_tag[:, 2] + has_tag[:, 3]
+        placements = np.asarray(placements)
+        thickness = Wall.thickness
+        north, west, south, east = (orientation.value for orientation in Orientation)
+        slot_x_offsets = np.array([[0, 0, thickness, thickness], [0, 0, 0, 0]], dtype=np.int32)
+        slot_y_offsets = np.array([[0, 0, 0, 0], [0, 0, thickness, thickness]], dtype=np.int32)
+        slot_orientations = np.array([[north, north, south, south], [west, west, east, east]], dtype=np.int8)
+        slot_sizes = np.array([Wall.big_tag_size, Wall.small_tag_size] * 2, dtype=np.int16)
+
+        tags = np.zeros(int(num_tags.sum()), dtype=TAG_DTYPE)
+        tags["tag_id"] = tag_ids[has_tag]
+        tags["x"] = (np.asarray(pos_x, dtype=np.int32)[:, np.newaxis] + slot_x_offsets[placements])[has_tag]
+        tags["y"] = (np.asarray(pos_y, dtype=np.int32)[:, np.newaxis] + slot_y_offsets[placements])[has_tag]
+        tags["z"] = np.repeat(np.asarray(pos_z, dtype=np.int32), num_tags)
+        tags["orientation"] = slot_orientations[placements][has_tag]
+        tags["size"] = np.tile(slot_sizes, (num_walls, 1))[has_tag]
+        tags["wall_index"] = np.repeat(np.arange(num_walls, dtype=np.int32), num_tags)
+
+        walls = np.zeros(num_walls, dtype=WALL_DTYPE)
+        walls["smallest_tag_id"] = smallest_tag_ids
+        walls["placement"] = placements
+        walls["x"] = pos_x
+        walls["y"] = pos_y
+        walls["z"] = pos_z
+        walls["row"] = rows
+        walls["column"] = columns
+        walls["first_tag"] = np.cumsum(num_tags) - num_tags
+        walls["num_tags"] = num_tags
+        return cls(walls, tags)
+
+    def find_wall(self, placement: Placement, row: int, column: int) -> Optional[int]:
+        """Returns the index of the wall at the given row and column of horizontal or vertical walls (None if there is
+        no wall)"""
+        indices = np.flatnonzero((self.walls["placement"] == placement.value) & (self.walls["row"] == row) &
+                                 (self.walls["column"] == column))
+        return int(indices[0]) if len(indices) > 0 else None
+
+    def get_wall_tags(self, wall_index: int) -> np.ndarray:
+        """Returns the rows of the tags of a wall"""
+        first_tag = int(self.walls["first_tag"][wall_index])
+        return self.tags[first_tag:first_tag + int(self.walls["num_tags"][wall_index])]
+
+    def patch(self, removed_wall_indices: List[int], added_walls: "TagStore") -> "TagStore":
+        """Returns a new store without the removed walls and with the added walls. The rows of all other walls and
+        their tags are copied, not computed again. Walls are kept in the order of Maze.create_walls (horizontal walls
+        before vertical walls, each by row and column), so a patched store equals a newly created one."""
+        keep = np.ones(len(self.walls), dtype=bool)
+        keep[np.asarray(removed_wall_indices, dtype=np.int64)] = False
+        kept_tags = keep[self.tags["wall_index"]]
+        walls = np.concatenate([self.walls[keep], added_walls.walls])
+        tags = np.concatenate([self.tags[kept_tags], added_walls.tags])
+        # index of the wall of every tag in the concatenated walls
+        wall_indices = np.concatenate([(np.cumsum(keep) - 1)[self.tags["wall_index"][kept_tags]],
+                                       added_walls.tags["wall_index"] + int(keep.sum())])
+
+        order = np.lexsort((walls["column"], walls["row"], walls["placement"]))
+        new_wall_indices = np.empty(len(order), dtype=np.int64)
+        new_wall_indices[order] = np.arange(len(order))
+        walls = walls[order]
+        tags["wall_index"] = new_wall_indices[wall_indices]
+        tags = tags[np.argsort(tags["wall_index"], kind="stable")]
+        num_tags = walls["num_tags"].astype(np.int64)
+        walls["first_tag"] = np.cumsum(num_tags) - num_tags
+        return TagStore(walls, tags)
+
+    def validate(self) -> bool:
+        """Checks that every tag ID is there only once. As the tag IDs of different walls in the wall inventory do not
+        overlap, it is enough to check that no wall is used twice (sorting is much faster than np.unique here)."""
+        wall_ids = np.sort(np.abs(self.walls["smallest_tag_id"]))
+        if np.any(wall_ids[1:] == wall_ids[:-1]):
+            print("Each tag ID must only be there once.")
+            return False
+        return True
+
+    def get_walls(self) -> List[Wall]:
+        """Returns Wall views of all walls (created once on first access)"""
+        if self._wall_views is None:
+            self._wall_views = [WallView(self, wall_index) for wall_index in range(len(self.walls))]
+        return self._wall_views
+
+
+class TagView(Tag):
+    """Tag that reads its data from a row of a TagStore"""
+
+    def __init__(self, store: TagStore, index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def tag_id(self) -> int:
+        return int(self._store.tags["tag_id"][self._index])
+
+    @property
+    def position(self) -> Position:
+        tag = self._store.tags[self._index]
+        return Position(int(tag["x"]), int(tag["y"]), int(tag["z"]))
+
+    @property
+    def orientation(self) -> Orientation:
+        return Orientation(int(self._store.tags["orientation"][self._index]))
+
+    @property
+    def size(self) -> Size:
+        size = int(self._store.tags["size"][self._index])
+        return Size(size, size)
+
+
+class WallView(Wall):
+    """Wall that reads its data from a row of a TagStore"""
+
+    def __init__(self, store: TagStore, index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def placement(self) -> Placement:
+        return Placement(int(self._store.walls["placement"][self._index]))
+
+    @property
+    def pos_x(self) -> int:
+        return int(self._store.walls["x"][self._index])
+
+    @property
+    def pos_y(self) -> int:
+        return int(self._store.walls["y"][self._index])
+
+    @property
+    def pos_z(self) -> int:
+        return int(self._store.walls["z"][self._index])
+
+    @property
+    def smallest_tag_id(self) -> int:
+        return int(self._store.walls["smallest_tag_id"][self._index])
+
+    @property
+    def tags(self) -> List[Tag]:
+        wall = self._store.walls[self._index]
+        first_tag = int(wall["first_tag"])
+        return [TagView(self._store, tag_index) for tag_index in range(first_tag, first_tag + int(wall["num_tags"]))]
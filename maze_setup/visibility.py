@@ -0,0 +1,188 @@
+import os
+import argparse
+from typing import Optional
+import numpy as np
+from maze import Maze
+from wall import Wall
+from spatial_index import TagSpatialIndex
+from wall_inventory import WallInventory
+from wall_inventory import VIRTUAL_WALL_INVENTORY_PATH
+from wall_inventory import set_wall_inventory
+
+# Offline stage that precomputes which tags can be seen from every maze cell (and heading bin). A tag is visible from
+# a cell if it looks towards the center of the cell, is within max_range and no wall is on the straight line between
+# the center of the cell and the center of the tag. With more than one heading bin the tag must also be within the
+# field of view of a camera looking in a direction of the bin. The result is a bitset per cell and heading bin over the
+# tags of the tag store, saved as <name>.visibility.npz next to the yaml file.
+
+DEFAULT_FIELD_OF_VIEW = 70  # degrees
+DEFAULT_MAX_RANGE = 2500  # mm
+# number of rays that are cast at once
+RAY_CHUNK_SIZE = 200000
+
+parser = argparse.ArgumentParser(
+    description='Precomputes which tags are visible from every maze cell of a layout file.',
+    epilog='Example: "python visibility.py output/lab.json --heading_bins=8"'
+)
+parser.add_argument(
+    'layout', type=str,
+    help='The path to a layout file (json or csv, see maze_builder.py). The table is saved next to it as '
+         '<name>.visibility.npz'
+)
+parser.add_argument(
+    '--heading_bins', type=int, required=False, default=1, dest="heading_bins",
+    help='Number of heading bins per cell (default: 1, i.e. the camera may look in any direction)'
+)
+parser.add_argument(
+    '--field_of_view', type=float, required=False, default=DEFAULT_FIELD_OF_VIEW, dest="field_of_view",
+    help=f'Horizontal field of view of the camera in degrees, only used with heading bins '
+         f'(default: {DEFAULT_FIELD_OF_VIEW})'
+)
+parser.add_argument(
+    '--max_range', type=float, required=False, default=DEFAULT_MAX_RANGE, dest="max_range",
+    help=f'Maximum distance between camera and tag in mm (default: {DEFAULT_MAX_RANGE})'
+)
+parser.add_argument(
+    '--virtual', action='store_true', required=False, dest="virtual",
+    help='Use the virtual wall inventory (do_not_touch/wall_inventory_virtual.json) for simulated mazes'
+)
+
+
+def get_visibility_file_path(yaml_path: str) -> str:
+    return os.path.splitext(yaml_path)[0] + ".visibility.npz"
+
+
+def get_cell_centers(maze: Maze) -> np.ndarray:
+    """Returns the centers (x, y) of all cells of the maze, row by row"""
+    pitch = maze.space_between_walls + Wall.width
+    rows, columns = np.divmod(np.arange(maze.number_of_rows * maze.number_of_columns), maze.number_of_columns)
+    offset = maze.space_between_walls + Wall.width / 2
+    return np.stack([offset + rows * pitch, offset + columns * pitch], axis=1)
+
+
+def get_crossed_walls(starts: np.ndarray, ends: np.ndarray, walls: np.ndarray, axis: int, pitch: float,
+                      thickness: float) -> np.ndarray:
+    """Returns for every ray from start to end if it crosses one of the walls on the grid lines along axis (0: the
+    lines of horizontal walls x = k * pitch, 1: the lines of vertical walls y = k * pitch). walls are the smallest tag
+    IDs (or -1) indexed by [grid line, wall on the line]. Walls are treated as segments on their center line."""
+    other_axis = 1 - axis
+    start, end = starts[:, axis], ends[:, axis]
+    low, high = np.minimum(start, end), np.maximum(start, end)
+    # indices of the first and the last grid line strictly between start and end
+    first_line = np.floor((low - thickness / 2) / pitch).astype(np.int64) + 1
+    last_line = np.ceil((high - thickness / 2) / pitch).astype(np.int64) - 1
+    num_lines = np.maximum(last_line - first_line + 1, 0)
+    max_lines = int(num_lines.max()) if len(num_lines) > 0 else 0
+
+    lines = first_line[:, np.newaxis] + np.arange(max_lines)[np.newaxis, :]
+    valid = np.arange(max_lines)[np.newaxis, :] < num_lines[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (lines * pitch + thickness / 2 - start[:, np.newaxis]) / (end - start)[:, np.newaxis]
+    crossing = np.where(valid, starts[:, other_axis, np.newaxis] + t * (ends - starts)[:, other_axis, np.newaxis], 0)
+    # index of the wall on the line and position of the crossing along the wall (the gaps between walls are free)
+    wall_index = np.floor((crossing - thickness) / pitch).astype(np.int64)
+    along = crossing - thickness - wall_index * pitch
+    valid &= (lines >= 0) & (lines < walls.shape[0]) & (wall_index >= 0) & (wall_index < walls.shape[1])
+    valid &= along <= pitch - thickness
+    blocked = np.zeros(valid.shape, dtype=bool)
+    blocked[valid] = walls[lines[valid], wall_index[valid]] != -1
+    return blocked.any(axis=1)
+
+
+def compute_visibility(maze: Maze, num_heading_bins: int = 1,
+                       field_of_view: float = np.radians(DEFAULT_FIELD_OF_VIEW), max_range: float = DEFAULT_MAX_RANGE) -> np.ndarray:
+    """Returns the visibility bitset of the tags of a maze (after Maze.create_walls) with shape (number of cells,
+    num_heading_bins, number of tags / 8) as uint8 (see np.packbits). Bit j of a row is set if the tag j of the tag store
+    is visible. Heading bin b covers the headings around b * 2 * pi / num_heading_bins (rad, measured from the x axis
+    towards the y axis)."""
+    pitch = maze.space_between_walls + Wall.width
+    tags = maze.tag_store.tags
+    centers = get_cell_centers(maze)
+    bits = np.zeros((len(centers), num_heading_bins, (len(tags) + 7) // 8), dtype=np.uint8)
+    if len(tags) == 0:
+        return bits
+
+    # candidates: tags within range that look towards the center of the cell
+    index = TagSpatialIndex.from_maze(maze)
+    candidates = index.query_radius(centers, max_range, facing=True)
+    cell_indices = np.repeat(np.arange(len(centers)), [len(tag_ids) for tag_ids in candidates])
+    tag_ids = np.concatenate(candidates)
+    sorter = np.argsort(tags["tag_id"])
+    tag_indices = sorter[np.searchsorted(tags["tag_id"], tag_ids, sorter=sorter)]
+
+    horizontal_walls = np.array(maze.rows_with_horizontal_walls, dtype=np.int64).reshape(
+        -1, maze.num_horizontal_walls_per_row)
+    vertical_walls = np.array(maze.rows_with_vertical_walls, dtype=np.int64).reshape(
+        -1, maze.num_vertical_walls_per_row)
+    positions = np.stack([tags["x"], tags["y"]], axis=1).astype(float)
+    bin_width = 2 * np.pi / num_heading_bins
+    for chunk_start in range(0, len(tag_indices), RAY_CHUNK_SIZE):
+        chunk_cells = cell_indices[chunk_start:chunk_start + RAY_CHUNK_SIZE]
+        chunk_tags = tag_indices[chunk_start:chunk_start + RAY_CHUNK_SIZE]
+        starts, ends = centers[chunk_cells], positions[chunk_tags]
+        visible = ~get_crossed_walls(starts, ends, horizontal_walls, 0, pitch, maze.space_between_walls)
+        visible &= ~get_crossed_walls(starts, ends, vertical_walls.T, 1, pitch, maze.space_between_walls)
+
+        for heading_bin in range(num_heading_bins):
+            in_view = visible
+            if num_heading_bins > 1:
+                bearings = np.arctan2(ends[:, 1] - starts[:, 1], ends[:, 0] - starts[:, 0])
+                difference = np.abs((bearings - heading_bin * bin_width + np.pi) % (2 * np.pi) - np.pi)
+                in_view = visible & (difference <= field_of_view / 2 + bin_width / 2)
+            np.bitwise_or.at(bits[:, heading_bin, :], (chunk_cells[in_view], chunk_tags[in_view] >> 3),
+                             (128 >> (chunk_tags[in_view] & 7)).astype(np.uint8))
+    return bits
+
+
+def save_visibility_table(maze: Maze, path: str, num_heading_bins: int = 1,
+                          field_of_view: float = np.radians(DEFAULT_FIELD_OF_VIEW),
+                          max_range: float = DEFAULT_MAX_RANGE):
+    """Computes the visibility of the tags of a maze and saves it with the tag IDs of the bits as npz file"""
+    bits = compute_visibility(maze, num_heading_bins, field_of_view, max_range)
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, bits=bits, tag_ids=maze.tag_store.tags["tag_id"],
+                            number_of_columns=maze.number_of_columns, field_of_view=field_of_view,
+                            max_range=max_range)
+
+
+class VisibilityTable(object):
+    """Loads a visibility table once. A lookup unpacks the bitset of one cell and heading bin, no geometry is done."""
+
+    def __init__(self, bits: np.ndarray, tag_ids: np.ndarray, number_of_columns: int):
+        self.bits = bits
+        self.tag_ids = tag_ids
+        self.number_of_columns = number_of_columns
+        self.num_heading_bins = bits.shape[1]
+
+    @classmethod
+    def from_file(cls, path: str):
+        assert os.path.isfile(path), f"Given path {path} does not exist"
+        with np.load(path) as data:
+            return cls(data["bits"], data["tag_ids"], int(data["number_of_columns"]))
+
+    def get_visible_tags(self, cell_row: int, cell_column: int, heading: Optional[float] = None) -> np.ndarray:
+        """Returns the IDs of the tags visible from a cell. Without heading the tags of all heading bins are
+        returned."""
+        row = self.bits[cell_row * self.number_of_columns + cell_column]
+        if heading is None:
+            row = np.bitwise_or.reduce(row, axis=0)
+        else:
+            row = row[int(np.round(heading / (2 * np.pi / self.num_heading_bins))) % self.num_heading_bins]
+        return self.tag_ids[np.flatnonzero(np.unpackbits(row, count=len(self.tag_ids)))]
+
+
+def main():
+    from maze_builder import MazeBuilder  # maze_builder saves the visibility table, so it is imported here
+    args = parser.parse_args()
+    if args.virtual:
+        set_wall_inventory(WallInventory.from_file(VIRTUAL_WALL_INVENTORY_PATH))
+    maze_builder = MazeBuilder()
+    maze_builder.init_maze()
+    maze_builder.load_maze_from_file(args.layout)
+    path = get_visibility_file_path(args.layout)
+    save_visibility_table(maze_builder.maze, path, args.heading_bins, np.radians(args.field_of_view), args.max_range)
+    print(f"Visibility table was saved to {path}.")
+
+
+if __name__ == '__main__':
+    main()
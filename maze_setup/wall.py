@@ -2,7 +2,9 @@ from dataclasses import dataclass
 from enum import Enum
 from typing import List
 from typing import Optional
+from typing import Tuple
 import copy as cp
+from wall_inventory import get_wall_inventory
 
 
 @dataclass
@@ -50,14 +52,14 @@ class Tag(object):
 class Wall(object):
     """Describes a wall object where placement means the direction where the smallest tag id heads to, the position in x,
     y, and z is the position of the center of the tag with the smallest id."""
+    width: int = 250  # mm
+    height: int = 170  # mm
+    thickness: int = 3  # mm
+    big_tag_size: int = 140  # mm
+    small_tag_size: int = 28  # mm
 
     def __init__(self, placement: Optional[Placement] = None, pos_x: Optional[int] = None, pos_y: Optional[int] = None,
                  pos_z: Optional[int] = None, smallest_tag_id: Optional[int] = None):
-        self.width: int = 250  # mm
-        self.height: int = 170  # mm
-        self.thickness: int = 3  # mm
-        self.big_tag_size: int = 140  # mm
-        self.small_tag_size: int = 28  # mm
         self.placement: Optional[Placement] = placement
         self.tags: List[Tag] = []
         self.pos_x = pos_x
@@ -65,151 +67,42 @@ class Wall(object):
         self.pos_z = pos_z
         self.smallest_tag_id = smallest_tag_id
         if smallest_tag_id is not None:
-            tag_ids = self.get_tag_ids_to_smallest_tag_id(abs(smallest_tag_id))
-            if smallest_tag_id < 0:
-                # south or east orientation of smallest tag, therefore the order in tag_ids is changed
-                new_tag_ids = [tag_ids[2], tag_ids[3], tag_ids[0], tag_ids[1]]
-                tag_ids = cp.deepcopy(new_tag_ids)
-
-            for idx, tag_id in enumerate(tag_ids):
-                if tag_id is None:
-                    continue
-                if idx == 0 or idx == 1:  # first two tags look to left or up
-                    if self.placement == placement.HORIZONTAL:
-                        self.tags.append(Tag(orientation=Orientation.NORTH,
-                                             pos_x=pos_x,
-                                             pos_y=pos_y,
-                                             pos_z=pos_z,
-                                             size_x=self.big_tag_size if idx == 0 else self.small_tag_size,
-                                             size_y=self.big_tag_size if idx == 0 else self.small_tag_size,
-                                             tag_id=tag_id))
-                    elif self.placement == placement.VERTICAL:
-                        self.tags.append(Tag(orientation=Orientation.WEST,
-                                             pos_x=pos_x,
-                                             pos_y=pos_y,
-                                             pos_z=pos_z,
-                                             size_x=self.big_tag_size if idx == 0 else self.small_tag_size,
-                                             size_y=self.big_tag_size if idx == 0 else self.small_tag_size,
-                                             tag_id=tag_id))
-                elif idx == 2 or idx == 3:  # third and forth tag on the other side of the wall
-                    if self.placement == placement.HORIZONTAL:
-                        self.tags.append(Tag(orientation=Orientation.SOUTH,
-                                             pos_x=pos_x + self.thickness,
-                                             pos_y=pos_y,
-                                             pos_z=pos_z,
-                                             size_x=self.big_tag_size if idx == 2 else self.small_tag_size,
-                                             size_y=self.big_tag_size if idx == 2 else self.small_tag_size,
-                                             tag_id=tag_id))
-                    elif self.placement == placement.VERTICAL:
-                        self.tags.append(Tag(orientation=Orientation.EAST,
-                                             pos_x=pos_x,
-                                             pos_y=pos_y + self.thickness,
-                                             pos_z=pos_z,
-                                             size_x=self.big_tag_size if idx == 2 else self.small_tag_size,
-                                             size_y=self.big_tag_size if idx == 2 else self.small_tag_size,
-                                             tag_id=tag_id))
+            for tag_id, tag_x, tag_y, tag_z, orientation, size in self.get_tags(placement, pos_x, pos_y, pos_z,
+                                                                                  smallest_tag_id):
+                self.tags.append(Tag(orientation=orientation, pos_x=tag_x, pos_y=tag_y, pos_z=tag_z, size_x=size,
+                                     size_y=size, tag_id=tag_id))
+
+    def get_tags(self, placement: Placement, pos_x: int, pos_y: int, pos_z: int,
+                 smallest_tag_id: int) -> List[Tuple[int, int, int, int, Orientation, int]]:
+        """Returns the tags on a wall as tuples (tag id, x, y, z, orientation, size). A negative smallest_tag_id means
+        that the wall is flipped."""
+        tags = []
+        tag_ids = self.get_tag_ids_to_smallest_tag_id(abs(smallest_tag_id))
+        if smallest_tag_id < 0:
+            # south or east orientation of smallest tag, therefore the order in tag_ids is changed
+            new_tag_ids = [tag_ids[2], tag_ids[3], tag_ids[0], tag_ids[1]]
+            tag_ids = cp.deepcopy(new_tag_ids)
+
+        for idx, tag_id in enumerate(tag_ids):
+            if tag_id is None:
+                continue
+            size = self.big_tag_size if idx % 2 == 0 else self.small_tag_size
+            if idx == 0 or idx == 1:  # first two tags look to left or up
+                if placement == Placement.HORIZONTAL:
+                    tags.append((tag_id, pos_x, pos_y, pos_z, Orientation.NORTH, size))
+                elif placement == Placement.VERTICAL:
+                    tags.append((tag_id, pos_x, pos_y, pos_z, Orientation.WEST, size))
+            elif idx == 2 or idx == 3:  # third and forth tag on the other side of the wall
+                if placement == Placement.HORIZONTAL:
+                    tags.append((tag_id, pos_x + self.thickness, pos_y, pos_z, Orientation.SOUTH, size))
+                elif placement == Placement.VERTICAL:
+                    tags.append((tag_id, pos_x, pos_y + self.thickness, pos_z, Orientation.EAST, size))
+        return tags
 
     def get_tag_ids_to_smallest_tag_id(self, smallest_id: int):
         """Returns the remaining Tag IDs (including the one given) on one wall.
-        The first entry in the dictionary entry is assumed to be the smallest ID on the wall, the second entry is the ID
-        of the tag on the same side (front), the third entry is the big tag on the back and the fourth tag is the small
-        tag on the back. If there is no tag on the back, the respective entry is None."""
-        smallest_id_to_all_ids_on_wall = {
-            30: [30, 31, 40, 41],
-            24: [24, 25, 46, 47],
-            8: [8, 9, 14, 15],
-            28: [28, 29, 42, 43],
-            34: [34, 35, 36, 37],
-            4: [4, 5, 18, 19],
-            6: [6, 7, 16, 17],
-            26: [26, 27, 44, 45],
-            10: [10, 11, 12, 13],
-            2: [2, 3, 20, 21],
-            32: [32, 33, 38, 39],
-            0: [0, 1, 22, 23],
-            48: [48, 49, None, None],
-            52: [52, 53, None, None],
-            56: [56, 57, None, None],
-            60: [60, 61, None, None],
-            64: [64, 65, None, None],
-            68: [68, 69, None, None],
-            72: [72, 73, None, None],
-            76: [76, 77, None, None],
-            80: [80, 81, None, None],
-            84: [84, 85, None, None],
-            88: [88, 89, None, None],
-            92: [92, 93, None, None],
-            96: [96, 97, 98, 99],
-            100: [100, 101, 102, 103],
-            104: [104, 105, 106, 107],
-            108: [108, 109, 110, 111],
-            112: [112, 113, 114, 115],
-            116: [116, 117, 118, 119],
-            120: [120, 121, 122, 123],
-            124: [124, 125, 126, 127],
-            128: [128, 129, 130, 131],
-            132: [132, 133, 134, 135],
-            136: [136, 137, 138, 139],
-            140: [140, 141, 142, 143],
-            144: [144, 145, 146, 147],
-            148: [148, 149, 150, 151],
-            152: [152, 153, 154, 155],
-            156: [156, 157, 158, 159],
-            160: [160, 161, 162, 163],
-            164: [164, 165, 166, 167],
-            168: [168, 169, 170, 171],
-            172: [172, 173, 174, 175],
-            176: [176, 177, 178, 179],
-            180: [180, 181, 182, 183],
-            184: [184, 185, 186, 187],
-            188: [188, 189, 190, 191],
-            192: [192, 193, None, None],
-            196: [196, 197, None, None],
-            200: [200, 201, None, None],
-            204: [204, 205, None, None],
-            208: [208, 209, None, None],
-            212: [212, 213, None, None],
-            216: [216, 217, None, None],
-            220: [220, 221, None, None],
-            224: [224, 225, None, None],
-            228: [228, 229, None, None],
-            232: [232, 233, None, None],
-            236: [236, 237, None, None],
-            240: [240, 241, None, None],
-            244: [244, 245, None, None],
-            248: [248, 249, None, None],
-            252: [252, 253, None, None],
-            256: [256, 257, None, None],
-            260: [260, 261, None, None],
-            264: [264, 265, None, None],
-            268: [268, 269, None, None],
-            272: [272, 273, None, None],
-            276: [276, 277, None, None],
-            280: [280, 281, None, None],
-            284: [284, 285, None, None],
-            288: [288, 289, None, None],
-            292: [292, 293, None, None],
-            296: [296, 297, None, None],
-            300: [300, 301, None, None],
-            304: [304, 305, None, None],
-            308: [308, 309, None, None],
-            312: [312, 313, None, None],
-            316: [316, 317, None, None],
-            320: [320, 321, None, None],
-            324: [324, 325, None, None],
-            328: [328, 329, None, None],
-            332: [332, 333, None, None]
-        }
-        for key, val in smallest_id_to_all_ids_on_wall.items():
-            assert key == val[0], "First entry in the dictionary values must be the key"
-            assert len(val) == 4, "Length of dict entry must be 4."
-            for v in val[1:]:
-                if v is not None:
-                    assert v > val[0], "Smallest ID must be first entry in dictionary values"
-
-        if smallest_id not in smallest_id_to_all_ids_on_wall.keys():
-            print(
-                "There is said to be an ID {smallest_id} that does not exist in the database. Either its not defined there,"
-                "or the given ID is wrong.")
-            assert 1 == 0
-        return smallest_id_to_all_ids_on_wall[smallest_id]
+        The first entry is assumed to be the smallest ID on the wall, the second entry is the ID of the tag on the same
+        side (front), the third entry is the big tag on the back and the fourth tag is the small tag on the back. If
+        there is no tag on the back, the respective entry is None. The IDs are looked up in the wall inventory (see
+        wall_inventory.py), which is loaded and validated only once."""
+        return get_wall_inventory().get_tag_ids(smallest_id)
@@ -0,0 +1,147 @@
+import os
+import json
+import argparse
+from typing import List
+from typing import Optional
+from typing import Tuple
+import numpy as np
+from wall_inventory import WallInventory
+from wall_inventory import VIRTUAL_WALL_INVENTORY_PATH
+from wall_inventory import get_wall_inventory
+from wall_inventory import set_wall_inventory
+
+# Assigns walls of the inventory (and whether they are flipped) to the wall positions of a maze, so that as many tags as
+# possible look into the maze. A wall position (slot) is one of three kinds: both sides look into the maze (inside the
+# maze), only the front side looks into the maze (last row of horizontal walls, last column of vertical walls) or only
+# the back side (first row / column, the wall has to be flipped to look into the maze).
+# All walls of one kind (double or single sided) and all slots of one kind are interchangeable, so the assignment is
+# solved as transportation problem between these classes: the only choice is how many double sided walls go inside the
+# maze, which is searched exhaustively. Within a class the walls with the smallest IDs are used first.
+
+INNER = 0
+FRONT_ONLY = 1
+BACK_ONLY = 2
+
+# number of tags that look into the maze, indexed by [double sided, slot kind], with the best side up
+USEFUL_TAGS = np.array([[2, 2, 2],    # single sided: the front looks into the maze
+                        [4, 2, 2]])   # double sided: both sides, or the front (back for ID 0 at BACK_ONLY) is used
+
+parser = argparse.ArgumentParser(
+    description='Assigns walls of the wall inventory to the walls of a layout, so that as many tags as possible look '
+                'into the maze. Any value other than -1 in the layout marks a wall.',
+    epilog='Example: "python wall_allocator.py skeleton.json --output=output/lab.json"'
+)
+parser.add_argument(
+    'layout', type=str,
+    help='The path to a layout file (json or csv, see maze_builder.py) with the positions of the walls'
+)
+parser.add_argument(
+    '--output', type=str, required=False, default=None, dest="output",
+    help='The path the json layout with the assigned IDs is saved to (default: <name of layout>_allocated.json)'
+)
+parser.add_argument(
+    '--virtual', action='store_true', required=False, dest="virtual",
+    help='Use the virtual wall inventory (do_not_touch/wall_inventory_virtual.json) for simulated mazes'
+)
+
+
+def get_slot_kinds(number_of_rows: int, number_of_columns: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the kind of every slot of the horizontal walls ((number_of_rows + 1) x number_of_columns) and of the
+    vertical walls (number_of_rows x (number_of_columns + 1))"""
+    horizontal_kinds = np.full((number_of_rows + 1, number_of_columns), INNER, dtype=np.int8)
+    horizontal_kinds[0] = BACK_ONLY
+    horizontal_kinds[-1] = FRONT_ONLY
+    vertical_kinds = np.full((number_of_rows, number_of_columns + 1), INNER, dtype=np.int8)
+    vertical_kinds[:, 0] = BACK_ONLY
+    vertical_kinds[:, -1] = FRONT_ONLY
+    return horizontal_kinds, vertical_kinds
+
+
+def solve_num_double_sided_inside(num_inner: int, num_border: int, num_double_sided: int,
+                                  num_single_sided: int) -> int:
+    """Returns how many double sided walls are assigned to inner slots to maximize the number of useful tags. The
+    border slots are filled with the walls that are left."""
+    assert num_inner + num_border <= num_double_sided + num_single_sided, \
+        f"The wall inventory has {num_double_sided + num_single_sided} walls, but the maze has " \
+        f"{num_inner + num_border} walls."
+    inside = np.arange(min(num_inner, num_double_sided) + 1)
+    feasible = num_inner - inside <= num_single_sided
+    # the border gets the single sided walls that are left first (they are as good as double sided walls there)
+    border_single_sided = np.minimum(num_border, num_single_sided - (num_inner - inside))
+    useful_tags = inside * USEFUL_TAGS[1, INNER] + (num_inner - inside) * USEFUL_TAGS[0, INNER] + \
+        border_single_sided * USEFUL_TAGS[0, FRONT_ONLY] + (num_border - border_single_sided) * USEFUL_TAGS[1, FRONT_ONLY]
+    return int(inside[feasible][np.argmax(useful_tags[feasible])])
+
+
+def allocate_wall_ids(kinds: np.ndarray, double_sided_ids: List[int], single_sided_ids: List[int]) -> np.ndarray:
+    """Returns the signed smallest IDs for walls at slots of the given kinds (see get_slot_kinds). double_sided_ids and
+    single_sided_ids are the available walls in the order they should be used."""
+    kinds = np.asarray(kinds)
+    is_inner = kinds == INNER
+    num_inner = int(is_inner.sum())
+    num_double_sided_inside = solve_num_double_sided_inside(num_inner, len(kinds) - num_inner, len(double_sided_ids),
+                                                            len(single_sided_ids))
+    num_single_sided_inside = num_inner - num_double_sided_inside
+    double_sided_ids = np.array(double_sided_ids, dtype=np.int64)
+    single_sided_ids = np.array(single_sided_ids, dtype=np.int64)
+
+    # inner slots first, so that ID 0 (the first double sided wall) is not at a slot that has to be flipped
+    inner_slots = np.flatnonzero(is_inner)
+    border_slots = np.flatnonzero(~is_inner)
+    border_slots = border_slots[np.argsort(kinds[border_slots], kind="stable")]
+    ids = np.empty(len(kinds), dtype=np.int64)
+    ids[inner_slots] = np.concatenate([double_sided_ids[:num_double_sided_inside],
+                                       single_sided_ids[:num_single_sided_inside]])
+    ids[border_slots] = np.concatenate([single_sided_ids[num_single_sided_inside:],
+                                        double_sided_ids[num_double_sided_inside:]])[:len(border_slots)]
+    # the front of a wall looks north or west, walls whose back side looks into the maze are flipped (not ID 0)
+    return np.where((kinds == BACK_ONLY) & (ids != 0), -ids, ids)
+
+
+def count_useful_tags(ids: np.ndarray, kinds: np.ndarray) -> int:
+    """Returns the number of tags of the walls with the given signed smallest IDs that look into the maze"""
+    tag_ids = get_wall_inventory().get_tag_ids_array(np.abs(ids))
+    double_sided = tag_ids[:, 2] != -1
+    useful_tags = USEFUL_TAGS[double_sided.astype(np.int64), kinds]
+    # single sided walls whose front looks out of the maze
+    wrong_side = ~double_sided & (((kinds == BACK_ONLY) & (ids > 0)) | ((kinds == FRONT_ONLY) & (ids < 0)))
+    return int(useful_tags[~wrong_side].sum())
+
+
+def allocate_layout(rows_with_horizontal_walls: List[List[int]], rows_with_vertical_walls: List[List[int]],
+                    wall_inventory: Optional[WallInventory] = None) -> Tuple[List[List[int]], List[List[int]]]:
+    """Returns the rows with horizontal walls and the rows with vertical walls (as Maze expects them) with walls of the
+    inventory at all positions that are not -1 in the given rows"""
+    wall_inventory = wall_inventory or get_wall_inventory()
+    horizontal_walls = np.array(rows_with_horizontal_walls, dtype=np.int64) != -1
+    vertical_walls = np.array(rows_with_vertical_walls, dtype=np.int64) != -1
+    horizontal_kinds, vertical_kinds = get_slot_kinds(vertical_walls.shape[0], horizontal_walls.shape[1])
+    kinds = np.concatenate([horizontal_kinds[horizontal_walls], vertical_kinds[vertical_walls]])
+    ids = allocate_wall_ids(kinds, wall_inventory.get_smallest_ids(True, len(kinds)),
+                            wall_inventory.get_smallest_ids(False, len(kinds)))
+    horizontal_ids = np.full(horizontal_walls.shape, -1, dtype=np.int64)
+    horizontal_ids[horizontal_walls] = ids[:int(horizontal_walls.sum())]
+    vertical_ids = np.full(vertical_walls.shape, -1, dtype=np.int64)
+    vertical_ids[vertical_walls] = ids[int(horizontal_walls.sum()):]
+    return horizontal_ids.tolist(), vertical_ids.tolist()
+
+
+def main():
+    from maze_builder import read_layout_file
+    args = parser.parse_args()
+    if args.virtual:
+        set_wall_inventory(WallInventory.from_file(VIRTUAL_WALL_INVENTORY_PATH))
+    rows_with_horizontal_walls, rows_with_vertical_walls = allocate_layout(*read_layout_file(args.layout))
+
+    horizontal_kinds, vertical_kinds = get_slot_kinds(len(rows_with_vertical_walls), len(rows_with_horizontal_walls[0]))
+    ids = np.concatenate([np.ravel(rows_with_horizontal_walls), np.ravel(rows_with_vertical_walls)])
+    kinds = np.concatenate([horizontal_kinds.ravel(), vertical_kinds.ravel()])
+    print(f"{count_useful_tags(ids[ids != -1], kinds[ids != -1])} tags look into the maze.")
+    output = args.output or os.path.splitext(args.layout)[0] + "_allocated.json"
+    with open(output, 'w') as f:
+        json.dump({"horizontal_walls": rows_with_horizontal_walls, "vertical_walls": rows_with_vertical_walls}, f)
+    print(f"Layout was saved to {output}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import os
+import json
+import numpy as np
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+DEFAULT_WALL_INVENTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "do_not_touch",
+                                           "wall_inventory.json")
+VIRTUAL_WALL_INVENTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "do_not_touch",
+                                           "wall_inventory_virtual.json")
+
+TagIds = Tuple[int, int, Optional[int], Optional[int]]
+
+
+class WallRule(object):
+    """Walls that follow the regular plate convention: the smallest IDs are the multiples of 4 from first to last (no
+    last means unlimited), the small tag on the same side has ID +1 and on double sided walls the tags on the back have
+    the IDs +2 and +3."""
+
+    def __init__(self, first: int, last: Optional[int], double_sided: bool):
+        self.first = first
+        self.last = last
+        self.double_sided = double_sided
+
+    def contains(self, smallest_id: int) -> bool:
+        return smallest_id >= self.first and (self.last is None or smallest_id <= self.last) and \
+            (smallest_id - self.first) % 4 == 0
+
+    def get_tag_ids(self, smallest_id: int) -> TagIds:
+        if self.double_sided:
+            return smallest_id, smallest_id + 1, smallest_id + 2, smallest_id + 3
+        return smallest_id, smallest_id + 1, None, None
+
+    def get_smallest_ids(self) -> List[int]:
+        assert self.last is not None, "The walls of a rule without last ID can not be listed"
+        return list(range(self.first, self.last + 1, 4))
+
+
+class WallInventory(object):
+    """Index of the walls that can be used in a maze. Maps the smallest tag ID on a wall to all four tag IDs on the wall.
+    Irregular walls are given explicitly, all others are derived by rules. The inventory is validated (and its arrays
+    for get_tag_ids_array are prepared) once when it is created, lookups afterwards are O(1)."""
+
+    def __init__(self, walls: Dict[int, TagIds], rules: List[WallRule]):
+        self.walls = walls
+        self.rules = rules
+        self.validate()
+        self.prepare_arrays()
+
+    @classmethod
+    def from_file(cls, path: str):
+        """Loads an inventory from a json data file (see do_not_touch/wall_inventory.json)"""
+        assert os.path.isfile(path), f"Given path {path} does not exist"
+        with open(path) as f:
+            data = json.load(f)
+        walls = {int(key): tuple(val) for key, val in data["walls"].items()}
+        rules = [WallRule(rule["first"], rule["last"], rule["double_sided"]) for rule in data["rules"]]
+        return cls(walls, rules)
+
+    def validate(self):
+        used_ids = []
+        for key, val in self.walls.items():
+            assert len(val) == 4, "Length of dict entry must be 4."
+            assert key == val[0], "First entry in the dictionary values must be the key"
+            for v in val[1:]:
+                if v is not None:
+                    assert v > val[0], "Smallest ID must be first entry in dictionary values"
+            assert self.get_rule(key) is None, f"Wall {key} is given explicitly and by a rule"
+            used_ids += [v for v in val if v is not None]
+        for rule in self.rules:
+            assert rule.first % 4 == 0, "Smallest IDs of rules must be multiples of 4"
+            assert rule.last is None or rule.last >= rule.first, "Last ID of a rule must not be smaller than first ID"
+            for other_rule in self.rules:
+                if other_rule is rule:
+                    continue
+                assert rule.last is not None and rule.last + 3 < other_rule.first or \
+                    other_rule.last is not None and other_rule.last + 3 < rule.first, "Rules must not overlap"
+        for v in used_ids:
+            assert self.get_rule(v - v % 4) is None, f"Tag ID {v} is on an explicitly given wall and on a rule's wall"
+        assert len(used_ids) == len(set(used_ids)), "Each tag ID must only be on one wall"
+
+    def prepare_arrays(self):
+        """Prepares the sorted arrays of the explicit walls and the rules once for get_tag_ids_array"""
+        self._keys = np.array(sorted(self.walls), dtype=np.int64)
+        self._table = np.array([[-1 if v is None else v for v in self.walls[key]] for key in self._keys],
+                               dtype=np.int64).reshape(-1, 4)
+        # rules do not overlap, so every ID can only belong to the rule with the largest first ID below it
+        rules = sorted(self.rules, key=lambda rule: rule.first)
+        self._firsts = np.array([rule.first for rule in rules], dtype=np.int64)
+        self._lasts = np.array([np.iinfo(np.int64).max if rule.last is None else rule.last for rule in rules],
+                               dtype=np.int64)
+        self._double_sided = np.array([rule.double_sided for rule in rules], dtype=bool)
+
+    def get_rule(self, smallest_id: int) -> Optional[WallRule]:
+        for rule in self.rules:
+            if rule.contains(smallest_id):
+                return rule
+        return None
+
+    def contains(self, smallest_id: int) -> bool:
+        return smallest_id in self.walls or self.get_rule(smallest_id) is not None
+
+    def get_tag_ids(self, smallest_id: int) -> TagIds:
+        """Returns the tag IDs on the wall with the given smallest ID: big and small tag on the front, big and small tag
+        on the back (None if there is no tag on the back)"""
+        if smallest_id in self.walls:
+            return self.walls[smallest_id]
+        rule = self.get_rule(smallest_id)
+        assert rule is not None, f"There is said to be an ID {smallest_id} that does not exist in the database. " \
+                                 f"Either its not defined there, or the given ID is wrong."
+        return rule.get_tag_ids(smallest_id)
+
+    def get_smallest_ids(self, double_sided: bool, max_count: int) -> List[int]:
+        """Returns the smallest IDs of (at most max_count) double sided or single sided walls in ascending order"""
+        smallest_ids = [key for key, val in self.walls.items() if (val[2] is not None) == double_sided]
+        for rule in self.rules:
+            if rule.double_sided != double_sided:
+                continue
+            last = rule.first + 4 * (max_count - 1)
+            if rule.last is not None:
+                last = min(last, rule.last)
+            smallest_ids += list(range(rule.first, last + 1, 4))
+        return sorted(smallest_ids)[:max_count]
+
+    def get_tag_ids_array(self, smallest_ids: np.ndarray) -> np.ndarray:
+        """Vectorized version of get_tag_ids for many walls at once. Returns an (n, 4) array with the tag IDs of the
+        walls with the given smallest IDs, -1 where there is no tag on the back. The tag IDs are int32 like in the tag
+        store."""
+        smallest_ids = np.asarray(smallest_ids, dtype=np.int64)
+        tag_ids = np.full((len(smallest_ids), 4), -1, dtype=np.int32)
+        found = np.zeros(len(smallest_ids), dtype=bool)
+        if self.walls:
+            keys = self._keys
+            table = self._table
+            positions = np.minimum(np.searchsorted(keys, smallest_ids), len(keys) - 1)
+            explicit = keys[positions] == smallest_ids
+            tag_ids[explicit] = table[positions[explicit]]
+            found |= explicit
+        if self.rules:
+            firsts = self._firsts
+            lasts = self._lasts
+            double_sided = self._double_sided
+            rule_indices = np.maximum(np.searchsorted(firsts, smallest_ids, side='right') - 1, 0)
+            in_rule = ~found & (smallest_ids >= firsts[rule_indices]) & (smallest_ids <= lasts[rule_indices]) & \
+                ((smallest_ids - firsts[rule_indices]) % 4 == 0)
+            # the tag IDs of a rule follow the smallest ID, the back only on double sided walls (one pass over the
+            # (n, 4) array instead of a masked assignment per column)
+            in_rule_back = in_rule & double_sided[rule_indices]
+            np.add(smallest_ids[:, np.newaxis], np.arange(4), out=tag_ids,
+                   where=np.stack([in_rule, in_rule, in_rule_back, in_rule_back], axis=1))
+            found |= in_rule
+        if not found.all():
+            smallest_id = int(smallest_ids[~found][0])
+            assert 1 == 0, f"There is said to be an ID {smallest_id} that does not exist in the database. " \
+                           f"Either its not defined there, or the given ID is wrong."
+        return tag_ids
+
+
+_wall_inventory = WallInventory.from_file(DEFAULT_WALL_INVENTORY_PATH)
+
+
+def get_wall_inventory() -> WallInventory:
+    """Returns the wall inventory used by Wall and Maze (by default the physical walls of wall_inventory.json)"""
+    return _wall_inventory
+
+
+def set_wall_inventory(wall_inventory: WallInventory):
+    """Replaces the wall inventory used by Wall and Maze, e.g. by the virtual inventory for simulated mazes:
+    set_wall_inventory(WallInventory.from_file(VIRTUAL_WALL_INVENTORY_PATH))"""
+    global _wall_inventory
+    _wall_inventory = wall_inventory